@@ -0,0 +1,103 @@
+"""取消操作的延迟：在重置执行过程中的随机时刻取消，统计从取消到perform_reset返回的耗时
+
+模拟confpro每条命令执行latency秒，取消时刻均匀分布在命令执行、命令间等待和批处理脚本中的sleep上。
+不支持中断时延迟接近剩余的命令执行时间，支持时应只有毫秒级。
+
+用法: python benchmarks/bench_cancel.py [--trials 20] [--latency 1.0] [--modes per_command,batch,session]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from haps_engine import HapsEngine, pad_display  # noqa: E402
+from haps_history import percentile  # noqa: E402
+from bench_engine import write_config  # noqa: E402
+from mock_confpro_server import MockConfpro, MockConfproServer  # noqa: E402
+
+
+def run_mode(mode, args, port, workdir, rng):
+    """在一种执行方式下重复 启动重置 -> 随机等待 -> 取消，返回统计结果"""
+    config_file = os.path.join(workdir, f'bench_{mode}.ini')
+    write_config(config_file, port, args.steps, mode, os.path.join(workdir, 'project.conf'))
+    engine = HapsEngine(config_file, on_log=lambda message: None)
+    engine.config['Timing']['command_delay'] = str(args.delay)
+    # 取消的操作不写入操作历史，这里不需要数据库
+    engine.config['History'] = {'enabled': '0'}
+    if mode == 'session':
+        engine.config['Session'] = {'done_command': 'puts "{marker}"'}
+
+    # 预热：建立连接（session方式同时启动confpro会话）
+    engine.perform_reset('bench')
+    expected = args.steps * args.latency + (args.steps - 1) * args.delay
+    latencies = []
+    not_cancelled = 0
+    try:
+        for _ in range(args.trials):
+            result = {}
+            thread = threading.Thread(target=lambda: result.update(success=engine.perform_reset('bench')))
+            thread.start()
+            time.sleep(rng.uniform(0.1, expected * 0.9))
+            cancel_start = time.perf_counter()
+            engine.cancel_operations()
+            thread.join()
+            latencies.append(time.perf_counter() - cancel_start)
+            not_cancelled += bool(result.get('success'))
+            # 已取消的命令在模拟主机上仍在运行，等待其结束后再开始下一次
+            time.sleep(args.latency)
+    finally:
+        engine.close()
+    return {
+        'mode': mode,
+        'trials': args.trials,
+        'operation_seconds': expected,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'not_cancelled': not_cancelled,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量取消操作的延迟")
+    parser.add_argument('--trials', type=int, default=20, help="每种执行方式的取消次数")
+    parser.add_argument('--steps', type=int, default=3, help="每次重置的confpro命令数")
+    parser.add_argument('--latency', type=float, default=1.0, help="模拟confpro每条命令的执行时间(秒)")
+    parser.add_argument('--delay', type=int, default=1, help="命令间等待时间(秒)")
+    parser.add_argument('--modes', default='per_command,batch,session', help="逗号分隔的执行方式")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', metavar='FILE', help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    server = MockConfproServer(MockConfpro(args.latency, 0.0, 5))
+    port = server.start()
+
+    print(f"每次重置 {args.steps} 条命令, 每条 {args.latency:.1f} 秒, 命令间等待 {args.delay} 秒, "
+          f"每种方式取消 {args.trials} 次")
+    headers = [('执行方式', 14), ('操作耗时(秒)', 14), ('p50(ms)', 10), ('p99(ms)', 10), ('最长(ms)', 10),
+               ('未取消', 8)]
+    print("".join(pad_display(text, width) for text, width in headers))
+    results = []
+    with tempfile.TemporaryDirectory(prefix='haps_bench_') as workdir:
+        for mode in [mode.strip() for mode in args.modes.split(',') if mode.strip()]:
+            result = run_mode(mode, args, port, workdir, rng)
+            results.append(result)
+            print(f"{mode:<14}{result['operation_seconds']:<14.1f}{result['p50_ms']:<10.1f}"
+                  f"{result['p99_ms']:<10.1f}{result['max_ms']:<10.1f}{result['not_cancelled']:<8}")
+    server.close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'parameters': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""端到端基准测试：通过HapsEngine对模拟confpro主机执行重置/加载操作
+
+在本机启动 mock_confpro_server，生成临时配置文件，按每种执行方式(per_command/batch/session)
+重复执行 perform_reset 或 perform_load，统计:
+- 吞吐量(操作数/秒)和单次操作耗时的p50/p99
+- 每条命令的额外开销: (操作耗时 - 模拟confpro的执行时间) / 命令数，即工具本身的开销
+
+不需要HAPS硬件和Windows主机，可在任意Linux机器上运行，用 --json 保存结果，
+用 --max-overhead 在每条命令的开销超过阈值时以退出码1结束，便于发现性能回退。
+
+用法: python benchmarks/bench_engine.py [--iterations 50] [--steps 4] [--latency 0.01] [--modes per_command,session]
+"""
+import argparse
+import configparser
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from haps_engine import HapsEngine  # noqa: E402
+from haps_history import percentile  # noqa: E402
+from mock_confpro_server import MockConfpro, MockConfproServer  # noqa: E402
+
+MODES = ('per_command', 'batch', 'session')
+
+
+def write_config(path, port, steps, mode, bitfile):
+    """生成指向模拟主机的配置文件"""
+    config = configparser.ConfigParser()
+    config['Connection'] = {
+        'confpro_path': '/opt/synopsys/bin/confpro',
+        'host': '127.0.0.1',
+        'port': str(port),
+        'user': 'bench',
+        'password': 'bench',
+        'bitfile_info_path': os.path.join(os.path.dirname(path), 'bitfile.info'),
+        'pool_idle_timeout': '300'
+    }
+    config['Timing'] = {'command_delay': '0'}
+    config['ResetCommands'] = {
+        'bench': ';'.join(f'emu:8 cfg_reset_pulse FB{i}' for i in range(1, steps + 1))
+    }
+    config['LoadCommands'] = {
+        'default': ';'.join(f'emu:8 cfg_project_configure "{{bitfile_path}}" part{i}' for i in range(1, steps + 1))
+    }
+    config['BitFilePaths'] = {'path1': bitfile, 'default_index': '1'}
+    config['Execution'] = {'mode': mode, 'remote_shell': 'sh', 'max_parallel_steps': '4'}
+    config['Readiness'] = {'command': ''}
+    with open(path, 'w') as f:
+        config.write(f)
+
+
+def run_mode(mode, args, port, confpro, workdir, bitfile):
+    """用一种执行方式重复执行操作，返回统计结果"""
+    config_file = os.path.join(workdir, f'bench_{mode}.ini')
+    write_config(config_file, port, args.steps, mode, bitfile)
+    engine = HapsEngine(config_file, on_log=lambda message: None)
+    if args.operation == 'load':
+        operation, operation_args = engine.perform_load, (bitfile,)
+    else:
+        operation, operation_args = engine.perform_reset, ('bench',)
+
+    try:
+        # 预热：建立SSH连接、启动confpro会话
+        operation(*operation_args)
+
+        durations = []
+        overheads = []
+        failures = 0
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            commands_before, _, busy_before = confpro.snapshot()
+            op_start = time.perf_counter()
+            success = operation(*operation_args)
+            duration = time.perf_counter() - op_start
+            commands_after, _, busy_after = confpro.snapshot()
+
+            durations.append(duration)
+            failures += not success
+            executed = commands_after - commands_before
+            if executed:
+                overheads.append((duration - (busy_after - busy_before)) / executed)
+        elapsed = time.perf_counter() - start
+    finally:
+        engine.close()
+
+    return {
+        'mode': mode,
+        'operations': args.iterations,
+        'failures': failures,
+        'ops_per_sec': args.iterations / elapsed,
+        'p50_ms': percentile(durations, 50) * 1000,
+        'p99_ms': percentile(durations, 99) * 1000,
+        'mean_ms': statistics.mean(durations) * 1000,
+        'overhead_per_command_ms': statistics.mean(overheads) * 1000 if overheads else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="通过HapsEngine对模拟confpro主机执行重置/加载的端到端基准测试")
+    parser.add_argument('--iterations', type=int, default=50, help="每种执行方式的操作次数")
+    parser.add_argument('--steps', type=int, default=4, help="每次操作的confpro命令数")
+    parser.add_argument('--operation', choices=['reset', 'load'], default='reset')
+    parser.add_argument('--modes', default=','.join(MODES), help="逗号分隔的执行方式")
+    parser.add_argument('--latency', type=float, default=0.01, help="模拟confpro每条命令的执行时间(秒)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="执行时间的随机波动(秒)")
+    parser.add_argument('--lines', type=int, default=20, help="每条命令输出的行数")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="命令失败的概率(0~1)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', metavar='FILE', help="把结果写入JSON文件")
+    parser.add_argument('--max-overhead', type=float, metavar='MS',
+                        help="每条命令的开销超过该值(毫秒)时以退出码1结束")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"未知的执行方式: {', '.join(unknown)}")
+
+    confpro = MockConfpro(args.latency, args.jitter, args.lines, args.failure_rate, args.seed)
+    server = MockConfproServer(confpro)
+    port = server.start()
+
+    print(f"操作: {args.operation}, 每次 {args.steps} 条命令, 每种方式 {args.iterations} 次, "
+          f"模拟执行时间 {args.latency * 1000:.1f}±{args.jitter * 1000:.1f} ms, "
+          f"输出 {args.lines} 行/命令, 失败率 {args.failure_rate:.0%}")
+    print(f"{'执行方式':<12}{'操作/秒':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'命令开销(ms)':>14}{'失败':>6}")
+    results = []
+    with tempfile.TemporaryDirectory(prefix='haps_bench_') as workdir:
+        bitfile = os.path.join(workdir, 'project.conf')
+        with open(bitfile, 'w') as f:
+            f.write('# bench\n')
+        for mode in modes:
+            result = run_mode(mode, args, port, confpro, workdir, bitfile)
+            results.append(result)
+            overhead = result['overhead_per_command_ms']
+            print(f"{mode:<12}{result['ops_per_sec']:>10.1f}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+                  f"{'-' if overhead is None else f'{overhead:.2f}':>14}{result['failures']:>6}")
+    server.close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'parameters': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+
+    if args.max_overhead is not None:
+        slow = [r['mode'] for r in results
+                if r['overhead_per_command_ms'] is not None and r['overhead_per_command_ms'] > args.max_overhead]
+        if slow:
+            print(f"每条命令的开销超过 {args.max_overhead} ms: {', '.join(slow)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
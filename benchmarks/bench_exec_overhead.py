@@ -0,0 +1,143 @@
+"""execute_remote_command 读取方式的单命令开销对比
+
+在本机启动一个paramiko SSH服务端，exec请求不启动任何进程，直接按参数输出指定行数的
+stdout/stderr，发送EOF后稍作延迟再发送退出状态（与OpenSSH的发送顺序一致）。
+分别用v7原来的读取循环（先读stdout，再读stderr，每0.5秒轮询退出状态）和 ChannelReader
+执行同样的命令，统计每条命令的耗时。
+
+用法: python benchmarks/bench_exec_overhead.py [--iterations 20] [--lines 200] [--exit-lag 0.005]
+"""
+import argparse
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import paramiko
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from haps_engine import ChannelReader  # noqa: E402
+
+
+class EmitServer(paramiko.ServerInterface):
+    """exec命令格式: emit <stdout行数> <stderr行数> <退出码>"""
+    
+    def __init__(self, exit_lag):
+        self.exit_lag = exit_lag
+    
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+    
+    def get_allowed_auths(self, username):
+        return 'password'
+    
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+    
+    def check_channel_exec_request(self, channel, command):
+        _, out_lines, err_lines, code = command.decode().split()
+        threading.Thread(
+            target=self._emit, args=(channel, int(out_lines), int(err_lines), int(code)), daemon=True
+        ).start()
+        return True
+    
+    def _emit(self, channel, out_lines, err_lines, code):
+        line = b"emu:8 cfg_project_configure progress ................................\n"
+        for i in range(max(out_lines, err_lines)):
+            if i < out_lines:
+                channel.sendall(line)
+            if i < err_lines:
+                channel.sendall_stderr(line)
+        channel.shutdown_write()
+        time.sleep(self.exit_lag)
+        channel.send_exit_status(code)
+        channel.close()
+
+
+def start_server(exit_lag):
+    host_key = paramiko.RSAKey.generate(2048)
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(5)
+    
+    def serve():
+        while True:
+            client, _ = listener.accept()
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = paramiko.Transport(client)
+            transport.add_server_key(host_key)
+            transport.start_server(server=EmitServer(exit_lag))
+    
+    threading.Thread(target=serve, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def legacy_read(channel):
+    """v7原来的读取方式"""
+    stdout = channel.makefile('r')
+    stderr = channel.makefile_stderr('r')
+    for line in stdout:
+        line.strip()
+    stderr.read().decode().strip()
+    while not channel.exit_status_ready():
+        if channel.recv_ready():
+            stdout.readline()
+        time.sleep(0.5)
+    return channel.recv_exit_status()
+
+
+def reader_read(channel):
+    """ChannelReader 读取方式"""
+    return ChannelReader(channel, lambda line: None, lambda line: None).run()
+
+
+def measure(transport, read, command, iterations):
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        channel = transport.open_session()
+        channel.exec_command(command)
+        read(channel)
+        channel.close()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比远程命令输出读取方式的单命令开销")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--lines', type=int, default=200, help="每条命令输出的stdout行数")
+    parser.add_argument('--stderr-lines', type=int, default=50, help="每条命令输出的stderr行数")
+    parser.add_argument('--exit-lag', type=float, default=0.005, help="EOF之后发送退出状态的延迟(秒)")
+    args = parser.parse_args()
+    
+    port = start_server(args.exit_lag)
+    # 与 SSHConnectionPool 一样关闭Nagle算法
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    transport = paramiko.Transport(sock)
+    transport.start_client()
+    transport.auth_password('bench', 'bench')
+    
+    command = f"emit {args.lines} {args.stderr_lines} 0"
+    # 预热
+    measure(transport, reader_read, command, 2)
+    
+    print(f"命令: {command}, 每种方式 {args.iterations} 次, 退出状态延迟 {args.exit_lag * 1000:.1f} ms")
+    print(f"{'读取方式':<14}{'平均(ms)':>10}{'p50(ms)':>10}{'最大(ms)':>10}")
+    results = {}
+    for name, read in (('legacy', legacy_read), ('ChannelReader', reader_read)):
+        durations = measure(transport, read, command, args.iterations)
+        results[name] = statistics.mean(durations)
+        print(f"{name:<14}{results[name] * 1000:>10.1f}{statistics.median(durations) * 1000:>10.1f}"
+              f"{max(durations) * 1000:>10.1f}")
+    print(f"每条命令节省: {(results['legacy'] - results['ChannelReader']) * 1000:.1f} ms")
+    
+    transport.close()
+
+
+if __name__ == '__main__':
+    main()
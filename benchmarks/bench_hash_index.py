@@ -0,0 +1,82 @@
+"""工程内容哈希的耗时：不使用索引 / 第一次建立索引(mmap+线程池) / 文件未改变时查索引 / 修改一个文件后
+
+在临时目录中生成一个project.conf和若干个随机内容的镜像文件，模拟加载前判断工程内容是否改变的过程。
+
+用法: python benchmarks/bench_hash_index.py [--files 4] [--size-mb 128] [--workers 4]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from haps_board_state import FileHashIndex, hash_project, RACY_WINDOW  # noqa: E402
+from haps_engine import pad_display  # noqa: E402
+
+
+def make_project(workdir, files, size_mb):
+    """生成project.conf和它引用的镜像文件"""
+    chunk = os.urandom(1024 * 1024)
+    images = []
+    for i in range(files):
+        path = os.path.join(workdir, f"fpga{i}.bin")
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(chunk)
+            f.write(str(i).encode('ascii'))
+        images.append(path)
+    conf = os.path.join(workdir, 'project.conf')
+    with open(conf, 'w') as f:
+        for i, path in enumerate(images):
+            f.write(f'fpga FB{i} "{os.path.basename(path)}"\n')
+    # 刚写入的文件不会进入索引，把修改时间提前
+    past = time.time() - RACY_WINDOW - 1
+    for path in images + [conf]:
+        os.utime(path, (past, past))
+    return conf, images
+
+
+def timed(func, repeat=1):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工程内容哈希在有无索引时的耗时")
+    parser.add_argument('--files', type=int, default=4, help="镜像文件数")
+    parser.add_argument('--size-mb', type=int, default=128, help="每个镜像文件的大小(MB)")
+    parser.add_argument('--workers', type=int, default=4, help="同时计算哈希的文件数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='haps_hash_') as workdir:
+        conf, images = make_project(workdir, args.files, args.size_mb)
+        index = FileHashIndex(os.path.join(workdir, 'index.json'), args.workers)
+        total_mb = args.files * args.size_mb
+
+        # 页缓存的影响：先完整读取一遍，各项都在文件已缓存的情况下比较
+        hash_project(conf)
+        results = [
+            ("不使用索引(单线程)", timed(lambda: hash_project(conf))),
+            ("建立索引(mmap+线程池)", timed(lambda: hash_project(conf, index=index))),
+            ("文件未改变", timed(lambda: hash_project(conf, index=FileHashIndex(index.path)), repeat=20)),
+        ]
+        with open(images[0], 'r+b') as f:
+            f.write(b'changed')
+        past = time.time() - RACY_WINDOW - 1
+        os.utime(images[0], (past, past))
+        results.append(("修改其中一个文件", timed(lambda: hash_project(conf, index=index))))
+
+    print(f"{args.files} 个镜像文件，共 {total_mb} MB，{args.workers} 个线程")
+    for name, seconds in results:
+        print(f"  {pad_display(name, 24)}{seconds * 1000:>10.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""断线重连：在重置执行过程中的随机时刻断开模拟主机上的所有连接，统计操作成功率和额外耗时
+
+断开后模拟主机在refuse秒内拒绝新连接，引擎应按退避间隔重新连接并从中断的步骤继续执行，
+不把中断作为失败返回给perform_reset。额外耗时 = 本次耗时 - 未断开时的耗时。
+
+用法: python benchmarks/bench_reconnect.py [--trials 10] [--latency 1.0] [--refuse 2.0] [--modes per_command,batch,session]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from haps_engine import HapsEngine, pad_display  # noqa: E402
+from haps_history import percentile  # noqa: E402
+from bench_engine import write_config  # noqa: E402
+from mock_confpro_server import MockConfpro, MockConfproServer  # noqa: E402
+
+
+def run_mode(mode, args, server, workdir, rng):
+    """在一种执行方式下重复 启动重置 -> 随机时刻断开连接 -> 等待结束，返回统计结果"""
+    config_file = os.path.join(workdir, f'bench_{mode}.ini')
+    write_config(config_file, server.port, args.steps, mode, os.path.join(workdir, 'project.conf'))
+    engine = HapsEngine(config_file, on_log=lambda message: None)
+    engine.config['Timing']['command_delay'] = '0'
+    engine.config['History'] = {'enabled': '0'}
+    engine.config['Connection']['reconnect_interval'] = str(args.reconnect_interval)
+    if mode == 'session':
+        engine.config['Session'] = {'done_command': 'puts "{marker}"'}
+
+    # 预热并测量未断开时的耗时
+    engine.perform_reset('bench')
+    start = time.perf_counter()
+    engine.perform_reset('bench')
+    baseline = time.perf_counter() - start
+
+    extra = []
+    failures = 0
+    try:
+        for _ in range(args.trials):
+            timer = threading.Timer(rng.uniform(0.1, baseline * 0.9), server.drop_connections, args=(args.refuse,))
+            start = time.perf_counter()
+            timer.start()
+            success = engine.perform_reset('bench')
+            extra.append(time.perf_counter() - start - baseline)
+            failures += not success
+            timer.join()
+            # 等待模拟主机重新接受连接、被中断的命令结束
+            time.sleep(args.refuse + args.latency)
+    finally:
+        engine.close()
+    return {
+        'mode': mode,
+        'trials': args.trials,
+        'baseline_seconds': baseline,
+        'p50_extra_seconds': percentile(extra, 50),
+        'max_extra_seconds': max(extra),
+        'failures': failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量网络中断后重新连接并继续执行的额外耗时")
+    parser.add_argument('--trials', type=int, default=10, help="每种执行方式的断开次数")
+    parser.add_argument('--steps', type=int, default=3, help="每次重置的confpro命令数")
+    parser.add_argument('--latency', type=float, default=1.0, help="模拟confpro每条命令的执行时间(秒)")
+    parser.add_argument('--refuse', type=float, default=2.0, help="断开后拒绝新连接的时间(秒)")
+    parser.add_argument('--reconnect-interval', type=float, default=0.5, help="[Connection] reconnect_interval")
+    parser.add_argument('--modes', default='per_command,batch,session', help="逗号分隔的执行方式")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', metavar='FILE', help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    server = MockConfproServer(MockConfpro(args.latency, 0.0, 5))
+    server.start()
+
+    print(f"每次重置 {args.steps} 条命令, 每条 {args.latency:.1f} 秒, 断开后 {args.refuse:.1f} 秒内拒绝连接, "
+          f"每种方式断开 {args.trials} 次")
+    headers = [('执行方式', 14), ('正常耗时(秒)', 14), ('额外p50(秒)', 13), ('额外最长(秒)', 14), ('失败', 6)]
+    print("".join(pad_display(text, width) for text, width in headers))
+    results = []
+    with tempfile.TemporaryDirectory(prefix='haps_bench_') as workdir:
+        for mode in [mode.strip() for mode in args.modes.split(',') if mode.strip()]:
+            result = run_mode(mode, args, server, workdir, rng)
+            results.append(result)
+            print(f"{mode:<14}{result['baseline_seconds']:<14.2f}{result['p50_extra_seconds']:<13.2f}"
+                  f"{result['max_extra_seconds']:<14.2f}{result['failures']:<6}")
+    server.close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'parameters': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+    return 1 if any(result['failures'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""传输方式A/B测试：paramiko连接池 / 系统ssh命令(每条命令单独连接) / ssh ControlMaster复用 / 本机执行
+
+v1~v3通过plink子进程执行命令，每条命令都要重新建立连接和认证；v4起改为paramiko并复用连接。
+本测试用同一个模拟confpro主机(mock_confpro_server)和per_command执行方式比较:
+- paramiko:       [Connection] transport = paramiko，连接池复用已认证的连接
+- openssh:        transport = openssh, control_master = 0，每条命令启动ssh进程并重新连接，
+                  与plink方式的开销相当（Linux上没有plink）
+- openssh_mux:    transport = openssh, control_master = 1，命令通过ControlMaster主连接执行
+- local:          transport = local，confpro替换为本机的sh脚本，只有启动进程的开销
+
+统计首次操作耗时（含建立连接）、之后操作的p50/p99、每条命令的额外开销和建立的SSH连接数。
+openssh方式需要OpenSSH 8.4及以上（通过SSH_ASKPASS提供密码），local方式需要sh，不满足时跳过。
+
+用法: python benchmarks/bench_transports.py [--iterations 30] [--steps 4] [--latency 0.01]
+"""
+import argparse
+import configparser
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from haps_engine import HapsEngine, pad_display  # noqa: E402
+from haps_history import percentile  # noqa: E402
+from bench_engine import write_config  # noqa: E402
+from mock_confpro_server import MockConfpro, MockConfproServer  # noqa: E402
+
+# 名称: ([Connection] transport, [OpenSSH] control_master)
+VARIANTS = {
+    'paramiko': ('paramiko', '0'),
+    'openssh': ('openssh', '0'),
+    'openssh_mux': ('openssh', '1'),
+    'local': ('local', '0'),
+}
+
+
+def write_local_confpro(path, latency, lines):
+    """生成与MockConfpro行为相同的本机confpro脚本"""
+    with open(path, 'w') as f:
+        f.write("#!/bin/sh\n"
+                f"sleep {latency}\n"
+                "i=1\n"
+                f"while [ $i -le {lines} ]; do\n"
+                f'  echo "$*: progress $i/{lines} ........................................"\n'
+                "  i=$((i + 1))\n"
+                "done\n"
+                'echo "$*: done"\n')
+    os.chmod(path, 0o755)
+
+
+def unavailable_reason(variant):
+    """当前环境不能测试该传输方式时返回原因"""
+    transport = VARIANTS[variant][0]
+    if transport == 'openssh' and shutil.which('ssh') is None:
+        return "找不到ssh命令"
+    if variant == 'openssh_mux' and os.name == 'nt':
+        return "Windows的OpenSSH不支持ControlMaster"
+    if transport == 'local' and shutil.which('sh') is None:
+        return "找不到sh"
+    return None
+
+
+def run_variant(variant, args, port, server, workdir):
+    """用一种传输方式重复执行重置操作，返回统计结果"""
+    transport, control_master = VARIANTS[variant]
+    config_file = os.path.join(workdir, f'bench_{variant}.ini')
+    write_config(config_file, port, args.steps, 'per_command', os.path.join(workdir, 'project.conf'))
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    config['Connection']['transport'] = transport
+    config['OpenSSH'] = {'control_master': control_master, 'control_persist': '60'}
+    if transport == 'local':
+        confpro_path = os.path.join(workdir, 'confpro.sh')
+        write_local_confpro(confpro_path, args.latency, args.lines)
+        config['Connection']['confpro_path'] = confpro_path
+    with open(config_file, 'w') as f:
+        config.write(f)
+
+    engine = HapsEngine(config_file, on_log=lambda message: None)
+    connections_before = server.connections
+    try:
+        # 首次操作包含导入、建立连接和认证
+        cold_start = time.perf_counter()
+        failures = not engine.perform_reset('bench')
+        cold = time.perf_counter() - cold_start
+
+        durations = []
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            op_start = time.perf_counter()
+            failures += not engine.perform_reset('bench')
+            durations.append(time.perf_counter() - op_start)
+        elapsed = time.perf_counter() - start
+    finally:
+        engine.close()
+
+    # 模拟confpro每条命令固定执行latency秒，其余时间都是传输方式的开销
+    overheads = [(duration - args.steps * args.latency) / args.steps for duration in durations]
+    return {
+        'transport': variant,
+        'operations': args.iterations,
+        'failures': failures,
+        'cold_ms': cold * 1000,
+        'ops_per_sec': args.iterations / elapsed,
+        'p50_ms': percentile(durations, 50) * 1000,
+        'p99_ms': percentile(durations, 99) * 1000,
+        'overhead_per_command_ms': statistics.mean(overheads) * 1000,
+        'connections': server.connections - connections_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较各传输方式执行confpro命令的开销")
+    parser.add_argument('--iterations', type=int, default=30, help="每种传输方式的操作次数（不含首次操作）")
+    parser.add_argument('--steps', type=int, default=4, help="每次操作的confpro命令数")
+    parser.add_argument('--transports', default=','.join(VARIANTS), help="逗号分隔的传输方式")
+    parser.add_argument('--latency', type=float, default=0.01, help="模拟confpro每条命令的执行时间(秒)")
+    parser.add_argument('--lines', type=int, default=20, help="每条命令输出的行数")
+    parser.add_argument('--json', metavar='FILE', help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    variants = [variant.strip() for variant in args.transports.split(',') if variant.strip()]
+    unknown = [variant for variant in variants if variant not in VARIANTS]
+    if unknown:
+        parser.error(f"未知的传输方式: {', '.join(unknown)}")
+
+    confpro = MockConfpro(args.latency, 0.0, args.lines)
+    server = MockConfproServer(confpro)
+    port = server.start()
+
+    print(f"每次重置 {args.steps} 条命令, 每种方式 {args.iterations} 次, "
+          f"模拟执行时间 {args.latency * 1000:.1f} ms, 输出 {args.lines} 行/命令")
+    headers = [('传输方式', 14), ('首次(ms)', 10), ('操作/秒', 10), ('p50(ms)', 10), ('p99(ms)', 10),
+               ('命令开销(ms)', 14), ('连接数', 8), ('失败', 6)]
+    print("".join(pad_display(text, width) for text, width in headers))
+    results = []
+    with tempfile.TemporaryDirectory(prefix='haps_bench_') as workdir:
+        for variant in variants:
+            reason = unavailable_reason(variant)
+            if reason:
+                print(f"{variant:<14}跳过: {reason}")
+                continue
+            result = run_variant(variant, args, port, server, workdir)
+            results.append(result)
+            print(f"{variant:<14}{result['cold_ms']:<10.1f}{result['ops_per_sec']:<10.1f}"
+                  f"{result['p50_ms']:<10.1f}{result['p99_ms']:<10.1f}"
+                  f"{result['overhead_per_command_ms']:<14.2f}{result['connections']:<8}{result['failures']:<6}")
+    server.close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'parameters': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
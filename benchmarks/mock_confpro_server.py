@@ -0,0 +1,265 @@
+"""模拟HAPS主机的SSH服务端，在进程内模拟confpro，不启动任何外部进程
+
+支持HAPS控制工具的三种执行方式:
+- per_command: exec请求 `"<confpro路径>" <命令>`，模拟执行一条confpro命令后返回退出码
+- session: exec请求 `"<confpro路径>"`(不带命令)，进入交互模式，输出 `confpro> ` 提示符，
+  逐行读取命令执行，支持 `puts "<文本>"`(done_command) 和 `exit`
+- batch: remote_shell为sh时compile_batch_script生成的脚本（echo/rc=$?/exit/sleep）
+
+每条confpro命令等待 latency±jitter 秒，输出 lines 行进度信息，按 failure_rate 的概率失败
+（输出ERROR行，退出码1），stall大于0时失败的命令输出ERROR行后继续运行stall秒才退出，
+模拟先报错再长时间挂起的confpro。任何用户名和密码都可以登录。
+
+单独运行时作为常驻的模拟主机，可把图形界面或命令行的[Connection]指向它:
+    python benchmarks/mock_confpro_server.py --port 2222 --latency 0.5 --failure-rate 0.05
+"""
+import argparse
+import logging
+import random
+import shlex
+import socket
+import threading
+import time
+
+import paramiko
+
+PROMPT = "confpro> "
+
+# exec请求的回复在check_channel_exec_request返回后才由传输线程发送，
+# 命令结束得太快时先等待这么久再关闭通道，否则客户端可能在收到回复前看到通道关闭
+MIN_EXEC_TIME = 0.005
+
+
+class MockConfpro:
+    """模拟confpro命令的执行：等待、输出和随机失败"""
+
+    def __init__(self, latency=0.0, jitter=0.0, lines=10, failure_rate=0.0, seed=None, stall=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.lines = lines
+        self.failure_rate = failure_rate
+        self.stall = stall
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # 统计：已执行的confpro命令数、失败数、模拟的执行时间合计(秒)
+        self.commands = 0
+        self.failures = 0
+        self.busy_time = 0.0
+
+    def run(self, command, write):
+        """模拟执行一条命令，write(文本)输出，返回退出码"""
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.failure_rate
+            self.commands += 1
+            self.failures += failed
+            self.busy_time += delay
+        if delay:
+            time.sleep(delay)
+        for i in range(self.lines):
+            write(f"{command}: progress {i + 1}/{self.lines} ........................................\n")
+        if failed:
+            write(f"ERROR: {command} failed\n")
+            if self.stall:
+                time.sleep(self.stall)
+            return 1
+        write(f"{command}: done\n")
+        return 0
+
+    def snapshot(self):
+        with self._lock:
+            return self.commands, self.failures, self.busy_time
+
+
+class _ServerInterface(paramiko.ServerInterface):
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        limit = self.server.max_sessions
+        if limit and self.transport is not None:
+            # 与OpenSSH的MaxSessions相同，同一连接上同时打开的通道数超过限制时拒绝
+            opened = sum(1 for channel in self.transport._channels.values() if not channel.closed)
+            if opened >= limit:
+                return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.server.handle_exec,
+                         args=(channel, command.decode('utf-8'), time.monotonic()), daemon=True).start()
+        return True
+
+
+logging.getLogger('mock_confpro.transport').setLevel(logging.CRITICAL)
+
+
+class MockConfproServer:
+    """在本机端口上监听的模拟SSH服务端，start()返回端口"""
+
+    def __init__(self, confpro, host='127.0.0.1', port=0, max_sessions=0):
+        self.confpro = confpro
+        # 每个连接上同时打开的通道数上限，0表示不限制
+        self.max_sessions = max_sessions
+        self.host = host
+        self.port = port
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self._listener = None
+        self._transports = []
+        # 已接受的SSH连接数，用于比较各传输方式的连接复用
+        self.connections = 0
+
+    def start(self):
+        self._listener = socket.socket()
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((self.host, self.port))
+        self._listener.listen(50)
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self.port
+
+    def close(self):
+        self._listener.close()
+        for transport in self._transports:
+            transport.close()
+
+    def drop_connections(self, refuse_for=0.0):
+        """模拟网络中断：断开所有已建立的连接，refuse_for秒内拒绝新连接"""
+        if refuse_for > 0:
+            # 先shutdown，否则另一个线程阻塞在accept时监听仍然有效
+            try:
+                self._listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._listener.close()
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+        if refuse_for > 0:
+            threading.Timer(refuse_for, self.start).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = paramiko.Transport(client)
+            # 客户端断开时服务端会记录Socket exception，不输出到终端
+            transport.set_log_channel('mock_confpro.transport')
+            transport.add_server_key(self._host_key)
+            interface = _ServerInterface(self)
+            interface.transport = transport
+            transport.start_server(server=interface)
+            self._transports.append(transport)
+            self.connections += 1
+
+    def handle_exec(self, channel, command, requested_at):
+        def write(text):
+            channel.sendall(text.encode('utf-8'))
+
+        try:
+            if '@@HAPS_STEP' in command:
+                code = self._run_batch(command, write)
+            else:
+                args = shlex.split(command)
+                if len(args) == 1:
+                    code = self._run_session(channel, write)
+                else:
+                    code = self.confpro.run(" ".join(args[1:]), write)
+        except (OSError, EOFError, ValueError) as e:
+            if channel.closed:
+                # 客户端已中断命令
+                return
+            channel.sendall_stderr(f"mock: {e}\n".encode('utf-8'))
+            code = 255
+        remaining = MIN_EXEC_TIME - (time.monotonic() - requested_at)
+        if remaining > 0:
+            time.sleep(remaining)
+        try:
+            # 与OpenSSH服务端相同，先发送退出码再发送EOF，否则复用连接的ssh客户端可能丢失退出码
+            channel.send_exit_status(code)
+            channel.shutdown_write()
+            channel.close()
+        except (OSError, EOFError):
+            pass
+
+    def _run_session(self, channel, write):
+        """交互模式：逐行读取命令"""
+        write(PROMPT)
+        buffer = b""
+        while True:
+            data = channel.recv(4096)
+            if not data:
+                return 0
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                command = line.decode('utf-8').strip()
+                if command == 'exit':
+                    return 0
+                if command.startswith('puts '):
+                    write(shlex.split(command[5:])[0] + "\n")
+                elif command:
+                    self.confpro.run(command, write)
+                write(PROMPT)
+
+    def _run_batch(self, script, write):
+        """解释compile_batch_script(shell='sh')生成的脚本"""
+        rc = 0
+        for statement in script.split('; '):
+            statement = statement.strip()
+            if statement.startswith('echo '):
+                write(shlex.split(statement[5:].replace('$rc', str(rc)))[0] + "\n")
+            elif statement == 'rc=$?':
+                pass
+            elif statement.startswith('[ $rc -eq 0 ] || exit'):
+                if rc != 0:
+                    return rc
+            elif statement.startswith('sleep '):
+                time.sleep(float(statement[6:]))
+            else:
+                args = shlex.split(statement)
+                rc = self.confpro.run(" ".join(args[1:]), write)
+        return rc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟HAPS主机的SSH服务端")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--latency', type=float, default=0.5, help="每条confpro命令的执行时间(秒)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="执行时间的随机波动(秒)")
+    parser.add_argument('--lines', type=int, default=10, help="每条命令输出的行数")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="命令失败的概率(0~1)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--stall', type=float, default=0.0, help="失败的命令输出错误后继续挂起的时间(秒)")
+    parser.add_argument('--max-sessions', type=int, default=0, help="每个连接上同时打开的通道数上限(0为不限制)")
+    args = parser.parse_args()
+
+    confpro = MockConfpro(args.latency, args.jitter, args.lines, args.failure_rate, args.seed, args.stall)
+    server = MockConfproServer(confpro, args.host, args.port, args.max_sessions)
+    port = server.start()
+    print(f"模拟confpro主机已在 {args.host}:{port} 上监听，按Ctrl+C退出")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        commands, failures, _ = confpro.snapshot()
+        print(f"\n共执行 {commands} 条命令，失败 {failures} 条")
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
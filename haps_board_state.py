@@ -0,0 +1,184 @@
+"""板卡状态缓存：记录每台主机上最后一次成功加载的工程内容哈希
+
+哈希覆盖project.conf本身、其中引用的已存在的文件（镜像等）以及实际执行的加载命令，
+再次加载内容相同的工程且期间没有执行过重置时可以跳过加载。
+状态保存在JSON文件中，图形界面、命令行和常驻实例共用，每次读取都从文件重新加载。
+
+FileHashIndex按 (路径, 修改时间, 大小) 缓存每个文件的哈希，只重新计算有变化的文件，
+几百MB的镜像未改变时检查只需要几次stat。
+"""
+import os
+import re
+import json
+import mmap
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# project.conf中可能是文件路径的词：引号中的内容或不含空白和分隔符的连续字符
+PATH_TOKEN_PATTERN = re.compile(r'"([^"]+)"|\'([^\']+)\'|([^\s"\'{}()\[\]=,;]+)')
+
+# 修改时间距今不到这么多秒的文件不写入索引：同一时间戳内再次修改时大小可能不变，会误用旧哈希
+RACY_WINDOW = 2.0
+
+
+def referenced_files(conf_path):
+    """project.conf中引用的已存在的文件，相对路径相对于project.conf所在目录，按出现顺序去重"""
+    base_dir = os.path.dirname(os.path.abspath(conf_path))
+    with open(conf_path, encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    files = []
+    seen = {os.path.normcase(os.path.abspath(conf_path))}
+    for match in PATH_TOKEN_PATTERN.finditer(text):
+        token = next(group for group in match.groups() if group is not None).strip()
+        if not token:
+            continue
+        path = os.path.normpath(os.path.join(base_dir, os.path.expanduser(token)))
+        key = os.path.normcase(path)
+        if key in seen or not os.path.isfile(path):
+            continue
+        seen.add(key)
+        files.append(path)
+    return files
+
+
+def hash_file(path):
+    """通过mmap计算文件的SHA-256，hashlib处理大块数据时释放GIL，可在多个线程中同时计算"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+class FileHashIndex:
+    """持久化的文件哈希索引 {路径: {mtime_ns, size, hash}}，保存在JSON文件中"""
+
+    def __init__(self, path, max_workers=4):
+        self.path = path
+        self.max_workers = max(1, max_workers)
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    entries = json.load(f)
+                self._entries = entries if isinstance(entries, dict) else {}
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        # 顺便清理已删除的文件
+        self._entries = {key: entry for key, entry in self._entries.items() if os.path.exists(key)}
+        temp_file = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(temp_file, self.path)
+        except OSError:
+            # 索引只用于加速，写入失败时下次重新计算
+            pass
+
+    def hash_files(self, paths):
+        """返回 {路径: 哈希}，只重新计算修改时间或大小有变化的文件，其余使用索引中的哈希"""
+        stats = {path: os.stat(path) for path in paths}
+        with self._lock:
+            entries = self._load()
+            result = {}
+            stale = []
+            for path, st in stats.items():
+                entry = entries.get(os.path.normcase(os.path.abspath(path)))
+                if entry and entry.get('mtime_ns') == st.st_mtime_ns and entry.get('size') == st.st_size:
+                    result[path] = entry['hash']
+                else:
+                    stale.append(path)
+        if not stale:
+            return result
+
+        # 大文件占大部分时间，多个文件同时计算
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(stale)),
+                                thread_name_prefix="haps-hash") as pool:
+            hashes = dict(zip(stale, pool.map(hash_file, stale)))
+        result.update(hashes)
+
+        now = time.time()
+        with self._lock:
+            entries = self._load()
+            for path, file_hash in hashes.items():
+                st = os.stat(path)
+                # 计算期间文件被修改，或刚修改过，不写入索引
+                if st.st_mtime_ns != stats[path].st_mtime_ns or now - st.st_mtime < RACY_WINDOW:
+                    continue
+                entries[os.path.normcase(os.path.abspath(path))] = {
+                    'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'hash': file_hash}
+            self._save()
+        return result
+
+
+def hash_project(conf_path, extra='', index=None):
+    """计算工程内容哈希，extra为一并计入的文本（如加载命令），index为FileHashIndex时复用未改变文件的哈希"""
+    paths = [conf_path] + referenced_files(conf_path)
+    if index is not None:
+        file_hashes = index.hash_files(paths)
+    else:
+        file_hashes = {path: hash_file(path) for path in paths}
+    digest = hashlib.sha256()
+    digest.update(extra.encode('utf-8'))
+    for path in paths:
+        # 计入文件名，内容相同但引用关系改变时哈希也不同
+        digest.update(b'\0' + os.path.basename(path).encode('utf-8') + b'\0')
+        digest.update(file_hashes[path].encode('ascii'))
+    return digest.hexdigest()
+
+
+class BoardStateCache:
+    """按主机保存 {hash, path, loaded_at}，写入时先写临时文件再替换"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, state):
+        temp_file = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.path)
+
+    def get(self, board):
+        """主机上最后一次成功加载的记录，没有或已失效时返回None"""
+        with self._lock:
+            entry = self._read().get(board)
+        return entry if isinstance(entry, dict) and entry.get('hash') else None
+
+    def matches(self, board, content_hash):
+        entry = self.get(board)
+        return entry is not None and entry['hash'] == content_hash
+
+    def set(self, board, content_hash, project_path):
+        with self._lock:
+            state = self._read()
+            state[board] = {'hash': content_hash, 'path': project_path,
+                            'loaded_at': time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self._write(state)
+
+    def invalidate(self, board):
+        """板卡状态未知（开始加载或重置）时清除记录，返回是否有记录被清除"""
+        with self._lock:
+            state = self._read()
+            if board not in state:
+                return False
+            del state[board]
+            self._write(state)
+            return True
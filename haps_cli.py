@@ -0,0 +1,242 @@
+"""HAPS控制命令行：不启动图形界面执行重置/加载操作
+
+与图形界面共用haps_engine和同一个配置文件，适合在脚本、CI或远程终端中使用。
+
+用法示例:
+    python haps_cli.py reset haps
+    python haps_cli.py load D:/bitfiles/top.bit
+    python haps_cli.py --all-hosts reset haps
+    python haps_cli.py --host board1 --host board2 load top.bit
+    python haps_cli.py cancel
+
+已有使用同一配置文件的程序在运行(常驻实例)时，重置/加载请求转发给它执行并回传日志，
+不需要重新导入paramiko和建立SSH连接；没有常驻实例或指定--no-resident时在本进程中执行。
+
+退出码: 0 全部成功, 1 操作失败, 2 参数或配置错误, 130 被Ctrl+C中断
+"""
+import os
+import sys
+import json
+import time
+import secrets
+import argparse
+import threading
+
+from haps_resident import forward_request
+
+# 与haps_engine.DEFAULT_CONFIG_FILE相同，转发请求时不需要导入引擎
+DEFAULT_CONFIG_FILE = "haps_config.ini"
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def build_parser():
+    """命令行参数定义"""
+    parser = argparse.ArgumentParser(prog='haps-control', description="HAPS重置/加载命令行工具")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_FILE,
+                        help=f"配置文件路径 (默认: {DEFAULT_CONFIG_FILE})")
+    targets = parser.add_mutually_exclusive_group()
+    targets.add_argument('--host', action='append', dest='hosts', metavar='NAME',
+                         help="在[Hosts]中的指定主机上执行，可重复指定")
+    targets.add_argument('--all-hosts', action='store_true',
+                         help="在[Hosts]中的所有主机上并行执行")
+    parser.add_argument('--mode', choices=['per_command', 'batch', 'session'],
+                        help="本次执行使用的命令执行方式，覆盖[Execution] mode")
+    parser.add_argument('--continue-on-error', action='store_true',
+                        help="命令失败时继续执行后续命令（默认停止）")
+    parser.add_argument('--timing-json', metavar='FILE',
+                        help="把各阶段耗时写入JSON文件")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="把执行时间线写入Chrome Trace格式的JSON文件，可在ui.perfetto.dev中查看")
+    parser.add_argument('--no-resident', action='store_true',
+                        help="不转发给常驻实例，在本进程中执行")
+    parser.add_argument('--no-wait', action='store_true',
+                        help="转发给常驻实例后立即退出，不等待执行结果")
+
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+    reset = commands.add_parser('reset', help="执行[ResetCommands]中配置的重置命令")
+    reset.add_argument('reset_type', help="重置类型，即[ResetCommands]中的键名，如 haps、sys")
+    load = commands.add_parser('load', help="加载BitFile")
+    load.add_argument('bitfile_path', help="BitFile路径，文件不存在时使用[BitFilePaths]中的默认路径")
+    load.add_argument('--force', action='store_true',
+                      help="板卡上已是内容相同的工程时也重新加载")
+    commands.add_parser('cancel', help="取消常驻实例中正在执行的所有操作")
+    commands.add_parser('hosts', help="列出[Hosts]中的主机")
+    stats = commands.add_parser('stats', help="按操作和命令列出操作历史中各主机的耗时统计")
+    stats.add_argument('--days', type=int, default=30, help="统计最近的天数 (默认: 30)")
+    return parser
+
+
+class ConsoleOutput:
+    """把引擎的日志带时间戳输出到终端，多个线程同时输出时不交错"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def log(self, message):
+        timestamp = time.strftime("%H:%M:%S")
+        with self.lock:
+            self.stream.write(f"[{timestamp}] {message}\n")
+            self.stream.flush()
+
+
+def write_timings(args, timings, output):
+    """指定了--timing-json/--trace时写入各阶段耗时和时间线"""
+    exports = []
+    if args.timing_json:
+        exports.append((args.timing_json, timings, "各阶段耗时"))
+    if args.trace:
+        from haps_engine import timings_to_chrome_trace
+        exports.append((args.trace, timings_to_chrome_trace(timings), "执行时间线"))
+    for path, data, description in exports:
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            output.log(f"写入{description}失败: {str(e)}")
+            continue
+        output.log(f"{description}已写入 {path}")
+
+
+def print_stats(engine, days):
+    """输出操作历史中按操作和命令分组的耗时统计"""
+    from haps_engine import display_width, pad_display
+
+    history = engine.get_history()
+    if history is None:
+        print("haps-control: 操作历史未启用或无法打开，请检查[History]配置", file=sys.stderr)
+        return EXIT_USAGE
+    for title, rows in (("操作", history.operation_stats(days)), ("命令", history.command_stats(days))):
+        print(f"===== {title} (最近 {days} 天) =====")
+        if not rows:
+            print("没有记录")
+            continue
+        width = max(12, max(display_width(row['name']) for row in rows) + 2)
+        print(pad_display(title, width) + pad_display("主机", 18) + "次数  失败  p50(秒)   p90(秒)   最长(秒)")
+        for row in rows:
+            print(pad_display(row['name'], width) + pad_display(row['host'], 18)
+                  + f"{row['count']:<6}{row['failures']:<6}{row['p50']:<10.2f}{row['p90']:<10.2f}{row['max']:.2f}")
+    return EXIT_OK
+
+
+def build_request(args):
+    """命令行参数转换为引擎和常驻实例使用的请求"""
+    return {
+        'command': args.command,
+        # 常驻实例的工作目录可能不同，相对路径按本进程的工作目录转换为绝对路径
+        'args': [args.reset_type if args.command == 'reset' else os.path.abspath(args.bitfile_path)],
+        'hosts': args.hosts,
+        'all_hosts': args.all_hosts,
+        'mode': args.mode,
+        'continue_on_error': args.continue_on_error,
+        'force': getattr(args, 'force', False)
+    }
+
+
+def forward(args, output):
+    """转发给常驻实例，返回退出码，没有常驻实例时返回None"""
+    request = dict(build_request(args), wait=not args.no_wait, request_id=secrets.token_hex(8))
+    try:
+        response = forward_request(args.config, request, on_log=output.log)
+    except KeyboardInterrupt:
+        # 只断开连接时常驻实例会继续执行，通知它取消本次请求中的操作
+        forward_request(args.config, {'command': 'cancel', 'request_id': request['request_id']}, ack_timeout=2.0)
+        raise
+    if response is None:
+        return None
+    if 'error' in response:
+        print(f"haps-control: {response['error']}", file=sys.stderr)
+        return EXIT_USAGE if response.get('usage') else EXIT_FAILED
+    if response.get('accepted'):
+        output.log("请求已交给常驻实例执行")
+        return EXIT_OK
+    write_timings(args, response.get('timings', []), output)
+    return EXIT_OK if response.get('success') else EXIT_FAILED
+
+
+def run_local(args, output):
+    """在本进程中执行，返回退出码"""
+    from haps_engine import HapsEngine
+
+    # 状态信息同时会写入日志，这里不需要单独输出
+    engine = HapsEngine(args.config, on_log=output.log)
+    try:
+        if args.command == 'hosts':
+            for target in engine.get_host_inventory():
+                print(f"{target.name}\t{target.user}@{target.host}:{target.port}")
+            return EXIT_OK
+        if args.command == 'stats':
+            return print_stats(engine, args.days)
+
+        timings = []
+        result = {}
+
+        def execute():
+            try:
+                result['success'] = engine.run_request(build_request(args), timings=timings)
+            except Exception as e:
+                result['error'] = e
+
+        # 在工作线程中执行，主线程收到Ctrl+C时取消所有主机上的操作，而不是等待它们执行完
+        worker = threading.Thread(target=execute, name="haps-request", daemon=True)
+        worker.start()
+        try:
+            while worker.is_alive():
+                worker.join(0.2)
+        except KeyboardInterrupt:
+            engine.cancel_operations("已按Ctrl+C中断")
+            worker.join()
+            raise
+        error = result.get('error')
+        if isinstance(error, ValueError):
+            print(f"haps-control: {str(error)}", file=sys.stderr)
+            return EXIT_USAGE
+        if error is not None:
+            raise error
+        write_timings(args, timings, output)
+        return EXIT_OK if result['success'] else EXIT_FAILED
+    finally:
+        engine.close()
+
+
+def cancel(args):
+    """让常驻实例取消正在执行的操作，返回退出码"""
+    response = forward_request(args.config, {'command': 'cancel'})
+    if response is None:
+        print("haps-control: 没有正在运行的常驻实例", file=sys.stderr)
+        return EXIT_FAILED
+    if 'error' in response:
+        print(f"haps-control: {response['error']}", file=sys.stderr)
+        return EXIT_FAILED
+    print(f"已取消 {response.get('cancelled', 0)} 个正在执行的操作")
+    return EXIT_OK
+
+
+def run(args):
+    """执行命令行指定的操作，返回退出码"""
+    if args.command == 'cancel':
+        return cancel(args)
+    output = ConsoleOutput()
+    if args.command not in ('hosts', 'stats') and not args.no_resident:
+        exit_code = forward(args, output)
+        if exit_code is not None:
+            return exit_code
+    return run_local(args, output)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return run(args)
+    except KeyboardInterrupt:
+        print("haps-control: 已中断", file=sys.stderr)
+        return EXIT_INTERRUPTED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
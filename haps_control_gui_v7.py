@@ -1,38 +1,218 @@
+import time
+# --profile-startup 从模块开始导入时计时
+STARTUP_BEGIN = time.perf_counter()
 import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext, messagebox
 import os
-import time
-import configparser
-from pathlib import Path
-import paramiko  # 需要安装: pip install paramiko
-from paramiko.ssh_exception import SSHException, AuthenticationException, NoValidConnectionsError
+import sys
+import logging
+import logging.handlers
+import collections
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from haps_engine import HapsEngine, DEFAULT_CONFIG_FILE, DEFAULT_TRANSIENT_PATTERN
+from haps_resident import ResidentServer, forward_request
+
+
+class StartupProfiler:
+    """--profile-startup时记录启动各阶段距离STARTUP_BEGIN的耗时"""
+    
+    def __init__(self, begin):
+        self.begin = begin
+        self.marks = []
+    
+    def mark(self, name):
+        """记录一个阶段的完成时间，可在任意线程调用"""
+        self.marks.append((name, time.perf_counter()))
+    
+    def report(self):
+        lines = ["启动耗时 (不含exe自解压):"]
+        previous = self.begin
+        for name, at in list(self.marks):
+            lines.append(f"  {name}: {(at - self.begin) * 1000:.0f} ms (+{(at - previous) * 1000:.0f} ms)")
+            previous = at
+        return "\n".join(lines)
+
+
+class OperationExecutor:
+    """在后台工作线程中执行操作，通过线程安全的事件队列把日志和结果交给界面线程"""
+    
+    def __init__(self, max_workers=4):
+        self.events = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="haps-op")
+        self._lock = threading.Lock()
+        self._active = 0
+        self._shutdown = False
+    
+    @property
+    def active_count(self):
+        """正在执行或排队中的操作数量"""
+        with self._lock:
+            return self._active
+    
+    @property
+    def is_shutdown(self):
+        return self._shutdown
+    
+    def submit(self, name, func, *args, **kwargs):
+        """提交一个操作到后台执行，开始和结束时分别投递started/finished事件"""
+        with self._lock:
+            self._active += 1
+        
+        def run():
+            self.post('started', name)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.post('finished', name, None, e)
+            else:
+                self.post('finished', name, result, None)
+            finally:
+                with self._lock:
+                    self._active -= 1
+        
+        return self._pool.submit(run)
+    
+    def post(self, kind, *payload):
+        """从任意线程投递事件"""
+        self.events.put((kind, payload))
+    
+    def drain(self, max_events=500):
+        """非阻塞地取出已到达的事件，供界面线程定时调用"""
+        for _ in range(max_events):
+            try:
+                yield self.events.get_nowait()
+            except queue.Empty:
+                return
+    
+    def shutdown(self):
+        """停止接收新操作，取消尚未开始的操作"""
+        self._shutdown = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class LogSink:
+    """日志缓冲区：任意线程无锁追加记录，界面线程按固定帧率批量取出写入控件
+    
+    deque的append/popleft在CPython中是原子操作，生产者之间、生产者与界面线程之间都不需要加锁。
+    待显示的记录超过max_pending时按overflow策略丢弃：drop_oldest丢弃最早的记录，
+    drop_newest丢弃新到达的记录，丢弃的行数会在下次刷新时提示。
+    """
+    
+    def __init__(self, max_pending=20000, overflow='drop_oldest'):
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self._records = collections.deque()
+        # 丢弃计数只用于提示，多线程下允许少量误差
+        self._dropped = 0
+    
+    def push(self, record):
+        """追加一条记录，可在任意线程调用"""
+        if len(self._records) >= self.max_pending:
+            self._dropped += 1
+            if self.overflow == 'drop_newest':
+                return
+            try:
+                self._records.popleft()
+            except IndexError:
+                pass
+        self._records.append(record)
+    
+    def take(self, max_records):
+        """取出最多max_records条记录，返回 (记录列表, 上次取出后丢弃的行数)"""
+        records = []
+        for _ in range(max_records):
+            try:
+                records.append(self._records.popleft())
+            except IndexError:
+                break
+        dropped, self._dropped = self._dropped, 0
+        return records, dropped
+
+
+class LogFilePager:
+    """从滚动日志文件的末尾向前分页读取历史日志
+    
+    RotatingFileHandler 滚动后 <文件>.1 是最近的备份，编号越大越早。
+    创建时记录当时存在的文件，翻页过程中发生滚动不会重新定位。
+    """
+    
+    def __init__(self, path, backup_count, page_lines=1000):
+        self.page_lines = page_lines
+        candidates = [path] + [f"{path}.{i}" for i in range(1, backup_count + 1)]
+        self.files = [f for f in candidates if os.path.exists(f)]
+        self._file_index = 0
+        # 当前文件中尚未读取部分的结束位置，None表示文件末尾
+        self._offset = None
+    
+    def previous_page(self):
+        """返回更早的一页日志行（按时间顺序），没有更多内容时返回空列表"""
+        lines = []
+        while len(lines) < self.page_lines and self._file_index < len(self.files):
+            chunk = self._read_backward(self.files[self._file_index], self.page_lines - len(lines))
+            if chunk is None:
+                # 当前文件已读完，继续读取更早的备份文件
+                self._file_index += 1
+                self._offset = None
+                continue
+            lines = chunk + lines
+        return lines
+    
+    def _read_backward(self, path, count):
+        """从当前位置向前读取最多count行，文件已读完时返回None"""
+        try:
+            with open(path, 'rb') as f:
+                end = f.seek(0, os.SEEK_END) if self._offset is None else self._offset
+                if end <= 0:
+                    return None
+                start = end
+                data = b""
+                # 按块向前读取，直到包含足够的换行或到达文件开头
+                while start > 0 and data.count(b"\n") <= count:
+                    start = max(0, start - 65536)
+                    f.seek(start)
+                    data = f.read(end - start)
+        except OSError:
+            return None
+        
+        trailing_newline = data.endswith(b"\n")
+        lines = (data[:-1] if trailing_newline else data).split(b"\n")
+        if start > 0:
+            # 第一行可能不完整，留给下一页
+            lines = lines[1:]
+        keep = lines[-count:]
+        self._offset = end - len(b"\n".join(keep)) - (1 if trailing_newline else 0)
+        return [line.decode('utf-8', errors='replace') for line in keep]
+
 
 class HAPSControlGUI:
-    def __init__(self, root):
+    def __init__(self, root, profiler=None):
         self.root = root
+        self.profiler = profiler
         self.root.title("HAPS控制工具")
         self.root.geometry("900x700")  # 增大窗口宽度
         self.root.minsize(800, 600)  # 设置最小尺寸
         self.root.resizable(True, True)
         
         # 配置文件路径
-        self.config_file = "haps_config.ini"
-        
-        # 初始化配置变量
-        self.config = None
+        self.config_file = DEFAULT_CONFIG_FILE
         
         # 预设命令选项
         self.preset_reset_commands = {
             'haps': [
                 'emu:8 cfg_reset_pulse FB1_A;emu:8 cfg_reset_pulse FB1_D;emu:8 cfg_reset_pulse FB1_B;emu:8 cfg_reset_pulse FB1_C',
+                'emu:8 cfg_reset_pulse FB1_A|emu:8 cfg_reset_pulse FB1_D|emu:8 cfg_reset_pulse FB1_B|emu:8 cfg_reset_pulse FB1_C',
                 'emu:8 cfg_reset_pulse ALL'
             ],
             'haps_master': [
                 'emu:8 cfg_reset_pulse FB1_A;emu:8 cfg_reset_pulse FB1_D',
+                'emu:8 cfg_reset_pulse FB1_A|emu:8 cfg_reset_pulse FB1_D',
                 'emu:8 cfg_reset_pulse MASTER'
             ],
             'haps_slave': [
                 'emu:8 cfg_reset_pulse FB1_B;emu:8 cfg_reset_pulse FB1_C',
+                'emu:8 cfg_reset_pulse FB1_B|emu:8 cfg_reset_pulse FB1_C',
                 'emu:8 cfg_reset_pulse SLAVE'
             ]
         }
@@ -43,138 +223,66 @@ class HAPSControlGUI:
             'emu:8 cfg_project_clean;emu:8 cfg_project_configure "{bitfile_path}"'
         ]
         
-        # 加载或创建配置文件
-        self.config = self.load_or_create_config()
+        # 日志缓冲区，配置加载后再按[Log]配置调整
+        self.log_sink = LogSink()
+        self.file_logger = None
+        
+        # 执行引擎负责加载配置、SSH连接和命令执行，与命令行工具共用
+        self.engine = HapsEngine(
+            self.config_file,
+            on_log=self.log,
+            on_status=self.show_status,
+            on_ask_continue=self.ask_continue_on_error
+        )
+        self.config = self.engine.config
+        if self.profiler is not None:
+            self.profiler.mark("加载配置")
+        self.log_sink.max_pending = max(1, self.get_int_config_value('Log', 'max_pending', 20000))
+        self.log_sink.overflow = self.get_config_value('Log', 'overflow', 'drop_oldest')
+        self.log_flush_interval = int(1000 / max(1, self.get_int_config_value('Log', 'max_fps', 20)))
+        self.log_max_lines = max(100, self.get_int_config_value('Log', 'max_lines', 5000))
+        
+        # 完整的会话日志由后台线程写入滚动日志文件
+        self.start_log_file_writer()
+        
+        # 后台操作执行器，界面线程通过事件队列接收状态和结果
+        self.executor = OperationExecutor(
+            max_workers=self.get_int_config_value('Execution', 'max_workers', 4)
+        )
         
         # 创建界面
         self.create_widgets()
+        if self.profiler is not None:
+            self.profiler.mark("创建主界面")
         
-    def load_or_create_config(self):
-        """加载现有配置文件或创建新的默认配置文件"""
-        config = configparser.ConfigParser()
-        
-        # 如果配置文件存在，加载它
-        if os.path.exists(self.config_file):
-            config.read(self.config_file)
-            # 检查并修复可能的配置缺失
-            self.fix_config(config)
-            return config
-        
-        # 创建默认配置
-        config['Connection'] = {
-            'confpro_path': r"C:\Synopsys\protocomp-rtQ-2020.03\bin64\mbin\confpro.exe",
-            'host': "10.126.8.230",
-            'port': "22",  # SSH默认端口
-            'user': "dell",
-            'password': "Bsp@123",
-            'bitfile_info_path': r"D:\tools\bitfile.info"
-        }
-        
-        # 配置重置命令，使用分号分隔多条命令
-        config['ResetCommands'] = {
-            # reset master的两条指令
-            'haps_master': 'emu:8 cfg_reset_pulse FB1_A;emu:8 cfg_reset_pulse FB1_D',
-            # reset slave的两条指令
-            'haps_slave': 'emu:8 cfg_reset_pulse FB1_B;emu:8 cfg_reset_pulse FB1_C',
-            # reset haps的四条指令
-            'haps': 'emu:8 cfg_reset_pulse FB1_A;emu:8 cfg_reset_pulse FB1_D;emu:8 cfg_reset_pulse FB1_B;emu:8 cfg_reset_pulse FB1_C'
-        }
-        
-        # 配置加载命令，支持多条命令，用分号分隔
-        config['LoadCommands'] = {
-            'default': 'emu:8 cfg_project_configure "{bitfile_path}"'
-        }
-        
-        # 命令间的等待时间(秒)
-        config['Timing'] = {
-            'command_delay': '2'
-        }
+        # 窗口显示后在后台导入paramiko，第一次操作不再等待导入
+        self.root.after(200, self.start_preload)
+        self.schedule_warm_hash_index(delay=1000)
         
-        config['BitFilePaths'] = {
-            'path1': r"D:\zxl\mc20l\mc20l_fpga_tag0121_va_rmii_2f_0212\prj\designs\project.conf",
-            'path2': r"D:\zxl\mc20l\mc20l_fpga_tag0121_va_rmii_2f_0219\prj\designs\project.conf",
-            'path3': r"D:\zxl\mc20l\rtl0p8\mc20l_fpga_tag0301_va_2f_rmii_0307\prj\designs\project.conf",
-            'default_index': '1'
-        }
+        # 定时处理后台事件，按配置的帧率批量刷新日志
+        self.root.after(50, self.process_events)
+        self.root.after(50, self.flush_log)
         
-        # 保存默认配置
-        with open(self.config_file, 'w') as f:
-            config.write(f)
-            
-        return config
-    
-    def fix_config(self, config):
-        """检查并修复配置文件中可能缺失的部分或无效值"""
-        # 检查Timing部分和command_delay配置
-        if 'Timing' not in config:
-            config['Timing'] = {}
-        
-        timing_updated = False
-        if 'command_delay' not in config['Timing'] or not config['Timing']['command_delay']:
-            config['Timing']['command_delay'] = '2'
-            timing_updated = True
-        
-        # 确保重置命令部分存在
-        if 'ResetCommands' not in config:
-            config['ResetCommands'] = {}
-            
-        # 设置默认重置命令（如果不存在）
-        default_commands = {
-            'haps_master': 'emu:8 cfg_reset_pulse FB1_A;emu:8 cfg_reset_pulse FB1_D',
-            'haps_slave': 'emu:8 cfg_reset_pulse FB1_B;emu:8 cfg_reset_pulse FB1_C',
-            'haps': 'emu:8 cfg_reset_pulse FB1_A;emu:8 cfg_reset_pulse FB1_D;emu:8 cfg_reset_pulse FB1_B;emu:8 cfg_reset_pulse FB1_C'
-        }
+        # 定期清理空闲连接，关闭窗口时释放所有连接
+        self.root.after(30000, self.sweep_ssh_pool)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
-        commands_updated = False
-        for cmd_name, cmd_value in default_commands.items():
-            if cmd_name not in config['ResetCommands'] or not config['ResetCommands'][cmd_name]:
-                config['ResetCommands'][cmd_name] = cmd_value
-                commands_updated = True
+        # 常驻实例：接收之后启动的程序和命令行转发的请求
+        self.resident = None
+        if self.get_config_value('Resident', 'enabled', '1').strip() == '1':
+            self.start_resident_server()
         
-        # 确保加载命令部分存在
-        if 'LoadCommands' not in config:
-            config['LoadCommands'] = {}
-            commands_updated = True
-            
-        # 设置默认加载命令（如果不存在）
-        if 'default' not in config['LoadCommands'] or not config['LoadCommands']['default']:
-            config['LoadCommands']['default'] = 'emu:8 cfg_project_configure "{bitfile_path}"'
-            commands_updated = True
-        
-        # 只有在配置确实有更新且self.config已初始化时才保存
-        if (timing_updated or commands_updated) and self.config is not None:
-            # 将修复后的配置写回配置对象
-            self.config = config
-            self.save_config()
-            self.log("配置修复：更新了缺失或无效的配置项")
-        
-        return config
+    def get_config_value(self, section, key, default=None):
+        """获取配置值，带默认值"""
+        return self.engine.get_config_value(section, key, default)
     
     def get_int_config_value(self, section, key, default=0):
         """安全地获取整数类型的配置值"""
-        try:
-            value_str = self.get_config_value(section, key, str(default))
-            return int(value_str.strip())
-        except ValueError:
-            self.log(f"警告：配置项 {section}.{key} 的值 '{value_str}' 不是有效的整数，使用默认值 {default}")
-            return default
+        return self.engine.get_int_config_value(section, key, default)
     
     def save_config(self):
         """保存配置到文件"""
-        if self.config is None:
-            self.log("警告：配置未初始化，无法保存")
-            return
-            
-        with open(self.config_file, 'w') as f:
-            self.config.write(f)
-        self.log(f"配置已保存到 {self.config_file}")
-    
-    def get_config_value(self, section, key, default=None):
-        """获取配置值，带默认值"""
-        try:
-            return self.config[section][key]
-        except:
-            return default
+        self.engine.save_config()
     
     def create_widgets(self):
         # 配置样式
@@ -192,35 +300,11 @@ class HAPSControlGUI:
         main_frame = ttk.Frame(main_notebook, padding="10")
         main_notebook.add(main_frame, text="操作")
         
-        # 配置标签页 - 使用带滚动条的框架解决显示不全问题
-        config_frame = ttk.Frame(main_notebook)
-        main_notebook.add(config_frame, text="配置")
-        
-        # 为配置界面添加侧边滚动条
-        # 创建一个画布和滚动条
-        canvas = tk.Canvas(config_frame)
-        scrollbar = ttk.Scrollbar(config_frame, orient="vertical", command=canvas.yview)
-        
-        # 创建一个可滚动的框架
-        scrollable_frame = ttk.Frame(canvas, padding="10")
-        
-        # 当框架大小改变时更新滚动区域
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(
-                scrollregion=canvas.bbox("all")
-            )
-        )
-        
-        # 在画布上放置框架
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        
-        # 配置画布的滚动命令
-        canvas.configure(yscrollcommand=scrollbar.set)
-        
-        # 布局画布和滚动条
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        # 配置标签页在第一次切换到时才创建，加快窗口首次显示
+        self.config_tab = ttk.Frame(main_notebook)
+        self.config_tab_built = False
+        main_notebook.add(self.config_tab, text="配置")
+        main_notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
         
         # ================ 主操作界面 ================
         # 标题
@@ -234,11 +318,23 @@ class HAPSControlGUI:
         reset_buttons_frame.pack(pady=10)
         
         ttk.Button(reset_buttons_frame, text="重置HAPS", 
-                  command=lambda: self.perform_reset('haps')).pack(side=tk.LEFT, padx=10)
+                  command=lambda: self.start_reset('haps')).pack(side=tk.LEFT, padx=10)
         ttk.Button(reset_buttons_frame, text="重置HAPS Master", 
-                  command=lambda: self.perform_reset('haps_master')).pack(side=tk.LEFT, padx=10)
+                  command=lambda: self.start_reset('haps_master')).pack(side=tk.LEFT, padx=10)
         ttk.Button(reset_buttons_frame, text="重置HAPS Slave", 
-                  command=lambda: self.perform_reset('haps_slave')).pack(side=tk.LEFT, padx=10)
+                  command=lambda: self.start_reset('haps_slave')).pack(side=tk.LEFT, padx=10)
+        
+        # 多主机选择框架
+        hosts_frame = ttk.LabelFrame(main_frame, text="多主机并行执行", padding="10")
+        hosts_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        self.fanout_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(hosts_frame, text="在所选主机上并行执行重置/加载（主机清单见配置文件[Hosts]）",
+                        variable=self.fanout_var).pack(anchor=tk.W)
+        self.hosts_listbox = tk.Listbox(hosts_frame, selectmode=tk.MULTIPLE, height=4, exportselection=False)
+        self.hosts_listbox.pack(fill=tk.X, pady=(5, 0))
+        for target in self.engine.get_host_inventory():
+            self.hosts_listbox.insert(tk.END, f"{target.name}  ({target.user}@{target.host}:{target.port})")
         
         # 加载配置框架
         self.load_frame = ttk.LabelFrame(main_frame, text="BitFile配置", padding="10")
@@ -254,6 +350,9 @@ class HAPSControlGUI:
         default_path = self.get_config_value('BitFilePaths', f'path{default_path_index}', '')
         
         self.bitfile_path_var = tk.StringVar(value=default_path)
+        # 路径改变后在后台预先计算工程文件的哈希，执行加载时判断内容是否改变不再等待
+        self.warm_hash_job = None
+        self.bitfile_path_var.trace_add('write', lambda *_: self.schedule_warm_hash_index())
         self.bitfile_path_entry = ttk.Entry(path_frame, textvariable=self.bitfile_path_var)
         self.bitfile_path_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
         
@@ -284,8 +383,13 @@ class HAPSControlGUI:
         ttk.Button(self.load_frame, text="保存预设路径", 
                   command=self.save_preset_paths).pack(pady=10)
         
-        # 加载按钮
-        ttk.Button(self.load_frame, text="执行加载", command=self.perform_load).pack(pady=5)
+        # 加载按钮，板卡上已是相同内容的工程时默认跳过加载
+        load_button_frame = ttk.Frame(self.load_frame)
+        load_button_frame.pack(pady=5)
+        ttk.Button(load_button_frame, text="执行加载", command=self.start_load).pack(side=tk.LEFT)
+        self.force_load_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(load_button_frame, text="强制重新加载",
+                        variable=self.force_load_var).pack(side=tk.LEFT, padx=10)
         
         # 日志区域
         log_frame = ttk.LabelFrame(main_frame, text="操作日志", padding="10")
@@ -295,10 +399,67 @@ class HAPSControlGUI:
         self.log_text.pack(fill=tk.BOTH, expand=True)
         self.log_text.config(state=tk.DISABLED)
         
+        log_buttons_frame = ttk.Frame(log_frame)
+        log_buttons_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(log_buttons_frame, text="查看历史日志", command=self.show_log_history).pack(side=tk.RIGHT)
+        ttk.Button(log_buttons_frame, text="历史耗时统计",
+                   command=self.show_history_stats).pack(side=tk.RIGHT, padx=(0, 5))
+        ttk.Button(log_buttons_frame, text="导出时间线",
+                   command=lambda: self.export_timings(chrome_trace=True)).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(log_buttons_frame, text="导出耗时统计", command=self.export_timings).pack(side=tk.RIGHT)
+        
         # 状态标签
         self.status_var = tk.StringVar(value="就绪")
         ttk.Label(main_frame, textvariable=self.status_var).pack(anchor=tk.W, pady=(5, 0))
         
+        # 根据操作历史显示运行中操作的进度和预计剩余时间
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.pack(fill=tk.X, pady=(5, 0))
+        self.progress_bar = ttk.Progressbar(progress_frame, length=200, maximum=100, mode='determinate')
+        self.progress_bar.pack(side=tk.LEFT)
+        self.progress_var = tk.StringVar(value="")
+        ttk.Button(progress_frame, text="取消操作", command=self.cancel_operations).pack(side=tk.RIGHT)
+        ttk.Label(progress_frame, textvariable=self.progress_var).pack(side=tk.LEFT, padx=10)
+        self.root.after(1000, self.update_progress)
+        
+        self.log("程序启动成功，配置已加载")
+        self.log("注意：首次使用请确保已安装paramiko库 (pip install paramiko)")
+    
+    def on_tab_changed(self, event):
+        """第一次切换到配置标签页时创建其中的控件"""
+        notebook = event.widget
+        if not self.config_tab_built and notebook.nametowidget(notebook.select()) is self.config_tab:
+            self.config_tab_built = True
+            self.create_config_tab()
+    
+    def create_config_tab(self):
+        """创建配置标签页，使用带滚动条的框架解决显示不全问题"""
+        # 为配置界面添加侧边滚动条
+        # 创建一个画布和滚动条
+        canvas = tk.Canvas(self.config_tab)
+        scrollbar = ttk.Scrollbar(self.config_tab, orient="vertical", command=canvas.yview)
+        
+        # 创建一个可滚动的框架
+        scrollable_frame = ttk.Frame(canvas, padding="10")
+        
+        # 当框架大小改变时更新滚动区域
+        scrollable_frame.bind(
+            "<Configure>",
+            lambda e: canvas.configure(
+                scrollregion=canvas.bbox("all")
+            )
+        )
+        
+        # 在画布上放置框架
+        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
+        
+        # 配置画布的滚动命令
+        canvas.configure(yscrollcommand=scrollbar.set)
+        
+        # 布局画布和滚动条
+        canvas.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
         # ================ 配置界面（使用带滚动条的框架） ================
         # 连接配置
         conn_frame = ttk.LabelFrame(scrollable_frame, text="连接配置", padding="10")
@@ -315,6 +476,26 @@ class HAPSControlGUI:
         self.create_config_entry(conn_grid_frame, "用户名:", "Connection", "user", 3)
         self.create_config_entry(conn_grid_frame, "密码:", "Connection", "password", 4, show="*")
         self.create_config_entry(conn_grid_frame, "BitFile信息路径:", "Connection", "bitfile_info_path", 5)
+        self.create_config_entry(conn_grid_frame, "连接空闲保持(秒):", "Connection", "pool_idle_timeout", 6)
+        self.create_choice_entry(conn_grid_frame, "传输方式:", "Connection", "transport", 7,
+                                 ['paramiko', 'openssh', 'local'])
+        self.create_config_entry(conn_grid_frame, "Keepalive间隔(秒，0为关闭):", "Connection", "keepalive_interval", 8,
+                                 default="15")
+        self.create_config_entry(conn_grid_frame, "断线重连次数:", "Connection", "reconnect_attempts", 9, default="4")
+        self.create_config_entry(conn_grid_frame, "首次重连间隔(秒):", "Connection", "reconnect_interval", 10,
+                                 default="1")
+        
+        # 系统ssh命令配置
+        openssh_frame = ttk.LabelFrame(scrollable_frame, text="OpenSSH配置 (传输方式为openssh时使用)", padding="10")
+        openssh_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        openssh_grid_frame = ttk.Frame(openssh_frame)
+        openssh_grid_frame.pack(fill=tk.X)
+        self.create_config_entry(openssh_grid_frame, "ssh命令路径:", "OpenSSH", "ssh_path", 0)
+        self.create_config_entry(openssh_grid_frame, "连接复用(0/1):", "OpenSSH", "control_master", 1)
+        self.create_config_entry(openssh_grid_frame, "主连接保持(秒):", "OpenSSH", "control_persist", 2)
+        self.create_config_entry(openssh_grid_frame, "连接超时(秒):", "OpenSSH", "connect_timeout", 3)
+        self.create_config_entry(openssh_grid_frame, "附加参数:", "OpenSSH", "extra_options", 4)
         
         # 时间配置
         timing_frame = ttk.LabelFrame(scrollable_frame, text="时间配置", padding="10")
@@ -323,13 +504,79 @@ class HAPSControlGUI:
         timing_grid_frame = ttk.Frame(timing_frame)
         timing_grid_frame.pack(fill=tk.X)
         self.create_config_entry(timing_grid_frame, "命令间等待时间(秒):", "Timing", "command_delay", 0)
+        self.create_config_entry(timing_grid_frame, "就绪检测命令:", "Readiness", "command", 1)
+        self.create_config_entry(timing_grid_frame, "就绪输出(正则):", "Readiness", "pattern", 2)
+        self.create_config_entry(timing_grid_frame, "就绪检测超时(秒):", "Readiness", "timeout", 3)
+        
+        # 执行配置
+        exec_frame = ttk.LabelFrame(scrollable_frame, text="执行配置", padding="10")
+        exec_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        exec_grid_frame = ttk.Frame(exec_frame)
+        exec_grid_frame.pack(fill=tk.X)
+        self.create_config_entry(exec_grid_frame, "最大并行操作数(重启生效):", "Execution", "max_workers", 0)
+        self.create_choice_entry(exec_grid_frame, "执行方式:", "Execution", "mode", 1,
+                                 ['per_command', 'batch', 'session'])
+        self.create_choice_entry(exec_grid_frame, "远程命令解释器:", "Execution", "remote_shell", 2,
+                                 ['cmd', 'sh'])
+        self.create_config_entry(exec_grid_frame, "最大并行步骤数:", "Execution", "max_parallel_steps", 3)
+        
+        # 交互式会话配置
+        session_frame = ttk.LabelFrame(scrollable_frame, text="confpro会话配置 (执行方式为session时使用)", padding="10")
+        session_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        session_grid_frame = ttk.Frame(session_frame)
+        session_grid_frame.pack(fill=tk.X)
+        self.create_config_entry(session_grid_frame, "启动参数:", "Session", "start_args", 0)
+        self.create_config_entry(session_grid_frame, "提示符(正则):", "Session", "prompt_pattern", 1)
+        self.create_config_entry(session_grid_frame, "结束标记命令:", "Session", "done_command", 2)
+        self.create_config_entry(session_grid_frame, "错误输出(正则):", "Session", "error_pattern", 3)
+        self.create_config_entry(session_grid_frame, "使用伪终端(0/1):", "Session", "use_pty", 4)
+        
+        # 操作历史配置
+        history_frame = ttk.LabelFrame(scrollable_frame, text="操作历史配置", padding="10")
+        history_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        history_grid_frame = ttk.Frame(history_frame)
+        history_grid_frame.pack(fill=tk.X)
+        self.create_config_entry(history_grid_frame, "记录操作历史(0/1):", "History", "enabled", 0)
+        self.create_config_entry(history_grid_frame, "数据库路径(空为程序目录):", "History", "path", 1)
+        self.create_config_entry(history_grid_frame, "保留天数:", "History", "retention_days", 2)
+        self.create_config_entry(history_grid_frame, "跳过未改变的加载(0/1):", "BoardCache", "enabled", 3)
+        self.create_config_entry(history_grid_frame, "同时计算哈希的文件数:", "BoardCache", "hash_workers", 4)
+        
+        # 命令超时配置，按命令匹配的规则在配置文件[Timeouts]中添加
+        timeout_frame = ttk.LabelFrame(scrollable_frame, text="命令超时配置", padding="10")
+        timeout_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        timeout_grid_frame = ttk.Frame(timeout_frame)
+        timeout_grid_frame.pack(fill=tk.X)
+        self.create_config_entry(timeout_grid_frame, "默认超时(秒，0为不限制):", "Timeouts", "default", 0)
+        self.create_config_entry(timeout_grid_frame, "超时后远程执行的命令:", "Timeouts", "remote_kill", 1)
+        self.create_config_entry(timeout_grid_frame, "远程命令超时(秒):", "Timeouts", "remote_kill_timeout", 2)
+        
+        # 失败处理配置，按重置类型单独配置时在配置文件[FailurePolicy]中添加 reset.<类型>
+        failure_frame = ttk.LabelFrame(scrollable_frame, text="失败处理配置", padding="10")
+        failure_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        failure_grid_frame = ttk.Frame(failure_frame)
+        failure_grid_frame.pack(fill=tk.X)
+        self.create_choice_entry(failure_grid_frame, "重置失败时:", "FailurePolicy", "reset", 0,
+                                 ['abort', 'continue', 'retry', 'ask'])
+        self.create_choice_entry(failure_grid_frame, "加载失败时:", "FailurePolicy", "load", 1,
+                                 ['abort', 'continue', 'retry', 'ask'])
+        self.create_config_entry(failure_grid_frame, "重试次数:", "FailurePolicy", "retries", 2, default="2")
+        self.create_config_entry(failure_grid_frame, "首次重试间隔(秒):", "FailurePolicy", "retry_interval", 3,
+                                 default="2")
+        self.create_config_entry(failure_grid_frame, "暂时性失败的输出(正则):", "FailurePolicy", "transient_pattern", 4,
+                                 default=DEFAULT_TRANSIENT_PATTERN)
         
         # 重置命令配置
         reset_cmd_frame = ttk.LabelFrame(scrollable_frame, text="重置命令配置", padding="10")
         reset_cmd_frame.pack(fill=tk.X, pady=(0, 15))
         
         # 提示信息
-        ttk.Label(reset_cmd_frame, text="提示: 多条命令用分号(;)分隔").pack(anchor=tk.W, pady=(0, 10))
+        ttk.Label(reset_cmd_frame, text="提示: 多条命令用分号(;)分隔，用竖线(|)分隔的命令会同时执行").pack(anchor=tk.W, pady=(0, 10))
         
         # 命令输入框使用grid布局
         reset_grid_frame = ttk.Frame(reset_cmd_frame)
@@ -365,16 +612,49 @@ class HAPSControlGUI:
                       "4. 命令之间会根据配置的时间间隔自动等待\n" \
                       "5. 加载命令中可用{bitfile_path}作为文件路径的占位符\n" \
                       "6. 预设路径可在主界面修改和保存\n" \
-                      "7. 程序使用paramiko库进行SSH连接"
+                      "7. 程序默认使用paramiko库进行SSH连接，传输方式可改为openssh(调用系统ssh命令)或local(在本机执行)\n" \
+                      "8. SSH连接会在命令之间复用，空闲超过保持时间后自动断开\n" \
+                      "9. 操作在后台执行，执行期间界面保持响应，可同时运行多个操作\n" \
+                      "10. 执行方式为batch时，整个命令序列在一次远程执行中完成，失败步骤之后的命令不会执行\n" \
+                      "11. 执行方式为session时，confpro只启动一次，后续命令通过同一个会话发送\n" \
+                      "12. 用竖线(|)分隔的命令互不依赖，在per_command方式下同时执行；\n" \
+                      "    [CommandOrder]中可用 1>3 形式指定第1条命令完成后才执行第3条\n" \
+                      "13. 配置了就绪检测命令时，命令之间不再固定等待，而是轮询该命令直到输出匹配或超时\n" \
+                      "    （batch方式仍使用固定等待时间）\n" \
+                      "14. 日志按[Log]中的max_fps批量刷新，输出过快时按overflow策略丢弃并提示\n" \
+                      "15. 界面只保留最近max_lines行日志，完整日志写入[Log]中配置的日志文件\n" \
+                      "16. [Hosts]中配置多台主机后，可勾选多主机并行执行，结束时输出各主机的结果汇总\n" \
+                      "17. [Resident] enabled为1时程序作为常驻实例运行，再次启动程序或运行haps_cli.py时\n" \
+                      "    请求转发给已运行的程序执行，复用已建立的SSH连接\n" \
+                      "18. 启动参数--profile-startup在日志（有控制台时同时在控制台）中输出启动各阶段的耗时\n" \
+                      "19. 每次重置/加载结束后在日志中输出连接、命令运行、等待等各阶段的耗时，\n" \
+                      "    可通过操作日志下方的导出耗时统计按钮保存为JSON；导出时间线保存为Chrome Trace格式，\n" \
+                      "    可在chrome://tracing或ui.perfetto.dev中查看各步骤的重叠和空闲时间\n" \
+                      "20. 传输方式为openssh时，连接复用为1则同一主机的命令共用一个ssh主连接(Windows不支持)；\n" \
+                      "    配置了密码时需要OpenSSH 8.4及以上，密码为空时使用密钥认证；session执行方式只支持paramiko\n" \
+                      "21. 每次重置/加载及每条命令的耗时和结果记录在haps_history.db中，执行时根据历史记录\n" \
+                      "    在状态栏下方显示进度和预计剩余时间；历史耗时统计按钮按操作和命令列出各主机的p50/p90/最长耗时\n" \
+                      "22. 加载时计算project.conf、其中引用的文件和加载命令的内容哈希，与该主机上次成功加载的相同\n" \
+                      "    且之后没有执行过重置时跳过加载；在工具之外重置或改动过板卡时请勾选强制重新加载\n" \
+                      "23. 文件的哈希按 (路径, 修改时间, 大小) 缓存在haps_hash_index.json中，只重新计算改变过的文件；\n" \
+                      "    选择BitFile路径后在后台预先计算，执行加载时通常只需要几毫秒\n" \
+                      "24. [ErrorPatterns]中的规则为 <范围>.<名称> = 正则表达式，范围为all、reset、load或命令中的词；\n" \
+                      "    命令输出匹配时立即结束该命令并视为失败，不再等待confpro退出（session执行方式使用error_pattern）\n" \
+                      "25. 进度条右侧的取消操作按钮立即关闭正在执行的命令的通道，跳过剩余的步骤和等待；\n" \
+                      "    正在建立的SSH连接最多等待连接超时时间，从取消到停止的耗时记录在日志和耗时统计中\n" \
+                      "26. 命令超过[Timeouts]中的超时时间未完成时关闭通道并记为超时（多主机结果中显示为超时）；\n" \
+                      "    可按命令添加规则，如 configure = 3600 cfg_project_configure，batch方式下按步骤分别计时；\n" \
+                      "    配置了超时后远程执行的命令（如 taskkill /F /IM confpro.exe）时用它结束挂起的confpro\n" \
+                      "27. 命令失败后按失败处理配置执行：abort停止、continue继续后续命令、retry按间隔翻倍重试、\n" \
+                      "    ask弹出对话框询问；连接中断或输出匹配暂时性失败（如许可证被占用）时在任何策略下都先重试\n" \
+                      "28. paramiko连接开启SSH和TCP keepalive，网络中断后的半开连接会被尽快发现；连接失败时按\n" \
+                      "    间隔加倍(带随机抖动)重新连接，命令执行期间连接中断时重新连接后从中断的步骤继续执行"
         ttk.Label(scrollable_frame, text=config_help, justify=tk.LEFT).pack(anchor=tk.W, pady=(0, 20))
-        
-        self.log("程序启动成功，配置已加载")
-        self.log("注意：首次使用请确保已安装paramiko库 (pip install paramiko)")
     
-    def create_config_entry(self, parent, label_text, section, key, row, show=""):
-        """创建配置项输入框，使用grid布局"""
+    def create_config_entry(self, parent, label_text, section, key, row, show="", default=""):
+        """创建配置项输入框，使用grid布局，配置文件中没有该项时显示default"""
         ttk.Label(parent, text=label_text).grid(row=row, column=0, sticky=tk.W, pady=5, padx=5)
-        var = tk.StringVar(value=self.get_config_value(section, key, ""))
+        var = tk.StringVar(value=self.get_config_value(section, key, default))
         # 存储变量引用，避免被垃圾回收
         if not hasattr(self, 'config_vars'):
             self.config_vars = {}
@@ -384,6 +664,20 @@ class HAPSControlGUI:
         entry.grid(row=row, column=1, sticky=tk.W, pady=5, padx=5)
         return var
     
+    def create_choice_entry(self, parent, label_text, section, key, row, choices):
+        """创建只能从固定选项中选择的配置项"""
+        ttk.Label(parent, text=label_text).grid(row=row, column=0, sticky=tk.W, pady=5, padx=5)
+        var = tk.StringVar(value=self.get_config_value(section, key, choices[0]))
+        combo = ttk.Combobox(parent, textvariable=var, values=choices, width=20, state='readonly')
+        combo.grid(row=row, column=1, sticky=tk.W, pady=5, padx=5)
+        
+        # 存储变量引用
+        if not hasattr(self, 'config_vars'):
+            self.config_vars = {}
+        self.config_vars[f"{section}.{key}"] = (var, section, key)
+        
+        return var
+    
     def create_command_entry_with_combobox(self, parent, label_text, section, key, row):
         """创建带下拉选择框的命令输入框"""
         ttk.Label(parent, text=label_text).grid(row=row, column=0, sticky=tk.W, pady=5, padx=5)
@@ -446,6 +740,24 @@ class HAPSControlGUI:
         self.save_config()
         messagebox.showinfo("保存成功", "配置已成功保存")
     
+    def schedule_warm_hash_index(self, delay=800):
+        """输入停止一段时间后再开始计算，避免逐字输入时反复计算"""
+        if self.warm_hash_job is not None:
+            self.root.after_cancel(self.warm_hash_job)
+        self.warm_hash_job = self.root.after(delay, self.start_warm_hash_index)
+    
+    def start_warm_hash_index(self):
+        """在后台线程中预先计算当前BitFile路径下工程文件的哈希"""
+        self.warm_hash_job = None
+        bitfile_path = self.bitfile_path_var.get().strip()
+        
+        def warm():
+            elapsed = self.engine.warm_hash_index(bitfile_path)
+            if elapsed is not None and elapsed >= 1:
+                self.log(f"已计算工程文件的内容哈希 {bitfile_path}，耗时 {elapsed:.1f} 秒")
+        
+        threading.Thread(target=warm, name="haps-warm-hash", daemon=True).start()
+    
     def browse_bitfile(self):
         filename = filedialog.askopenfilename(
             title="选择BitFile",
@@ -464,271 +776,411 @@ class HAPSControlGUI:
         messagebox.showinfo("保存成功", "预设路径已成功保存")
     
     def log(self, message):
-        """向日志区域添加消息"""
-        self.log_text.config(state=tk.NORMAL)
+        """向日志区域添加消息，可在任意线程调用，不等待界面重绘"""
         timestamp = time.strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        self.log_sink.push(f"[{timestamp}] {message}\n")
+        if self.file_logger is not None:
+            self.file_logger.info(message)
+    
+    def start_log_file_writer(self):
+        """创建后台写入的滚动日志文件，日志经队列交给写入线程，不阻塞调用方"""
+        self.file_logger = None
+        self.log_listener = None
+        log_file = self.get_config_value('Log', 'file', 'haps_session.log').strip()
+        if not log_file:
+            return
+        
+        self.log_file_path = os.path.join(os.path.dirname(os.path.abspath(self.config_file)), log_file)
+        self.log_file_backups = max(0, self.get_int_config_value('Log', 'file_backup_count', 5))
+        try:
+            handler = logging.handlers.RotatingFileHandler(
+                self.log_file_path,
+                maxBytes=max(0, self.get_int_config_value('Log', 'file_max_bytes', 10485760)),
+                backupCount=self.log_file_backups,
+                encoding='utf-8'
+            )
+        except OSError as e:
+            self.log(f"无法打开日志文件 {self.log_file_path}: {str(e)}")
+            return
+        handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s"))
+        
+        log_queue = queue.SimpleQueue()
+        self.log_listener = logging.handlers.QueueListener(log_queue, handler)
+        self.log_listener.start()
+        
+        logger = logging.getLogger("haps_control.session")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+        self.file_logger = logger
+    
+    def flush_log(self):
+        """界面线程按固定帧率把缓冲的日志批量写入控件"""
+        lines, dropped = self.log_sink.take(2000)
+        if dropped:
+            lines.insert(0, f"[{time.strftime('%H:%M:%S')}] ...日志输出过快，已丢弃 {dropped} 行...\n")
+        if lines:
+            self._append_log("".join(lines))
+        
+        if not self.executor.is_shutdown:
+            self.root.after(self.log_flush_interval, self.flush_log)
+    
+    def _append_log(self, text):
+        """在界面线程中写入日志控件，超过max_lines时删除最早的行"""
+        self.log_text.config(state=tk.NORMAL)
+        self.log_text.insert(tk.END, text)
+        line_count = int(self.log_text.index('end-1c').split('.')[0])
+        if line_count > self.log_max_lines:
+            self.log_text.delete('1.0', f'{line_count - self.log_max_lines + 1}.0')
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
-        # 强制刷新界面，确保日志实时显示
-        self.root.update_idletasks()
-    
-    def set_status(self, status):
-        """更新状态标签"""
-        self.status_var.set(status)
-        self.log(status)
     
-    def create_ssh_client(self):
-        """创建SSH客户端连接"""
-        host = self.get_config_value('Connection', 'host')
-        port = self.get_int_config_value('Connection', 'port', 22)
-        user = self.get_config_value('Connection', 'user')
-        password = self.get_config_value('Connection', 'password')
+    def show_log_history(self):
+        """打开历史日志窗口，从日志文件按需向前翻页"""
+        if self.file_logger is None:
+            messagebox.showinfo("历史日志", "未配置日志文件，无法查看历史日志")
+            return
+        
+        pager = LogFilePager(self.log_file_path, self.log_file_backups)
+        window = tk.Toplevel(self.root)
+        window.title("历史日志")
+        window.geometry("900x600")
         
+        text = scrolledtext.ScrolledText(window, wrap=tk.WORD)
+        button = ttk.Button(window, text="加载更早的日志")
+        button.pack(anchor=tk.W, padx=10, pady=5)
+        text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        
+        def load_previous():
+            lines = pager.previous_page()
+            if not lines:
+                button.config(state=tk.DISABLED, text="没有更早的日志")
+                return
+            text.config(state=tk.NORMAL)
+            text.insert('1.0', "\n".join(lines) + "\n")
+            text.config(state=tk.DISABLED)
+        
+        button.config(command=load_previous)
+        load_previous()
+        text.see(tk.END)
+    
+    def update_progress(self, interval=1000):
+        """每秒根据预计耗时刷新运行中操作的进度，多个操作时进度条显示剩余时间最长的一个"""
+        parts = []
+        slowest = None
+        for timing in self.engine.get_active_timings():
+            elapsed = timing.duration
+            if timing.estimate is None:
+                parts.append(f"{timing.operation}({timing.host}) 已用 {elapsed:.0f} 秒")
+                continue
+            expected = timing.estimate[0]
+            remaining = expected - elapsed
+            if remaining >= 0:
+                parts.append(f"{timing.operation}({timing.host}) 已用 {elapsed:.0f} 秒，预计剩余 {remaining:.0f} 秒")
+            else:
+                parts.append(f"{timing.operation}({timing.host}) 已超过预计耗时 {-remaining:.0f} 秒")
+            if slowest is None or remaining > slowest[0]:
+                slowest = (remaining, min(99.0, 100.0 * elapsed / expected) if expected > 0 else 99.0)
+        
+        self.progress_var.set("；".join(parts))
+        self.progress_bar['value'] = slowest[1] if slowest is not None else 0
+        if not self.executor.is_shutdown:
+            self.root.after(interval, self.update_progress)
+    
+    def cancel_operations(self):
+        """取消所有正在执行的操作：中断正在运行的命令，跳过剩余的步骤和等待"""
+        count = self.engine.cancel_operations("用户取消了操作")
+        if count:
+            self.log(f"已请求取消 {count} 个正在执行的操作")
+        else:
+            self.log("没有正在执行的操作")
+    
+    def show_history_stats(self):
+        """打开历史耗时统计窗口，按操作和命令分别列出各主机的耗时分布"""
+        history = self.engine.get_history()
+        if history is None:
+            messagebox.showinfo("历史耗时统计", "操作历史未启用或无法打开，请检查[History]配置")
+            return
+        days = max(1, self.get_int_config_value('History', 'stats_days', 30))
         try:
-            # 创建SSH客户端
-            ssh = paramiko.SSHClient()
-            # 自动添加未知主机密钥
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            # 连接到服务器
-            ssh.connect(host, port, user, password, timeout=10)
-            self.log(f"成功连接到 {host}:{port}")
-            return ssh
-        except AuthenticationException:
-            self.log(f"连接失败: 认证失败，请检查用户名和密码")
-        except NoValidConnectionsError:
-            self.log(f"连接失败: 无法连接到 {host}:{port}")
-        except SSHException as e:
-            self.log(f"SSH错误: {str(e)}")
+            sections = [("操作", history.operation_stats(days)), ("命令", history.command_stats(days))]
         except Exception as e:
-            self.log(f"连接错误: {str(e)}")
-        return None
-    
-    def execute_remote_command(self, command):
-        """使用paramiko执行远程命令"""
-        self.set_status(f"正在执行命令: {command}")
-        
-        # 创建SSH连接
-        ssh = self.create_ssh_client()
-        if not ssh:
-            return False
+            messagebox.showerror("历史耗时统计", f"读取操作历史失败: {str(e)}")
+            return
         
+        window = tk.Toplevel(self.root)
+        window.title(f"历史耗时统计 (最近 {days} 天)")
+        window.geometry("900x600")
+        notebook = ttk.Notebook(window)
+        notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        columns = [('host', "主机", 120), ('count', "次数", 60), ('failures', "失败", 60),
+                   ('p50', "p50(秒)", 80), ('p90', "p90(秒)", 80), ('max', "最长(秒)", 80)]
+        for title, rows in sections:
+            frame = ttk.Frame(notebook)
+            notebook.add(frame, text=title)
+            tree = ttk.Treeview(frame, columns=[key for key, _, _ in columns])
+            tree.heading('#0', text=title)
+            tree.column('#0', width=360)
+            for key, heading, width in columns:
+                tree.heading(key, text=heading)
+                tree.column(key, width=width, anchor=tk.E if key != 'host' else tk.W)
+            scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            tree.pack(fill=tk.BOTH, expand=True)
+            for row in rows:
+                tree.insert('', tk.END, text=row['name'], values=(
+                    row['host'], row['count'], row['failures'],
+                    f"{row['p50']:.2f}", f"{row['p90']:.2f}", f"{row['max']:.2f}"))
+            if not rows:
+                tree.insert('', tk.END, text="没有记录")
+    
+    def export_timings(self, chrome_trace=False):
+        """把最近操作的分阶段耗时导出为JSON文件，chrome_trace为True时导出为可在Perfetto中查看的时间线"""
+        title = "导出时间线" if chrome_trace else "导出耗时统计"
+        if not self.engine.timing_history:
+            messagebox.showinfo(title, "还没有已完成的重置或加载操作")
+            return
+        prefix = "haps_trace" if chrome_trace else "haps_timing"
+        filename = filedialog.asksaveasfilename(
+            title=title,
+            defaultextension=".json",
+            initialfile=f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}.json",
+            filetypes=[("JSON文件", "*.json"), ("所有文件", "*.*")]
+        )
+        if not filename:
+            return
         try:
-            # 执行命令
-            stdin, stdout, stderr = ssh.exec_command(command)
-            
-            # 实时读取输出
-            for line in stdout:
-                self.log(line.strip())
-            
-            # 读取错误输出
-            error_output = stderr.read().decode().strip()
-            if error_output:
-                self.log(f"命令错误输出: {error_output}")
-            
-            # 等待命令完成并获取返回码
-            while not stdout.channel.exit_status_ready():
-                if stdout.channel.recv_ready():
-                    line = stdout.readline()
-                    if line:
-                        self.log(line.strip())
-                time.sleep(0.5)
-            
-            exit_status = stdout.channel.recv_exit_status()
-            
-            if exit_status == 0:
-                self.set_status(f"命令执行成功: {command}")
-                return True
-            else:
-                self.set_status(f"命令执行失败 (返回码: {exit_status}): {command}")
-                return False
-                
-        except SSHException as e:
-            self.set_status(f"命令执行错误: {str(e)}")
-            return False
-        finally:
-            # 确保连接关闭
-            if ssh:
-                ssh.close()
-                self.log("SSH连接已关闭")
-    
-    def perform_reset(self, reset_type):
-        """执行重置操作（串行执行）"""
-        # 禁用所有按钮防止重复操作
-        self.disable_buttons(True)
+            count = self.engine.export_timings(filename, chrome_trace=chrome_trace)
+        except OSError as e:
+            messagebox.showerror(title, f"导出失败: {str(e)}")
+            return
+        self.log(f"已导出 {count} 次操作的{'时间线' if chrome_trace else '耗时统计'}到 {filename}")
+    
+    def show_status(self, status):
+        """更新状态标签，后台线程的状态经事件队列转交界面线程"""
+        if threading.current_thread() is not threading.main_thread():
+            self.executor.post('status', status)
+        else:
+            self.status_var.set(status)
+    
+    def process_events(self):
+        """界面线程定时取出后台事件并更新界面"""
+        for kind, payload in self.executor.drain():
+            if kind == 'status':
+                self.status_var.set(payload[0])
+            elif kind == 'call':
+                payload[0]()
+            elif kind == 'finished':
+                name, _, error = payload
+                if error is not None:
+                    self.log(f"{name}操作异常终止: {error}")
+                running = self.executor.active_count
+                if running:
+                    self.status_var.set(f"{name}操作已结束，仍有 {running} 个操作在运行")
+            elif kind == 'started':
+                self.status_var.set(f"{payload[0]}操作开始执行，运行中的操作: {self.executor.active_count}")
+        
+        if not self.executor.is_shutdown:
+            self.root.after(50, self.process_events)
+    
+    def run_on_ui_thread(self, func, *args):
+        """在界面线程中执行func并等待结果，用于后台操作中弹出对话框等场景"""
+        if threading.current_thread() is threading.main_thread():
+            return func(*args)
+        
+        done = threading.Event()
+        result = {}
         
+        def call():
+            try:
+                result['value'] = func(*args)
+            finally:
+                done.set()
+        
+        self.executor.post('call', call)
+        # 窗口关闭后不再等待界面线程
+        while not done.wait(0.2):
+            if self.executor.is_shutdown:
+                return None
+        return result.get('value')
+    
+    def sweep_ssh_pool(self):
+        """定期关闭空闲超时的confpro会话和SSH连接"""
+        self.engine.sweep_idle()
+        self.root.after(30000, self.sweep_ssh_pool)
+    
+    def start_preload(self):
+        """在后台线程中预加载执行远程命令所需的模块"""
+        def preload():
+            self.engine.preload()
+            if self.profiler is not None:
+                self.profiler.mark("后台预加载paramiko")
+                self.log(self.profiler.report())
+        
+        threading.Thread(target=preload, name="haps-preload", daemon=True).start()
+    
+    def start_resident_server(self):
+        """开始监听本机端口，失败时只记录日志"""
+        server = ResidentServer(self.config_file, self.handle_resident_request)
         try:
-            self.log(f"===== 开始{reset_type}重置操作 =====")
-            
-            # 获取配置的命令和参数
-            reset_commands = self.get_config_value('ResetCommands', reset_type, "")
-            confpro_path = self.get_config_value('Connection', 'confpro_path')
-            command_delay = self.get_int_config_value('Timing', 'command_delay', 2)
-            
-            if not reset_commands:
-                self.set_status(f"错误: 未配置{reset_type}的重置命令")
-                self.log(f"===== {reset_type}重置操作失败 =====")
-                return
-            
-            # 分割多条命令
-            commands = [cmd.strip() for cmd in reset_commands.split(';') if cmd.strip()]
-            
-            if not commands:
-                self.set_status(f"错误: 未找到有效的{reset_type}重置命令")
-                self.log(f"===== {reset_type}重置操作失败 =====")
-                return
-            
-            # 逐条执行命令
-            all_success = True
-            for i, cmd in enumerate(commands, 1):
-                self.log(f"\n===== 执行第 {i}/{len(commands)} 条命令 =====")
-                
-                # 构建完整命令
-                full_command = f'"{confpro_path}" {cmd}'
-                
-                # 执行命令
-                success = self.execute_remote_command(full_command)
-                if not success:
-                    all_success = False
-                    # 询问是否继续执行后续命令
-                    if not self.ask_continue_on_error():
-                        break
-                
-                # 如果不是最后一条命令，等待指定时间
-                if i < len(commands) and command_delay > 0:
-                    self.set_status(f"等待 {command_delay} 秒后执行下一条命令...")
-                    for _ in range(command_delay):
-                        time.sleep(1)
-                        self.root.update_idletasks()  # 刷新界面
-            
-            # 完成
-            if all_success:
-                self.set_status(f"===== {reset_type}重置操作全部成功完成 =====")
+            port = server.start()
+        except OSError as e:
+            self.log(f"常驻实例启动失败，之后启动的程序不会转发请求: {str(e)}")
+            return
+        self.resident = server
+        self.log(f"常驻实例已在本机端口 {port} 上等待转发的请求")
+    
+    def handle_resident_request(self, request, send):
+        """在连接线程中处理转发的请求，需要等待结果时把日志回传给请求方"""
+        command = request.get('command')
+        if command == 'show':
+            self.run_on_ui_thread(self.show_window)
+            return {'success': True}
+        if command == 'cancel':
+            # 带request_id时是转发请求的命令行被Ctrl+C中断，只取消该请求
+            request_id = request.get('request_id')
+            if request_id:
+                count = self.engine.cancel_operations("命令行已按Ctrl+C中断", request_id=str(request_id))
+                self.log(f"转发请求的命令行已中断，已取消该请求中的 {count} 个操作")
             else:
-                self.set_status(f"===== {reset_type}重置操作部分失败 =====")
-            
-            self.set_status("操作完成")
-            
-        finally:
-            # 恢复按钮状态
-            self.disable_buttons(False)
+                count = self.engine.cancel_operations("命令行请求取消操作")
+                self.log(f"收到转发的取消请求，已取消 {count} 个正在执行的操作")
+            return {'success': True, 'cancelled': count}
+        
+        wait = request.get('wait', True)
+        self.log(f"收到转发的请求: {command} {' '.join(map(str, request.get('args') or []))}")
+        done = self.submit_request(request, on_log=(lambda message: send({'log': message})) if wait else None)
+        if not wait:
+            return {'accepted': True}
+        while not done.wait(0.2):
+            if self.executor.is_shutdown:
+                return {'error': "程序已关闭，请求未完成"}
+        return done.result
     
-    def perform_load(self):
-        """执行加载操作（支持多条命令）"""
-        # 禁用所有按钮防止重复操作
-        self.disable_buttons(True)
+    def submit_request(self, request, on_log=None):
+        """在后台执行请求，返回完成事件，结束后done.result为回传给请求方的结果"""
+        done = threading.Event()
+        done.result = None
         
-        try:
-            self.log("===== 开始加载BitFile操作 =====")
-            
-            bitfile_path = self.bitfile_path_var.get()
-            bitfile_info_path = self.get_config_value('Connection', 'bitfile_info_path')
-            confpro_path = self.get_config_value('Connection', 'confpro_path')
-            load_commands = self.get_config_value('LoadCommands', 'default', '')
-            command_delay = self.get_int_config_value('Timing', 'command_delay', 2)
-            
-            # 检查文件是否存在
-            if not os.path.exists(bitfile_path):
-                self.log(f"指定的文件不存在: {bitfile_path}")
-                self.log("尝试使用默认路径...")
-                default_path_index = self.get_int_config_value('BitFilePaths', 'default_index', 3)
-                bitfile_path = self.get_config_value('BitFilePaths', f'path{default_path_index}', '')
-                self.bitfile_path_var.set(bitfile_path)
-                
-                if not os.path.exists(bitfile_path):
-                    self.log("默认路径文件也不存在")
-                    self.log("===== 加载操作失败 =====")
-                    return
-            
-            # 保存路径到info文件
+        def run():
+            timings = []
             try:
-                # 确保目录存在
-                Path(bitfile_info_path).parent.mkdir(parents=True, exist_ok=True)
-                
-                with open(bitfile_info_path, "w") as f:
-                    f.write(bitfile_path)
-                self.log(f"BitFile路径已保存到 {bitfile_info_path}")
+                success = self.engine.run_request(request, on_log=on_log, timings=timings)
+                done.result = {'success': success, 'timings': timings}
+            except ValueError as e:
+                self.log(f"请求无效: {str(e)}")
+                done.result = {'error': str(e), 'usage': True}
             except Exception as e:
-                self.log(f"保存BitFile路径失败: {str(e)}")
-            
-            # 检查加载命令配置
-            if not load_commands:
-                self.log("错误: 未配置加载命令")
-                self.log("===== 加载操作失败 =====")
-                return
-                
-            # 分割多条命令
-            commands = [cmd.strip() for cmd in load_commands.split(';') if cmd.strip()]
-            
-            if not commands:
-                self.log("错误: 未找到有效的加载命令")
-                self.log("===== 加载操作失败 =====")
-                return
-            
-            # 逐条执行命令
-            all_success = True
-            for i, cmd in enumerate(commands, 1):
-                self.log(f"\n===== 执行第 {i}/{len(commands)} 条加载命令 =====")
-                
-                # 替换命令中的占位符为实际文件路径
-                cmd_with_path = cmd.replace("{bitfile_path}", bitfile_path)
-                
-                # 构建完整命令
-                full_command = f'"{confpro_path}" {cmd_with_path}'
-                
-                # 执行命令
-                success = self.execute_remote_command(full_command)
-                if not success:
-                    all_success = False
-                    # 询问是否继续执行后续命令
-                    if not self.ask_continue_on_error():
-                        break
-                
-                # 如果不是最后一条命令，等待指定时间
-                if i < len(commands) and command_delay > 0:
-                    self.set_status(f"等待 {command_delay} 秒后执行下一条命令...")
-                    for _ in range(command_delay):
-                        time.sleep(1)
-                        self.root.update_idletasks()  # 刷新界面
-            
-            # 完成
-            if all_success:
-                self.set_status("===== 加载操作全部成功完成 =====")
-            else:
-                self.set_status("===== 加载操作部分失败 =====")
-                
-            self.set_status("操作完成")
-            
-        finally:
-            # 恢复按钮状态
-            self.disable_buttons(False)
-    
-    def disable_buttons(self, disable):
-        """启用/禁用所有操作按钮"""
-        # 遍历所有按钮并设置状态
-        for widget in self.root.winfo_children():
-            self._disable_widget(widget, disable)
-        # 刷新界面
-        self.root.update_idletasks()
-    
-    def _disable_widget(self, widget, disable):
-        """递归禁用/启用控件及其子控件"""
-        if isinstance(widget, ttk.Button):
-            widget.config(state=tk.DISABLED if disable else tk.NORMAL)
-        # 处理包含子控件的容器
-        for child in widget.winfo_children():
-            self._disable_widget(child, disable)
+                done.result = {'error': str(e)}
+                raise
+            finally:
+                done.set()
+        
+        self.executor.submit(f"{request.get('command')}请求", run)
+        return done
+    
+    def show_window(self):
+        """把窗口显示到最前"""
+        self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
+    
+    def on_close(self):
+        """关闭窗口时停止后台操作并断开所有SSH连接"""
+        if self.resident is not None:
+            self.resident.close()
+        self.executor.shutdown()
+        self.engine.close()
+        if self.log_listener is not None:
+            self.log_listener.stop()
+        self.root.destroy()
+    
+    def start_reset(self, reset_type):
+        """在后台线程中执行重置操作，勾选多主机时在所选主机上并行执行"""
+        targets = self.get_selected_targets()
+        if targets is None:
+            return
+        if targets:
+            self.executor.submit(f"{reset_type}多主机重置", self.engine.perform_fanout,
+                                 targets, f"{reset_type}重置", self.engine.perform_reset, reset_type)
+        else:
+            self.executor.submit(f"{reset_type}重置", self.engine.perform_reset, reset_type)
+    
+    def start_load(self):
+        """在后台线程中执行加载操作，BitFile路径在界面线程中读取"""
+        targets = self.get_selected_targets()
+        if targets is None:
+            return
+        bitfile_path = self.bitfile_path_var.get()
+        force = self.force_load_var.get()
+        
+        def on_bitfile_path(path):
+            # 改用默认路径时同步更新界面
+            self.run_on_ui_thread(self.bitfile_path_var.set, path)
+        
+        if targets:
+            self.executor.submit("多主机加载", self.engine.perform_fanout,
+                                 targets, "加载", self.engine.perform_load, bitfile_path, on_bitfile_path, force)
+        else:
+            self.executor.submit("加载", self.engine.perform_load, bitfile_path, on_bitfile_path, force)
+    
+    def get_selected_targets(self):
+        """未勾选多主机时返回空列表，勾选但未选择主机时提示并返回None"""
+        if not self.fanout_var.get():
+            return []
+        inventory = self.engine.get_host_inventory()
+        targets = [inventory[i] for i in self.hosts_listbox.curselection() if i < len(inventory)]
+        if not targets:
+            messagebox.showwarning("多主机并行执行", "请先在列表中选择至少一台主机")
+            return None
+        return targets
     
     def ask_continue_on_error(self):
         """询问用户在命令执行错误时是否继续"""
-        # 创建一个模态对话框
-        result = messagebox.askyesno(
+        # 对话框必须在界面线程中创建，后台操作在此等待用户选择
+        result = self.run_on_ui_thread(
+            messagebox.askyesno,
             "命令执行错误",
             "当前命令执行失败，是否继续执行后续命令？"
         )
-        return result
+        return bool(result)
+
+
+def parse_launch_request(argv):
+    """启动参数转换为请求：reset <类型> 或 load <路径>，其他情况为显示窗口"""
+    if len(argv) == 2 and argv[0] == 'reset':
+        return {'command': 'reset', 'args': [argv[1]], 'wait': False}
+    if len(argv) == 2 and argv[0] == 'load':
+        # 转发给常驻实例时其工作目录可能不同，相对路径先转换为绝对路径
+        return {'command': 'load', 'args': [os.path.abspath(argv[1])], 'wait': False}
+    return {'command': 'show'}
+
 
 if __name__ == "__main__":
+    argv = sys.argv[1:]
+    profiler = None
+    if '--profile-startup' in argv:
+        argv.remove('--profile-startup')
+        profiler = StartupProfiler(STARTUP_BEGIN)
+        profiler.mark("导入模块")
+    
+    # 已有常驻实例时把请求交给它，不再打开新窗口
+    launch_request = parse_launch_request(argv)
+    if forward_request(DEFAULT_CONFIG_FILE, launch_request) is not None:
+        sys.exit(0)
+    
     root = tk.Tk()
-    app = HAPSControlGUI(root)
+    app = HAPSControlGUI(root, profiler)
+    if profiler is not None:
+        # 处理完挂起的绘制事件，此时窗口已首次显示
+        root.update()
+        profiler.mark("窗口首次显示")
+        report = profiler.report()
+        app.log(report)
+        if sys.stdout is not None:
+            print(report, flush=True)
+    if launch_request['command'] != 'show':
+        app.submit_request(launch_request)
     root.mainloop()
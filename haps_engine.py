@@ -0,0 +1,3109 @@
+"""HAPS控制引擎：配置读写、命令计划解析和远程执行
+
+不依赖tkinter，图形界面(haps_control_gui_v7.py)和命令行(haps_cli.py)共用同一套执行逻辑。
+日志、状态和出错时是否继续通过构造HapsEngine时传入的回调交给调用方处理。
+"""
+import os
+import re
+import random
+import time
+import json
+import codecs
+import collections
+import contextlib
+import functools
+import heapq
+import itertools
+import contextvars
+import select
+import shlex
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import subprocess
+import unicodedata
+import configparser
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# 默认配置文件路径
+DEFAULT_CONFIG_FILE = "haps_config.ini"
+
+# paramiko(及其依赖的cryptography)导入耗时较长，首次建立连接时才导入，见load_paramiko
+paramiko = None
+
+
+def load_paramiko():
+    """导入paramiko，可在后台线程中提前调用，未安装时抛出ImportError"""
+    global paramiko
+    if paramiko is None:
+        import paramiko as module  # 需要安装: pip install paramiko
+        paramiko = module
+    return paramiko
+
+
+def ssh_errors():
+    """SSH连接或通道失效时可能抛出的异常类型"""
+    try:
+        return (load_paramiko().SSHException, EOFError, OSError)
+    except ImportError:
+        # 使用openssh/local传输方式时可以不安装paramiko
+        return (EOFError, OSError)
+
+
+# 远程主机：name用于日志和结果显示
+HostTarget = collections.namedtuple('HostTarget', 'name host port user password')
+
+
+class OperationContext:
+    """一次操作在某台主机上的执行上下文，记录目标主机和每一步的执行结果"""
+    
+    def __init__(self, target, log_prefix="", ask_on_error=True):
+        self.target = target
+        self.log_prefix = log_prefix
+        # 多主机并行执行时不弹出对话框，失败后直接停止该主机的后续命令
+        self.ask_on_error = ask_on_error
+        # 步骤序号(从1开始) -> 是否成功
+        self.step_results = {}
+        # 超时被中断的步骤序号
+        self.timed_out_steps = set()
+        self.step_count = 0
+
+
+# 当前线程所执行操作的上下文，命令计划的并行步骤通过复制上下文继承
+current_operation = contextvars.ContextVar('current_operation', default=None)
+
+
+class RequestOptions:
+    """命令行或转发请求的执行选项，对该请求的所有主机和步骤生效"""
+    
+    def __init__(self, mode=None, continue_on_error=False, on_log=None):
+        # 覆盖[Execution] mode，为None时使用配置
+        self.mode = mode
+        self.continue_on_error = continue_on_error
+        # 除引擎的on_log外，该请求的日志还交给on_log(message)
+        self.on_log = on_log
+        # 该请求中各主机操作的OperationTiming
+        self.timings = []
+
+
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+def display_width(text):
+    """终端中的显示宽度，中文字符占两列"""
+    return sum(2 if unicodedata.east_asian_width(ch) in 'WF' else 1 for ch in text)
+
+
+def pad_display(text, width):
+    """按显示宽度(中文字符占两列)在右侧补空格，用于日志中的表格对齐"""
+    return text + " " * max(0, width - display_width(text))
+
+
+# 计时阶段的显示名称，按此顺序输出汇总
+TIMING_PHASES = collections.OrderedDict([
+    ('file.check', "检查BitFile"),
+    ('file.write', "写入bitfile.info"),
+    ('file.hash', "计算工程内容哈希"),
+    ('step', "命令步骤"),
+    ('connect', "获取SSH连接"),
+    ('connect.tcp', "  TCP连接"),
+    ('connect.kex', "  密钥交换"),
+    ('connect.auth', "  认证"),
+    ('reconnect', "重新连接等待"),
+    ('exec', "打开通道并启动命令"),
+    ('runtime', "命令运行"),
+    ('session.start', "启动confpro会话"),
+    ('delay', "命令间等待"),
+    ('retry', "失败重试等待"),
+    ('cancel', "取消到停止"),
+])
+
+
+class OperationTiming:
+    """一次重置/加载操作在某台主机上的分阶段耗时，各阶段由timing_span记录
+    
+    命令计划的并行步骤共享同一个对象，记录时加锁。
+    """
+    
+    def __init__(self, operation, host, kind=None, subject=None, mode=None):
+        self.operation = operation
+        self.host = host
+        # 操作类型(reset/load)、对象(重置类型或BitFile路径)和执行方式，记入操作历史
+        self.kind = kind
+        self.subject = subject
+        self.mode = mode
+        # 根据操作历史预计的耗时 (秒, 样本数)，没有历史记录时为None
+        self.estimate = None
+        self.thread = threading.current_thread().name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.success = None
+        # (阶段, 开始时间, 结束时间, 线程名, 说明)，时间为perf_counter
+        self.spans = []
+        # 步骤序号 -> {'step', 'command', 'success', 'exit_code', 'duration'}
+        self.steps = {}
+        # 操作被取消时为True
+        self.cancelled = False
+        # 认证失败等重试也无法解决的错误，出现后不再重试或执行后续步骤
+        self.fatal_error = None
+        self._lock = threading.Lock()
+    
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+    
+    def add(self, phase, start, end, detail=None):
+        with self._lock:
+            self.spans.append((phase, start, end, threading.current_thread().name, detail))
+    
+    def record_step(self, step, **fields):
+        """合并某一步的命令、结果、返回码或耗时，值为None的字段不覆盖已有记录"""
+        with self._lock:
+            record = self.steps.setdefault(step, {'step': step})
+            record.update((key, value) for key, value in fields.items() if value is not None)
+    
+    def finish(self, success=None):
+        self.end = time.perf_counter()
+        self.success = success
+    
+    def summary(self):
+        """按阶段汇总，返回 {阶段: {'count', 'total', 'max'}}"""
+        result = {}
+        with self._lock:
+            spans = list(self.spans)
+        for phase, start, end, _, _ in spans:
+            item = result.setdefault(phase, {'count': 0, 'total': 0.0, 'max': 0.0})
+            item['count'] += 1
+            item['total'] += end - start
+            item['max'] = max(item['max'], end - start)
+        order = list(TIMING_PHASES)
+        return dict(sorted(result.items(), key=lambda kv: order.index(kv[0]) if kv[0] in order else len(order)))
+    
+    def format_summary(self):
+        lines = [f"----- {self.operation}各阶段耗时 (总耗时 {self.duration:.2f} 秒) -----",
+                 pad_display("阶段", 22) + pad_display("次数", 6) + pad_display("合计(秒)", 12) + "最长(秒)"]
+        for phase, item in self.summary().items():
+            label = TIMING_PHASES.get(phase, phase)
+            lines.append(pad_display(label, 22) + str(item['count']).ljust(6)
+                         + f"{item['total']:.3f}".ljust(12) + f"{item['max']:.3f}")
+        return "\n".join(lines)
+    
+    def to_dict(self):
+        """转换为可写入JSON的字典，各阶段的开始时间为相对操作开始的秒数"""
+        with self._lock:
+            spans = list(self.spans)
+            steps = [dict(self.steps[step]) for step in sorted(self.steps)]
+        return {
+            'operation': self.operation,
+            'host': self.host,
+            'kind': self.kind,
+            'subject': self.subject,
+            'mode': self.mode,
+            'started_at': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            'start_time': self.started_at,
+            'thread': self.thread,
+            'duration': round(self.duration, 6),
+            'success': self.success,
+            'cancelled': self.cancelled,
+            'summary': {phase: {'count': item['count'], 'total': round(item['total'], 6), 'max': round(item['max'], 6)}
+                        for phase, item in self.summary().items()},
+            'spans': [
+                {'phase': phase, 'start': round(start - self.start, 6), 'duration': round(end - start, 6),
+                 'thread': thread, 'detail': detail}
+                for phase, start, end, thread, detail in spans
+            ],
+            'steps': steps
+        }
+
+
+# 当前操作的计时对象，不在重置/加载操作中时为None
+current_timing = contextvars.ContextVar('current_timing', default=None)
+
+
+@contextlib.contextmanager
+def timing_span(phase, detail=None):
+    """把代码块的耗时记录到当前操作的指定阶段"""
+    timing = current_timing.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(phase, start, time.perf_counter(), detail)
+
+
+# 当前正在执行的步骤序号，execute_remote_command据此记录返回码
+current_step = contextvars.ContextVar('current_step', default=None)
+
+
+@contextlib.contextmanager
+def step_span(step, command):
+    """记录一个命令步骤的耗时，同时记入当前操作的步骤记录"""
+    timing = current_timing.get()
+    token = current_step.set(step)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        current_step.reset(token)
+        if timing is not None:
+            timing.add('step', start, end, f"第{step}步 {command}")
+            timing.record_step(step, command=command, duration=round(end - start, 6))
+
+
+def write_timings_json(path, timings):
+    """把OperationTiming.to_dict()的列表写入JSON文件"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(timings, f, ensure_ascii=False, indent=2)
+
+
+def timings_to_chrome_trace(timings):
+    """把OperationTiming.to_dict()的列表转换为Chrome Trace Event格式
+    
+    每台主机显示为一个进程，执行操作和并行步骤的每个线程为一条轨道，
+    可在chrome://tracing或ui.perfetto.dev中打开查看各阶段的重叠和空闲。
+    """
+    events = []
+    if not timings:
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+    origin = min(timing['start_time'] for timing in timings)
+    pids = {}
+    tids = {}
+    
+    def track(host, thread):
+        pid = pids.get(host)
+        if pid is None:
+            pid = pids[host] = len(pids) + 1
+            events.append({'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0, 'args': {'name': host}})
+        tid = tids.get((pid, thread))
+        if tid is None:
+            tid = tids[(pid, thread)] = len(tids) + 1
+            events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': thread}})
+        return pid, tid
+    
+    for timing in timings:
+        # 时间单位为微秒，以最早开始的操作为0点
+        base = (timing['start_time'] - origin) * 1e6
+        pid, tid = track(timing['host'], timing['thread'])
+        events.append({
+            'ph': 'X', 'name': timing['operation'], 'cat': 'operation',
+            'ts': round(base, 3), 'dur': round(timing['duration'] * 1e6, 3),
+            'pid': pid, 'tid': tid, 'args': {'success': timing['success']}
+        })
+        for span in timing['spans']:
+            pid, tid = track(timing['host'], span['thread'])
+            label = TIMING_PHASES.get(span['phase'], span['phase']).strip()
+            events.append({
+                'ph': 'X', 'name': span['detail'] if span['phase'] == 'step' and span['detail'] else label,
+                'cat': span['phase'],
+                'ts': round(base + span['start'] * 1e6, 3), 'dur': round(span['duration'] * 1e6, 3),
+                'pid': pid, 'tid': tid, 'args': {'detail': span['detail']} if span['detail'] else {}
+            })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def parse_host_inventory(items, default_user, default_password, default_port=22):
+    """解析[Hosts]配置，值的格式为 [user@]host[:port]，返回HostTarget列表"""
+    targets = []
+    for name, value in items:
+        value = value.strip()
+        if not value:
+            continue
+        user = default_user
+        port = default_port
+        if '@' in value:
+            user, value = value.split('@', 1)
+        if ':' in value:
+            value, port_text = value.rsplit(':', 1)
+            try:
+                port = int(port_text)
+            except ValueError:
+                raise ValueError(f"主机 {name} 的端口无效: {port_text}")
+        targets.append(HostTarget(name, value, port, user, default_password))
+    return targets
+
+
+def enable_tcp_keepalive(sock, interval, count):
+    """开启TCP keepalive，空闲interval秒后开始探测，连续count次无响应（或发出的数据超过
+    interval*count秒未被确认）时内核关闭连接，用于发现网络中断后的半开连接"""
+    options = [(socket.SOL_SOCKET, 'SO_KEEPALIVE', 1)]
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        options += [(socket.IPPROTO_TCP, 'TCP_KEEPIDLE', interval),
+                    (socket.IPPROTO_TCP, 'TCP_KEEPINTVL', interval),
+                    (socket.IPPROTO_TCP, 'TCP_KEEPCNT', count)]
+    elif hasattr(socket, 'TCP_KEEPALIVE'):
+        # macOS只能设置开始探测前的空闲时间
+        options.append((socket.IPPROTO_TCP, 'TCP_KEEPALIVE', interval))
+    if hasattr(socket, 'TCP_USER_TIMEOUT'):
+        options.append((socket.IPPROTO_TCP, 'TCP_USER_TIMEOUT', interval * count * 1000))
+    for level, name, value in options:
+        try:
+            sock.setsockopt(level, getattr(socket, name), value)
+        except OSError:
+            pass
+    if hasattr(socket, 'SIO_KEEPALIVE_VALS'):
+        # Windows: (开启, 空闲毫秒数, 探测间隔毫秒数)，探测次数由系统决定
+        try:
+            sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, interval * 1000, interval * 1000))
+        except OSError:
+            pass
+
+
+class SSHConnectionPool:
+    """按 (host, port, user) 缓存已认证的paramiko Transport，在多条命令和多次操作之间复用"""
+    
+    def __init__(self, idle_timeout=300, connect_timeout=10, keepalive_interval=15, keepalive_count=3):
+        # idle_timeout 为0时不保留空闲连接，行为与每条命令单独建立连接相同
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        # 新建立的连接每keepalive_interval秒发送一次SSH keepalive并开启TCP keepalive，0表示不开启
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self._lock = threading.Lock()
+        # key -> {'transport', 'password', 'in_use', 'last_used'}
+        self._entries = {}
+        self._connect_locks = {}
+    
+    def acquire(self, host, port, user, password):
+        """获取一个可用的Transport，返回 (transport, 是否复用)"""
+        key = (host, port, user)
+        with self._lock:
+            # 同一主机的并发请求串行建立连接，避免重复握手
+            key_lock = self._connect_locks.setdefault(key, threading.Lock())
+        
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry['password'] == password and self._is_healthy(entry['transport']):
+                        entry['in_use'] += 1
+                        entry['last_used'] = time.monotonic()
+                        return entry['transport'], True
+                    # 连接已失效或密码已修改，丢弃旧连接（正在使用者会在释放时发现）
+                    del self._entries[key]
+                    if entry['in_use'] == 0:
+                        entry['transport'].close()
+            
+            # 在全局锁外建立连接，避免慢速握手阻塞其他主机
+            transport = self._connect(host, port, user, password)
+            with self._lock:
+                self._entries[key] = {
+                    'transport': transport,
+                    'password': password,
+                    'in_use': 1,
+                    'last_used': time.monotonic()
+                }
+            return transport, False
+    
+    def release(self, transport):
+        """归还Transport，空闲超时为0时立即关闭"""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry['transport'] is transport:
+                    entry['in_use'] = max(0, entry['in_use'] - 1)
+                    entry['last_used'] = time.monotonic()
+                    if entry['in_use'] == 0 and self.idle_timeout <= 0:
+                        del self._entries[key]
+                        transport.close()
+                    return
+        # 已被丢弃的连接，直接关闭
+        transport.close()
+    
+    def discard(self, transport):
+        """命令执行中发现连接异常时，将其移出连接池"""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry['transport'] is transport:
+                    del self._entries[key]
+                    break
+        transport.close()
+    
+    def evict_idle(self):
+        """关闭空闲超时或已断开的连接，返回被关闭的数量"""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry['in_use'] > 0:
+                    continue
+                if now - entry['last_used'] >= self.idle_timeout or not entry['transport'].is_active():
+                    evicted.append(self._entries.pop(key)['transport'])
+        for transport in evicted:
+            transport.close()
+        return len(evicted)
+    
+    def close_all(self):
+        """关闭连接池中的所有连接"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry['transport'].close()
+    
+    def _is_healthy(self, transport):
+        """检查连接是否仍然可用"""
+        if not transport.is_active() or not transport.is_authenticated():
+            return False
+        try:
+            # 发送SSH_MSG_IGNORE，本地socket已断开时会立即抛出异常
+            transport.send_ignore()
+        except ssh_errors():
+            return False
+        return True
+    
+    def _connect(self, host, port, user, password):
+        """建立TCP连接、完成密钥交换和认证"""
+        with timing_span('connect.tcp', f"{host}:{port}"):
+            sock = socket.create_connection((host, port), timeout=self.connect_timeout)
+        # 关闭Nagle算法，避免小报文与延迟确认叠加造成每次通道请求几十毫秒的等待
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive_interval > 0:
+            enable_tcp_keepalive(sock, self.keepalive_interval, max(1, self.keepalive_count))
+        transport = load_paramiko().Transport(sock)
+        try:
+            # 不校验主机密钥，与之前使用AutoAddPolicy的行为一致
+            with timing_span('connect.kex'):
+                transport.start_client(timeout=self.connect_timeout)
+            with timing_span('connect.auth', user):
+                self._authenticate(transport, user, password)
+        except Exception:
+            transport.close()
+            raise
+        if self.keepalive_interval > 0:
+            # 定期发送数据，对端已不可达时由TCP超时尽快关闭连接，正在执行的命令随即中断
+            transport.set_keepalive(self.keepalive_interval)
+        return transport
+    
+    def _authenticate(self, transport, user, password):
+        """与SSHClient.connect的顺序相同：先尝试ssh-agent和~/.ssh中的默认密钥，再使用密码"""
+        ssh = load_paramiko()
+        for key in self._candidate_keys(password):
+            try:
+                transport.auth_publickey(user, key)
+            except ssh.BadAuthenticationType as e:
+                if 'publickey' not in e.allowed_types:
+                    # 服务端不接受密钥认证
+                    break
+            except ssh.SSHException:
+                continue
+            if transport.is_authenticated():
+                return
+        transport.auth_password(user, password)
+    
+    @staticmethod
+    def _candidate_keys(password):
+        """依次返回ssh-agent中的密钥和~/.ssh中可以读取的默认密钥，加密的密钥用密码解密"""
+        ssh = load_paramiko()
+        try:
+            agent = ssh.Agent()
+            try:
+                yield from agent.get_keys()
+            finally:
+                agent.close()
+        except ssh.SSHException:
+            pass
+        for cls, name in ((ssh.RSAKey, 'id_rsa'), (ssh.ECDSAKey, 'id_ecdsa'), (ssh.Ed25519Key, 'id_ed25519')):
+            path = os.path.expanduser(os.path.join('~', '.ssh', name))
+            if not os.path.isfile(path):
+                continue
+            try:
+                yield cls.from_private_key_file(path, password=password or None)
+            except (ssh.SSHException, OSError, ValueError):
+                continue
+
+
+class ChannelReader:
+    """同时读取通道的标准输出和错误输出，按行回调，收到退出状态后立即返回
+    
+    通过select等待通道的事件描述符（任一输出有数据或收到EOF时可读），
+    不再先读完stdout再读stderr，也不再每0.5秒轮询一次退出状态。
+    """
+    
+    def __init__(self, channel, on_stdout, on_stderr, encoding='utf-8'):
+        self.channel = channel
+        self.on_stdout = on_stdout
+        self.on_stderr = on_stderr
+        self._streams = [
+            (channel.recv_ready, channel.recv, codecs.getincrementaldecoder(encoding)(errors='replace'), on_stdout),
+            (channel.recv_stderr_ready, channel.recv_stderr, codecs.getincrementaldecoder(encoding)(errors='replace'), on_stderr)
+        ]
+        self._partial = ["", ""]
+    
+    def run(self, wait_interval=1.0):
+        """读取全部输出并返回退出码"""
+        channel = self.channel
+        while True:
+            self._drain()
+            if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+            if channel.closed:
+                # 命令被中断，本地已关闭通道
+                break
+            if channel.eof_received:
+                # 输出已结束，只需等待退出状态
+                channel.status_event.wait(wait_interval)
+            else:
+                select.select([channel], [], [], wait_interval)
+        
+        self._drain()
+        self._flush()
+        return channel.recv_exit_status()
+    
+    def _drain(self):
+        """读取两个缓冲区中已到达的数据"""
+        for index, (ready, receive, decoder, callback) in enumerate(self._streams):
+            while ready():
+                data = receive(32768)
+                if not data:
+                    break
+                text = self._partial[index] + decoder.decode(data)
+                lines = text.split('\n')
+                self._partial[index] = lines.pop()
+                for line in lines:
+                    callback(line.rstrip('\r'))
+    
+    def _flush(self):
+        """输出末尾没有换行的内容"""
+        for index, (_, _, decoder, callback) in enumerate(self._streams):
+            text = self._partial[index] + decoder.decode(b'', final=True)
+            self._partial[index] = ""
+            if text:
+                callback(text.rstrip('\r'))
+
+
+class TransportError(OSError):
+    """无法建立连接或启动执行命令的进程"""
+
+
+class ConnectFailedError(TransportError):
+    """认证失败、未安装paramiko等重试也无法解决的连接错误，或已用完重新连接次数，失败处理策略不会再重试"""
+
+
+class ChannelOpenError(TransportError):
+    """连接正常但服务端拒绝或超时未响应打开通道的请求（如超过MaxSessions），只影响当前命令"""
+
+
+class ConnectionLostError(TransportError):
+    """命令执行期间SSH连接中断，命令在远程主机上是否完成未知"""
+
+
+class CommandInterrupt:
+    """中断正在执行的命令：interrupt()关闭SSH通道或结束本地进程，传输方式的run()随即返回
+    
+    传输方式开始执行命令后通过attach()登记关闭函数，可在任意线程（包括输出回调中）调用interrupt()。
+    """
+    
+    def __init__(self):
+        self.reason = None
+        # 由CommandWatchdog超时中断时为True
+        self.timed_out = False
+        self._lock = threading.Lock()
+        self._close = None
+    
+    @property
+    def interrupted(self):
+        return self.reason is not None
+    
+    def attach(self, close):
+        """登记关闭函数，已被中断时立即调用"""
+        with self._lock:
+            self._close = close
+            interrupted = self.reason is not None
+        if interrupted:
+            close()
+    
+    def detach(self):
+        with self._lock:
+            self._close = None
+    
+    def interrupt(self, reason, timed_out=False):
+        """中断命令，已中断过时返回False"""
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            self.timed_out = timed_out
+            close = self._close
+        if close is not None:
+            close()
+        return True
+
+
+class CommandWatchdog:
+    """命令超时看门狗：一个后台线程按截止时间检查所有被监视的命令，超时后通过CommandInterrupt中断
+    
+    不为每条命令启动定时器；线程在第一次监视命令时启动。
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        # [截止时间, 序号, interrupt, 原因]，取消监视时interrupt置为None
+        self._heap = []
+        self._sequence = itertools.count()
+        self._thread = None
+    
+    def watch(self, interrupt, seconds, reason):
+        """seconds秒后中断命令，返回用于unwatch的记录"""
+        entry = [time.monotonic() + seconds, next(self._sequence), interrupt, reason]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="haps-watchdog", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+    
+    def unwatch(self, entry):
+        with self._cond:
+            entry[2] = None
+    
+    @contextlib.contextmanager
+    def watching(self, interrupt, seconds, reason):
+        """代码块执行超过seconds秒时中断命令，seconds不大于0时不限制"""
+        if not seconds or seconds <= 0:
+            yield
+            return
+        entry = self.watch(interrupt, seconds, reason)
+        try:
+            yield
+        finally:
+            self.unwatch(entry)
+    
+    def close(self):
+        """停止后台线程，之后再次监视命令时重新启动"""
+        with self._cond:
+            self._heap.clear()
+            self._thread = None
+            self._cond.notify()
+    
+    def _run(self):
+        current = threading.current_thread()
+        while True:
+            expired = []
+            with self._cond:
+                if self._thread is not current:
+                    return
+                # 丢弃已取消监视的记录
+                while self._heap and self._heap[0][2] is None:
+                    heapq.heappop(self._heap)
+                now = time.monotonic()
+                while self._heap and self._heap[0][0] <= now:
+                    entry = heapq.heappop(self._heap)
+                    if entry[2] is not None:
+                        expired.append((entry[2], entry[3]))
+                if not expired:
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            for interrupt, reason in expired:
+                interrupt.interrupt(reason, timed_out=True)
+
+
+class CancelToken:
+    """取消一次操作：cancel()中断所有正在执行的命令，之后的步骤和命令间等待都被跳过"""
+    
+    def __init__(self, request_id=None):
+        # 转发请求时由请求方生成的编号，用于只取消该请求中的操作
+        self.request_id = request_id
+        self.reason = None
+        # 请求取消的时间(perf_counter)，用于统计从取消到操作停止的耗时
+        self.cancelled_at = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._interrupts = set()
+    
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+    
+    def cancel(self, reason="操作已取消"):
+        """请求取消，已取消过时返回False"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self.cancelled_at = time.perf_counter()
+            self._event.set()
+            interrupts = list(self._interrupts)
+        for interrupt in interrupts:
+            interrupt.interrupt(reason)
+        return True
+    
+    def wait(self, timeout):
+        """等待timeout秒，期间被取消时立即返回True"""
+        return self._event.wait(timeout)
+    
+    @contextlib.contextmanager
+    def guard(self, interrupt):
+        """代码块执行期间被取消时中断interrupt对应的命令"""
+        with self._lock:
+            self._interrupts.add(interrupt)
+            cancelled = self._event.is_set()
+        if cancelled:
+            interrupt.interrupt(self.reason)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._interrupts.discard(interrupt)
+
+
+# 当前操作的取消令牌，多主机并行执行和并行步骤通过复制上下文共用同一个令牌
+current_cancel = contextvars.ContextVar('current_cancel', default=None)
+
+
+class ParamikoTransport:
+    """通过paramiko执行命令，已认证的连接由SSHConnectionPool在命令之间复用（默认）"""
+    
+    name = 'paramiko'
+    
+    def __init__(self, connect, pool):
+        # connect(target, quiet) 从连接池获取已认证的Transport，失败时记录原因并抛出TransportError
+        self.connect = connect
+        self.pool = pool
+    
+    def run(self, target, command, on_stdout, on_stderr, quiet=False, interrupt=None):
+        """执行命令并按行回调输出，返回退出码；通过interrupt中断时关闭通道，返回-1
+        
+        执行期间连接中断时抛出ConnectionLostError；连接正常但无法打开通道时抛出ChannelOpenError。
+        """
+        transport = self.connect(target, quiet)
+        
+        channel = None
+        try:
+            with timing_span('exec', command):
+                try:
+                    channel = transport.open_session(timeout=self.pool.connect_timeout)
+                except ssh_errors() as e:
+                    if not transport.is_active():
+                        raise
+                    raise ChannelOpenError(f"无法在已有连接上打开通道: {str(e)}") from e
+                if interrupt is not None:
+                    interrupt.attach(channel.close)
+                channel.exec_command(command)
+            # 同时实时读取标准输出和错误输出，命令结束后立即获取返回码
+            with timing_span('runtime', command):
+                exit_status = ChannelReader(channel, on_stdout, on_stderr).run()
+            if exit_status == -1 and not transport.is_active() and \
+                    not (interrupt is not None and interrupt.interrupted):
+                # 通道因连接断开被关闭，没有收到退出码
+                raise ConnectionLostError(f"与 {target.host}:{target.port} 的连接在命令执行期间中断")
+            return exit_status
+        except ssh_errors() as e:
+            if transport.is_active():
+                # 通道级错误，连接可能正被其他步骤和操作共用，只让本命令失败并正常归还连接
+                raise
+            # 连接已不可用，从连接池移除
+            self.pool.discard(transport)
+            transport = None
+            if not isinstance(e, ConnectionLostError):
+                raise ConnectionLostError(f"与 {target.host}:{target.port} 的连接已中断: {str(e)}") from e
+            raise
+        finally:
+            if interrupt is not None:
+                interrupt.detach()
+            # 只关闭通道，连接归还连接池
+            if channel is not None:
+                channel.close()
+            if transport is not None:
+                self.pool.release(transport)
+    
+    def close(self):
+        # 连接池由引擎关闭
+        pass
+
+
+class SubprocessTransport:
+    """在本地子进程中执行命令，同时读取标准输出和错误输出"""
+    
+    name = None
+    # 为True时在新的进程组中启动，中断时结束整个进程组
+    new_process_group = False
+    
+    def command_args(self, target, command):
+        raise NotImplementedError
+    
+    def command_env(self, target):
+        return None
+    
+    def kill(self, process):
+        """结束命令进程"""
+        try:
+            if self.new_process_group and os.name == 'nt':
+                subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+            elif self.new_process_group:
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except (OSError, subprocess.SubprocessError):
+            # 进程已经退出
+            pass
+    
+    def run(self, target, command, on_stdout, on_stderr, quiet=False, interrupt=None):
+        """执行命令并按行回调输出，返回退出码；通过interrupt中断时结束进程"""
+        args = self.command_args(target, command)
+        with timing_span('exec', command):
+            try:
+                process = subprocess.Popen(
+                    args,
+                    shell=isinstance(args, str),
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    env=self.command_env(target),
+                    start_new_session=self.new_process_group and os.name != 'nt',
+                    # 图形界面没有控制台，避免每条命令弹出一个窗口
+                    creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+                )
+            except OSError as e:
+                raise ConnectFailedError(f"无法启动命令进程: {str(e)}")
+        
+        if interrupt is not None:
+            interrupt.attach(lambda: self.kill(process))
+        try:
+            with timing_span('runtime', command):
+                stderr_reader = threading.Thread(target=self._pump, args=(process.stderr, on_stderr), daemon=True)
+                stderr_reader.start()
+                self._pump(process.stdout, on_stdout)
+                stderr_reader.join()
+                return process.wait()
+        finally:
+            if interrupt is not None:
+                interrupt.detach()
+    
+    @staticmethod
+    def _pump(stream, callback):
+        with stream:
+            for raw in iter(stream.readline, b''):
+                callback(raw.decode('utf-8', errors='replace').rstrip('\r\n'))
+    
+    def close(self):
+        pass
+
+
+class LocalTransport(SubprocessTransport):
+    """在本机的命令解释器中执行，用于工具直接运行在confpro所在的主机上，或测量不含网络的开销"""
+    
+    name = 'local'
+    # 通过命令解释器启动，中断时需要同时结束confpro等子进程
+    new_process_group = True
+    
+    def command_args(self, target, command):
+        return command
+
+
+class OpenSSHTransport(SubprocessTransport):
+    """调用系统的ssh命令执行
+    
+    control_master为True时通过ControlMaster/ControlPersist让同一主机的命令复用一个已认证的连接
+    （Windows自带的OpenSSH不支持连接复用，自动关闭）。配置了密码时通过SSH_ASKPASS提供给ssh，
+    需要OpenSSH 8.4及以上；密码为空时使用密钥认证。与paramiko方式一样不校验主机密钥。
+    """
+    
+    name = 'openssh'
+    
+    def __init__(self, ssh_path='ssh', control_master=True, control_persist=300, connect_timeout=10,
+                 extra_options=''):
+        self.ssh_path = ssh_path
+        self.control_master = control_master and os.name != 'nt'
+        self.control_persist = control_persist
+        self.connect_timeout = connect_timeout
+        self.extra_options = shlex.split(extra_options)
+        self._lock = threading.Lock()
+        self._workdir = None
+        # 已建立过主连接的 (user, host, port)，关闭时逐个退出
+        self._masters = set()
+    
+    def _get_workdir(self):
+        """存放ControlMaster套接字和SSH_ASKPASS脚本的临时目录"""
+        with self._lock:
+            if self._workdir is None:
+                self._workdir = tempfile.mkdtemp(prefix='haps_ssh_')
+            return self._workdir
+    
+    def _control_path(self):
+        return os.path.join(self._get_workdir(), '%C')
+    
+    def _askpass_script(self):
+        """从环境变量输出密码的SSH_ASKPASS脚本，密码本身不写入文件"""
+        if os.name == 'nt':
+            path = os.path.join(self._get_workdir(), 'askpass.cmd')
+            content = "@echo off\r\necho %HAPS_SSH_PASSWORD%\r\n"
+        else:
+            path = os.path.join(self._get_workdir(), 'askpass.sh')
+            content = '#!/bin/sh\nprintf \'%s\\n\' "$HAPS_SSH_PASSWORD"\n'
+        if not os.path.exists(path):
+            with open(path, 'w') as f:
+                f.write(content)
+            os.chmod(path, 0o700)
+        return path
+    
+    def command_args(self, target, command):
+        args = [self.ssh_path, '-T', '-p', str(target.port),
+                '-o', 'StrictHostKeyChecking=no',
+                '-o', f'UserKnownHostsFile={os.devnull}',
+                '-o', 'LogLevel=ERROR',
+                '-o', f'ConnectTimeout={self.connect_timeout}']
+        if not target.password:
+            args += ['-o', 'BatchMode=yes']
+        if self.control_master:
+            args += ['-o', 'ControlMaster=auto',
+                     '-o', f'ControlPath={self._control_path()}',
+                     '-o', f'ControlPersist={self.control_persist}']
+            with self._lock:
+                self._masters.add((target.user, target.host, target.port))
+        return args + self.extra_options + [f'{target.user}@{target.host}', command]
+    
+    def command_env(self, target):
+        if not target.password:
+            return None
+        env = dict(os.environ, SSH_ASKPASS=self._askpass_script(), SSH_ASKPASS_REQUIRE='force',
+                   HAPS_SSH_PASSWORD=target.password)
+        # 早于8.4的OpenSSH只在设置了DISPLAY时使用SSH_ASKPASS
+        env.setdefault('DISPLAY', ':0')
+        return env
+    
+    def close(self):
+        """退出所有主连接并删除临时目录"""
+        with self._lock:
+            masters = list(self._masters)
+            self._masters.clear()
+            workdir, self._workdir = self._workdir, None
+        if workdir is None:
+            return
+        control_path = os.path.join(workdir, '%C')
+        for user, host, port in masters:
+            try:
+                subprocess.run(
+                    [self.ssh_path, '-p', str(port), '-o', f'ControlPath={control_path}', '-O', 'exit', f'{user}@{host}'],
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    timeout=5, creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+                )
+            except (OSError, subprocess.SubprocessError):
+                pass
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# 批处理模式下每一步开始/结束时输出的标记行
+BATCH_MARKER = "@@HAPS_STEP"
+BATCH_MARKER_PATTERN = re.compile(rf"^{BATCH_MARKER} (BEGIN|END) (\d+)(?: (-?\d+))?$")
+
+
+def compile_batch_script(commands, command_delay, shell='cmd'):
+    """把多条命令编译为一次远程执行的脚本
+    
+    每一步前后输出 BEGIN/END 标记（END 标记附带返回码），步骤之间保留配置的等待时间，
+    某一步失败时脚本以该步的返回码退出，后续步骤不再执行。
+    shell 为 'cmd' 时生成Windows cmd.exe命令行，为 'sh' 时生成POSIX shell脚本。
+    """
+    parts = []
+    for i, cmd in enumerate(commands, 1):
+        if shell == 'sh':
+            parts.append(f'echo "{BATCH_MARKER} BEGIN {i}"')
+            parts.append(cmd)
+            parts.append('rc=$?')
+            parts.append(f'echo "{BATCH_MARKER} END {i} $rc"')
+            parts.append('[ $rc -eq 0 ] || exit $rc')
+            if i < len(commands) and command_delay > 0:
+                parts.append(f'sleep {command_delay}')
+        else:
+            # 使用延迟变量展开(!errorlevel!)，否则%errorlevel%会在整行解析时被提前展开
+            parts.append(f'echo {BATCH_MARKER} BEGIN {i}')
+            parts.append(cmd)
+            parts.append('set HAPS_RC=!errorlevel!')
+            parts.append(f'echo {BATCH_MARKER} END {i} !HAPS_RC!')
+            # 单行的if会把其后用&连接的所有命令都当作条件成立时执行的部分，必须用括号限定
+            parts.append('(if !HAPS_RC! neq 0 exit /b !HAPS_RC!)')
+            if i < len(commands) and command_delay > 0:
+                # SSH会话没有控制台，timeout命令不可用，用ping实现等待
+                parts.append(f'ping -n {command_delay + 1} 127.0.0.1 >nul')
+    
+    if shell == 'sh':
+        return '; '.join(parts)
+    return 'cmd /s /v:on /c "' + '& '.join(parts) + '"'
+
+
+class BatchOutputParser:
+    """解析批处理脚本输出中的步骤标记，得到每一步的执行结果"""
+    
+    def __init__(self, total):
+        self.total = total
+        self.current = None
+        # 步骤序号 -> 返回码
+        self.results = {}
+    
+    def feed(self, line):
+        """处理一行输出，是标记行时返回 (BEGIN|END, 步骤序号, 返回码)，否则返回None"""
+        match = BATCH_MARKER_PATTERN.match(line.strip())
+        if not match:
+            return None
+        kind, step, code = match.group(1), int(match.group(2)), match.group(3)
+        if kind == 'BEGIN':
+            self.current = step
+            return kind, step, None
+        exit_code = int(code) if code is not None else -1
+        self.results[step] = exit_code
+        self.current = None
+        return kind, step, exit_code
+    
+    def first_failure(self):
+        """返回第一个失败或未完成的步骤序号，全部成功时返回None"""
+        for step in range(1, self.total + 1):
+            if self.results.get(step) != 0:
+                return step
+        return None
+
+
+class ReadinessProbe:
+    """轮询远程状态命令判断设备是否就绪，检测间隔按指数退避增长
+    
+    run_command(command) 返回 (返回码, 输出文本)。配置了pattern时输出匹配即为就绪，
+    否则以返回码为0作为就绪条件。
+    """
+    
+    def __init__(self, run_command, command, pattern='', timeout=60,
+                 initial_interval=0.5, max_interval=5, backoff=2):
+        self.run_command = run_command
+        self.command = command
+        self.pattern = re.compile(pattern) if pattern else None
+        self.timeout = timeout
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+    
+    def wait(self, cancel=None):
+        """等待就绪，返回 (是否就绪, 实际等待秒数, 检测次数)；cancel为CancelToken时被取消后立即返回"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        interval = self.initial_interval
+        attempts = 0
+        
+        while True:
+            attempts += 1
+            try:
+                exit_code, output = self.run_command(self.command)
+            except ssh_errors():
+                exit_code, output = -1, ""
+            if self.pattern is not None:
+                ready = bool(self.pattern.search(output))
+            else:
+                ready = exit_code == 0
+            now = time.monotonic()
+            if ready:
+                return True, now - start, attempts
+            if now >= deadline:
+                return False, now - start, attempts
+            if cancel is None:
+                time.sleep(min(interval, deadline - now))
+            elif cancel.wait(min(interval, deadline - now)):
+                return False, time.monotonic() - start, attempts
+            interval = min(interval * self.backoff, self.max_interval)
+
+
+def parse_error_patterns(items):
+    """解析[ErrorPatterns]配置，返回 [(范围, 名称, 正则)]，正则无效时抛出ValueError
+    
+    键为 <范围>.<名称>，没有范围时适用于所有命令；值为正则表达式。
+    """
+    rules = []
+    for key, value in items:
+        if not value.strip():
+            continue
+        scope, _, name = key.partition('.') if '.' in key else ('all', '', key)
+        try:
+            rules.append((scope.strip().lower(), name.strip() or key, re.compile(value.strip())))
+        except re.error as e:
+            raise ValueError(f"ErrorPatterns.{key} 的正则表达式无效 ({str(e)})")
+    return rules
+
+
+def select_error_patterns(rules, kind, command):
+    """选出适用于该命令的规则，返回 [(名称, 正则)]
+    
+    范围为all时适用于所有命令，为reset/load时适用于该类操作，
+    其他值匹配命令中的某个词，如cfg_project_configure。
+    """
+    words = {word.lower() for word in command.replace('"', ' ').split()}
+    return [(name, pattern) for scope, name, pattern in rules
+            if scope == 'all' or scope == kind or scope in words]
+
+
+# 命令失败后的处理策略: abort(停止) / continue(继续后续命令) / retry(重试，仍失败时停止) / ask(弹出对话框询问)
+FAILURE_POLICIES = ('abort', 'continue', 'retry', 'ask')
+
+# 输出匹配时视为暂时性失败（如许可证被占用），在任何策略下都先重试
+DEFAULT_TRANSIENT_PATTERN = r'(?i)licen[cs]e.*\b(busy|in use|not available|unavailable)\b'
+
+# [Timeouts]中的保留键，其余键为按命令匹配的超时规则
+TIMEOUT_RESERVED_KEYS = ('default', 'remote_kill', 'remote_kill_timeout')
+
+
+def parse_command_timeouts(items):
+    """解析[Timeouts]配置，返回 (默认超时秒数, [(名称, 秒数, 正则)])，格式无效时抛出ValueError
+    
+    规则的值为 "<秒数> <正则表达式>"，按配置顺序使用第一条匹配命令的规则；秒数为0表示不限制。
+    """
+    default = 0.0
+    rules = []
+    for key, value in items:
+        value = value.strip()
+        if key in TIMEOUT_RESERVED_KEYS[1:] or not value:
+            continue
+        seconds, _, pattern = value.partition(' ')
+        try:
+            seconds = float(seconds)
+        except ValueError:
+            raise ValueError(f"Timeouts.{key} 应以超时秒数开头: {value}")
+        if key == 'default':
+            default = seconds
+            continue
+        if not pattern.strip():
+            raise ValueError(f"Timeouts.{key} 缺少匹配命令的正则表达式")
+        try:
+            rules.append((key, seconds, re.compile(pattern.strip())))
+        except re.error as e:
+            raise ValueError(f"Timeouts.{key} 的正则表达式无效 ({str(e)})")
+    return default, rules
+
+
+class CommandPlan:
+    """命令执行计划：步骤列表以及步骤之间的先后依赖
+    
+    配置格式：分号(;)分隔的各组依次执行，同一组内用竖线(|)分隔的命令可以同时执行；
+    另外可以用 "1>3, 2>4" 形式的显式顺序约束（序号从1开始）要求某一步在另一步完成后执行。
+    """
+    
+    def __init__(self, commands, deps):
+        self.commands = commands
+        # deps[i] 为第i步（从0开始）必须等待完成的步骤集合
+        self.deps = deps
+    
+    def __len__(self):
+        return len(self.commands)
+    
+    def is_sequential(self):
+        """每一步都只依赖前一步时为纯串行计划"""
+        return all(self.deps[i] == ({i - 1} if i else set()) for i in range(len(self.commands)))
+    
+    def topological_order(self):
+        """返回满足所有依赖的串行执行顺序（步骤下标）"""
+        order = []
+        done = set()
+        while len(order) < len(self.commands):
+            for i in range(len(self.commands)):
+                if i not in done and self.deps[i] <= done:
+                    order.append(i)
+                    done.add(i)
+                    break
+        return order
+    
+    def ordered_commands(self):
+        return [self.commands[i] for i in self.topological_order()]
+    
+    def map_commands(self, func):
+        """对每条命令做替换（如填入BitFile路径），依赖关系不变"""
+        return CommandPlan([func(cmd) for cmd in self.commands], self.deps)
+
+
+def parse_command_plan(text, order_text=''):
+    """解析命令配置为执行计划，格式错误或依赖成环时抛出ValueError"""
+    commands = []
+    deps = []
+    previous_group = set()
+    for group_text in text.split(';'):
+        group = set()
+        for cmd in group_text.split('|'):
+            cmd = cmd.strip()
+            if not cmd:
+                continue
+            group.add(len(commands))
+            commands.append(cmd)
+            deps.append(set(previous_group))
+        if group:
+            previous_group = group
+    
+    for edge in order_text.split(','):
+        edge = edge.strip()
+        if not edge:
+            continue
+        try:
+            before, after = (int(part) - 1 for part in edge.split('>'))
+        except ValueError:
+            raise ValueError(f"无效的顺序约束: {edge}")
+        if not (0 <= before < len(commands) and 0 <= after < len(commands)) or before == after:
+            raise ValueError(f"顺序约束引用了不存在的步骤: {edge}")
+        deps[after].add(before)
+    
+    # 检查依赖是否成环
+    done = set()
+    while len(done) < len(commands):
+        ready = [i for i in range(len(commands)) if i not in done and deps[i] <= done]
+        if not ready:
+            raise ValueError("顺序约束存在循环依赖")
+        done.update(ready)
+    
+    return CommandPlan(commands, deps)
+
+
+class ConfproSession:
+    """在一条长期保持的SSH通道上运行交互式confpro，通过stdin逐条发送命令
+    
+    命令完成的判断方式二选一：配置了done_command时，每条命令后追加一条输出结束标记的命令，
+    读到标记行即认为完成；否则等待输出末尾出现匹配prompt_pattern的提示符。
+    交互模式下拿不到每条命令的返回码，输出中出现error_pattern即视为该命令失败。
+    """
+    
+    DONE_MARKER = "@@HAPS_DONE"
+    
+    def __init__(self, transport, confpro_path, start_args='', prompt_pattern=r'confpro>\s*$',
+                 done_command='', error_pattern=r'(?i)\berror\b', use_pty=False):
+        self.transport = transport
+        self.confpro_path = confpro_path
+        self.start_args = start_args
+        self.prompt_re = re.compile(prompt_pattern)
+        self.done_command = done_command
+        self.error_re = re.compile(error_pattern) if error_pattern else None
+        self.use_pty = use_pty
+        self.channel = None
+        self._closed = False
+        # 会话占用的SSH连接是否已归还连接池，通道可能先由run()关闭，归还只能进行一次
+        self._released = False
+        self._release_lock = threading.Lock()
+        # 同一会话同一时间只能执行一条命令
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self._sequence = 0
+        self._buffer = ""
+    
+    def start(self, on_line, timeout=120):
+        """启动confpro并等待其就绪"""
+        self.channel = self.transport.open_session(timeout=timeout)
+        if self.use_pty:
+            self.channel.get_pty(width=200)
+        self.channel.exec_command(f'"{self.confpro_path}" {self.start_args}'.strip())
+        if self.done_command:
+            ready, _ = self._send_and_wait("", on_line, timeout)
+        else:
+            ready, _ = self._wait_ready(None, on_line, timeout)
+        if not ready:
+            raise load_paramiko().SSHException("confpro会话启动超时或已退出")
+        self.last_used = time.monotonic()
+    
+    def is_alive(self):
+        return (not self._closed and self.channel is not None and not self.channel.closed
+                and not self.channel.exit_status_ready() and self.transport.is_active())
+    
+    def run(self, command, on_line, timeout=3600):
+        """执行一条命令，返回是否成功（未超时且输出中没有错误）"""
+        ready, error_seen = self._send_and_wait(command, on_line, timeout)
+        self.last_used = time.monotonic()
+        if not ready:
+            # 超时或进程已退出，会话状态未知，不再复用
+            self.close()
+        return ready and not error_seen
+    
+    def close(self):
+        """退出confpro并关闭通道，首次关闭时返回True"""
+        if self._closed:
+            return False
+        self._closed = True
+        if self.channel is None:
+            return True
+        try:
+            if not self.channel.closed:
+                self.channel.sendall("exit\n")
+        except ssh_errors():
+            pass
+        self.channel.close()
+        return True
+    
+    def detach_transport(self):
+        """返回会话占用的SSH连接，只在第一次调用时返回，之后返回None"""
+        with self._release_lock:
+            if self._released:
+                return None
+            self._released = True
+            return self.transport
+    
+    def _send_and_wait(self, command, on_line, timeout):
+        marker = None
+        payload = f"{command}\n" if command else ""
+        if self.done_command:
+            self._sequence += 1
+            marker = f"{self.DONE_MARKER} {self._sequence}"
+            payload += self.done_command.replace("{marker}", marker) + "\n"
+        self.channel.sendall(payload)
+        return self._wait_ready(marker, on_line, timeout, echo=command)
+    
+    def _wait_ready(self, marker, on_line, timeout, echo=None):
+        """读取输出直到命令完成，返回 (是否完成, 是否出现错误输出)"""
+        deadline = time.monotonic() + timeout
+        error_seen = False
+        channel = self.channel
+        
+        while time.monotonic() < deadline:
+            got_data = False
+            if not channel.recv_ready() and not channel.recv_stderr_ready():
+                # 等待任一输出有数据或通道关闭，不在没有输出的stderr上阻塞
+                select.select([channel], [], [], min(0.2, max(0.0, deadline - time.monotonic())))
+            for ready, receive in ((channel.recv_ready, channel.recv),
+                                   (channel.recv_stderr_ready, channel.recv_stderr)):
+                while ready():
+                    data = receive(32768)
+                    if not data:
+                        break
+                    got_data = True
+                    self._buffer += data.decode(errors='replace').replace('\r', '')
+            
+            # 处理完整的行
+            while '\n' in self._buffer:
+                line, self._buffer = self._buffer.split('\n', 1)
+                stripped = line.strip()
+                # 标记前可能带有未换行的提示符
+                if marker and stripped.endswith(marker):
+                    return True, error_seen
+                # 跳过终端回显的命令和结束标记命令
+                if not stripped or stripped == echo or (marker and marker in stripped):
+                    continue
+                if not marker and self.prompt_re.search(line):
+                    continue
+                if self.error_re and self.error_re.search(stripped):
+                    error_seen = True
+                on_line(stripped)
+            
+            # 提示符通常不以换行结尾，检查未完成的行
+            if not marker and self.prompt_re.search(self._buffer):
+                self._buffer = ""
+                return True, error_seen
+            
+            if (channel.exit_status_ready() or channel.eof_received or channel.closed) and not got_data:
+                return False, error_seen
+        
+        return False, error_seen
+
+
+
+
+class HapsEngine:
+    """重置/加载操作的执行引擎，持有配置、SSH连接池和confpro会话
+    
+    on_log(message) 接收每条日志，on_status(status) 接收状态更新，
+    on_ask_continue() 在命令失败时决定是否继续执行后续命令（未提供时停止执行）。
+    """
+
+    def __init__(self, config_file=DEFAULT_CONFIG_FILE, on_log=None, on_status=None, on_ask_continue=None):
+        self.config_file = config_file
+        self.on_log = on_log or print
+        self.on_status = on_status
+        self.on_ask_continue = on_ask_continue
+        
+        # 初始化配置变量
+        self.config = None
+        
+        # 加载或创建配置文件
+        self.config = self.load_or_create_config()
+        
+        # SSH连接池，在命令之间保持已认证的连接
+        self.ssh_pool = SSHConnectionPool(
+            idle_timeout=self.get_int_config_value('Connection', 'pool_idle_timeout', 300)
+        )
+        
+        # 执行命令的传输方式，按[Connection] transport和相关配置创建，配置改变时重建
+        self.command_transport = None
+        self.command_transport_key = None
+        self.transport_lock = threading.Lock()
+        
+        # 每台主机同时运行的操作数限制，按 (host, port) 创建
+        self.host_semaphores = {}
+        self.host_semaphores_lock = threading.Lock()
+        
+        # 板卡状态缓存和文件哈希索引，第一次加载时创建
+        self.board_cache = None
+        self.hash_index = None
+        self.hash_index_lock = threading.Lock()
+        
+        # 常驻的confpro交互会话，按 (host, port, user, confpro_path) 复用
+        self.confpro_sessions = {}
+        self.sessions_lock = threading.Lock()
+        
+        # 最近操作的分阶段耗时，可导出为JSON
+        self.timing_history = collections.deque(maxlen=100)
+        # 正在执行的操作，界面据此显示进度和预计剩余时间
+        self.active_timings = []
+        self.active_timings_lock = threading.Lock()
+        # 正在执行的操作的取消令牌，cancel_operations()逐个取消
+        self.cancel_tokens = set()
+        self.cancel_tokens_lock = threading.Lock()
+        # 按[Timeouts]中断超时的命令
+        self.watchdog = CommandWatchdog()
+        
+        # 操作历史数据库，第一次使用时打开，打开失败后不再尝试
+        self.history = None
+        self.history_failed = False
+        self.history_lock = threading.Lock()
+    
+    def log(self, message):
+        """输出日志，多主机执行时加上主机名前缀，可在任意线程调用"""
+        context = current_operation.get()
+        if context is not None and context.log_prefix:
+            message = f"{context.log_prefix}{message}"
+        self.on_log(message)
+        request = current_request.get()
+        if request is not None and request.on_log is not None:
+            request.on_log(message)
+    
+    def set_status(self, status):
+        """更新状态并记录到日志"""
+        if self.on_status is not None:
+            self.on_status(status)
+        self.log(status)
+    
+    def load_or_create_config(self):
+        """加载现有配置文件或创建新的默认配置文件"""
+        config = configparser.ConfigParser()
+        
+        # 如果配置文件存在，加载它
+        if os.path.exists(self.config_file):
+            config.read(self.config_file)
+            # 检查并修复可能的配置缺失
+            self.fix_config(config)
+            return config
+        
+        # 创建默认配置
+        config['Connection'] = {
+            'confpro_path': r"C:\Synopsys\protocomp-rtQ-2020.03\bin64\mbin\confpro.exe",
+            'host': "10.126.8.230",
+            'port': "22",  # SSH默认端口
+            'user': "dell",
+            'password': "Bsp@123",
+            'bitfile_info_path': r"D:\tools\bitfile.info",
+            'pool_idle_timeout': "300",  # SSH连接空闲保持时间(秒)，0表示每条命令后关闭
+            # 每隔keepalive_interval秒发送keepalive，连续keepalive_count次无响应时断开，0表示不发送
+            'keepalive_interval': "15",
+            'keepalive_count': "3",
+            # 连接失败或中断后重新连接的次数，间隔从reconnect_interval秒开始加倍(带随机抖动)，最长reconnect_max_interval秒
+            'reconnect_attempts': "4",
+            'reconnect_interval': "1",
+            'reconnect_max_interval': "15",
+            # 执行命令的传输方式: paramiko(默认) / openssh(调用系统ssh命令) / local(在本机执行)
+            'transport': "paramiko"
+        }
+        
+        # transport为openssh时使用的ssh命令，control_master为1时同一主机的命令复用一个连接(不支持Windows)
+        config['OpenSSH'] = {
+            'ssh_path': 'ssh',
+            'control_master': '1',
+            'control_persist': '300',  # 最后一条命令结束后主连接保持的时间(秒)
+            'connect_timeout': '10',
+            'extra_options': ''  # 附加的ssh参数，如 -i D:/keys/haps_rsa
+        }
+        
+        # 配置重置命令，使用分号分隔多条命令
+        config['ResetCommands'] = {
+            # reset master的两条指令
+            'haps_master': 'emu:8 cfg_reset_pulse FB1_A;emu:8 cfg_reset_pulse FB1_D',
+            # reset slave的两条指令
+            'haps_slave': 'emu:8 cfg_reset_pulse FB1_B;emu:8 cfg_reset_pulse FB1_C',
+            # reset haps的四条指令
+            'haps': 'emu:8 cfg_reset_pulse FB1_A;emu:8 cfg_reset_pulse FB1_D;emu:8 cfg_reset_pulse FB1_B;emu:8 cfg_reset_pulse FB1_C'
+        }
+        
+        # 配置加载命令，支持多条命令，用分号分隔
+        config['LoadCommands'] = {
+            'default': 'emu:8 cfg_project_configure "{bitfile_path}"'
+        }
+        
+        # 命令间的等待时间(秒)
+        config['Timing'] = {
+            'command_delay': '2'
+        }
+        
+        # 就绪检测配置：设置了command时用轮询代替固定的命令间等待时间
+        config['Readiness'] = {
+            # 远程状态命令，{confpro_path}会被替换为confpro路径，如: "{confpro_path}" emu:8 cfg_status
+            'command': '',
+            # 输出匹配该正则即认为就绪，为空时以返回码0为就绪
+            'pattern': '',
+            'timeout': '60',
+            'initial_interval': '0.5',
+            'max_interval': '5',
+            'backoff': '2'
+        }
+        
+        # 多主机清单，键为主机名称，值为 [user@]host[:port]，未指定的用户名、端口和密码使用Connection中的配置
+        config['Hosts'] = {}
+        
+        # 多主机并行执行配置：同时操作的最大主机数，每台主机同时运行的最大操作数
+        config['FanOut'] = {
+            'max_concurrency': '32',
+            'per_host_limit': '1'
+        }
+        
+        # 日志显示配置：每秒最多刷新max_fps次，待显示日志超过max_pending行时按overflow策略丢弃
+        config['Log'] = {
+            'max_fps': '20',
+            'max_pending': '20000',
+            # drop_oldest(丢弃最早的日志) / drop_newest(丢弃新日志)
+            'overflow': 'drop_oldest',
+            # 界面上保留的最多日志行数，更早的日志可在历史日志窗口中查看
+            'max_lines': '5000',
+            # 完整日志文件（相对路径基于配置文件所在目录），超过file_max_bytes后滚动
+            'file': 'haps_session.log',
+            'file_max_bytes': '10485760',
+            'file_backup_count': '5'
+        }
+        
+        # 操作历史：每次重置/加载及每条命令的耗时和结果记录到SQLite数据库，用于预计耗时和耗时统计
+        config['History'] = {
+            'enabled': '1',
+            'path': '',  # 数据库文件路径，为空时使用配置文件所在目录下的haps_history.db
+            'retention_days': '180',  # 记录保留天数，0表示不清理
+            'stats_days': '30'  # 耗时统计包含的最近天数
+        }
+        
+        # 板卡状态缓存：记录每台主机最后一次成功加载的工程内容哈希，再次加载相同内容且期间未重置时跳过
+        config['BoardCache'] = {
+            'enabled': '1',
+            'path': '',  # 状态文件路径，为空时使用配置文件所在目录下的haps_board_state.json
+            # 文件哈希索引，只重新计算修改时间或大小有变化的文件，为空时使用配置文件所在目录下的haps_hash_index.json
+            'hash_index': '',
+            'hash_workers': '4'  # 同时计算哈希的文件数
+        }
+        
+        # 常驻实例：enabled为1时监听本机端口，之后启动的程序和命令行把重置/加载请求转发给已运行的实例
+        config['Resident'] = {
+            'enabled': '1'
+        }
+        
+        # 后台执行配置，可同时运行的操作数量
+        config['Execution'] = {
+            'max_workers': '4',
+            # 执行方式: per_command(每条命令单独执行) / batch(整个序列编译为一次远程执行)
+            # / session(保持一个交互式confpro进程，逐条发送命令)
+            'mode': 'per_command',
+            # 远程主机的命令解释器: cmd(Windows) / sh(Linux)
+            'remote_shell': 'cmd',
+            # 命令计划中可同时执行的最大步骤数（通过同一SSH连接的多个通道）
+            'max_parallel_steps': '4'
+        }
+        
+        # 命令之间的显式顺序约束，键为 reset.<重置类型> 或 load.default，值如: 1>3, 2>4
+        config['CommandOrder'] = {}
+        
+        # 错误规则：命令输出匹配时立即结束该命令并视为失败，键为 <范围>.<名称>，值为正则表达式
+        # 范围为all、reset、load或命令中的词，如: load.cannot_open = (?i)cannot open .*project\.conf
+        config['ErrorPatterns'] = {}
+        
+        # 每条命令的超时(秒)：超时后关闭通道，记为超时失败，0表示不限制
+        # 其他键为按命令匹配的规则，值为 "<秒数> <正则表达式>"，如: configure = 3600 cfg_project_configure
+        config['Timeouts'] = {
+            'default': '0',
+            # 超时后在远程主机上执行的命令，用于结束挂起的confpro进程，如: taskkill /F /IM confpro.exe
+            'remote_kill': '',
+            'remote_kill_timeout': '30'
+        }
+        
+        # 命令失败后的处理策略，可用 reset.<重置类型> 单独配置
+        # abort(停止后续命令) / continue(继续执行后续命令) / retry(重试失败的命令，仍失败时停止) / ask(弹出对话框询问)
+        config['FailurePolicy'] = {
+            'reset': 'abort',
+            'load': 'abort',
+            # 重试次数和重试间隔(秒)，每次重试间隔乘以backoff，最长max_retry_interval
+            'retries': '2',
+            'retry_interval': '2',
+            'backoff': '2',
+            'max_retry_interval': '30',
+            # 连接中断或输出匹配该正则时视为暂时性失败，在任何策略下都先重试
+            'transient_pattern': DEFAULT_TRANSIENT_PATTERN
+        }
+        
+        config['BitFilePaths'] = {
+            'path1': r"D:\zxl\mc20l\mc20l_fpga_tag0121_va_rmii_2f_0212\prj\designs\project.conf",
+            'path2': r"D:\zxl\mc20l\mc20l_fpga_tag0121_va_rmii_2f_0219\prj\designs\project.conf",
+            'path3': r"D:\zxl\mc20l\rtl0p8\mc20l_fpga_tag0301_va_2f_rmii_0307\prj\designs\project.conf",
+            'default_index': '1'
+        }
+        
+        # 交互式confpro会话配置（执行方式为session时使用）
+        config['Session'] = {
+            # 启动confpro交互模式时附加的参数
+            'start_args': '',
+            # 提示符的正则表达式，出现即认为上一条命令已完成
+            'prompt_pattern': r'confpro>\s*$',
+            # 非空时每条命令后追加发送该命令来输出结束标记，{marker}为标记占位符，如: puts "{marker}"
+            'done_command': '',
+            # 输出匹配该正则时认为命令失败
+            'error_pattern': r'(?i)\berror\b',
+            'use_pty': '0',
+            'startup_timeout': '120',
+            'command_timeout': '3600'
+        }
+        
+        # 保存默认配置
+        with open(self.config_file, 'w') as f:
+            config.write(f)
+            
+        return config
+    
+    def fix_config(self, config):
+        """检查并修复配置文件中可能缺失的部分或无效值"""
+        # 检查Timing部分和command_delay配置
+        if 'Timing' not in config:
+            config['Timing'] = {}
+        
+        timing_updated = False
+        if 'command_delay' not in config['Timing'] or not config['Timing']['command_delay']:
+            config['Timing']['command_delay'] = '2'
+            timing_updated = True
+        
+        # 确保重置命令部分存在
+        if 'ResetCommands' not in config:
+            config['ResetCommands'] = {}
+            
+        # 设置默认重置命令（如果不存在）
+        default_commands = {
+            'haps_master': 'emu:8 cfg_reset_pulse FB1_A;emu:8 cfg_reset_pulse FB1_D',
+            'haps_slave': 'emu:8 cfg_reset_pulse FB1_B;emu:8 cfg_reset_pulse FB1_C',
+            'haps': 'emu:8 cfg_reset_pulse FB1_A;emu:8 cfg_reset_pulse FB1_D;emu:8 cfg_reset_pulse FB1_B;emu:8 cfg_reset_pulse FB1_C'
+        }
+        
+        commands_updated = False
+        for cmd_name, cmd_value in default_commands.items():
+            if cmd_name not in config['ResetCommands'] or not config['ResetCommands'][cmd_name]:
+                config['ResetCommands'][cmd_name] = cmd_value
+                commands_updated = True
+        
+        # 确保加载命令部分存在
+        if 'LoadCommands' not in config:
+            config['LoadCommands'] = {}
+            commands_updated = True
+            
+        # 设置默认加载命令（如果不存在）
+        if 'default' not in config['LoadCommands'] or not config['LoadCommands']['default']:
+            config['LoadCommands']['default'] = 'emu:8 cfg_project_configure "{bitfile_path}"'
+            commands_updated = True
+        
+        # 只有在配置确实有更新且self.config已初始化时才保存
+        if (timing_updated or commands_updated) and self.config is not None:
+            # 将修复后的配置写回配置对象
+            self.config = config
+            self.save_config()
+            self.log("配置修复：更新了缺失或无效的配置项")
+        
+        return config
+    
+    def get_int_config_value(self, section, key, default=0):
+        """安全地获取整数类型的配置值"""
+        try:
+            value_str = self.get_config_value(section, key, str(default))
+            return int(value_str.strip())
+        except ValueError:
+            self.log(f"警告：配置项 {section}.{key} 的值 '{value_str}' 不是有效的整数，使用默认值 {default}")
+            return default
+    
+    def get_float_config_value(self, section, key, default=0.0, minimum=None):
+        """安全地获取数字类型的配置值，指定minimum时不小于该值"""
+        try:
+            value_str = self.get_config_value(section, key, str(default))
+            value = float(value_str.strip())
+        except ValueError:
+            self.log(f"警告：配置项 {section}.{key} 的值 '{value_str}' 不是有效的数字，使用默认值 {default}")
+            value = default
+        return value if minimum is None else max(minimum, value)
+    
+    def save_config(self):
+        """保存配置到文件"""
+        if self.config is None:
+            self.log("警告：配置未初始化，无法保存")
+            return
+            
+        with open(self.config_file, 'w') as f:
+            self.config.write(f)
+        self.log(f"配置已保存到 {self.config_file}")
+    
+    def get_config_value(self, section, key, default=None):
+        """获取配置值，带默认值"""
+        try:
+            return self.config[section][key]
+        except:
+            return default
+    
+    def get_execution_mode(self):
+        """命令执行方式，请求中指定时优先"""
+        request = current_request.get()
+        if request is not None and request.mode:
+            return request.mode
+        return self.get_config_value('Execution', 'mode', 'per_command')
+    
+    def get_default_target(self):
+        """Connection中配置的主机"""
+        host = self.get_config_value('Connection', 'host')
+        return HostTarget(
+            host,
+            host,
+            self.get_int_config_value('Connection', 'port', 22),
+            self.get_config_value('Connection', 'user'),
+            self.get_config_value('Connection', 'password')
+        )
+    
+    def get_current_target(self):
+        """当前操作的目标主机，不在多主机操作中时为Connection中配置的主机"""
+        context = current_operation.get()
+        if context is not None:
+            return context.target
+        return self.get_default_target()
+    
+    def get_host_inventory(self):
+        """读取[Hosts]中的主机清单"""
+        if 'Hosts' not in self.config:
+            return []
+        try:
+            return parse_host_inventory(
+                self.config['Hosts'].items(),
+                self.get_config_value('Connection', 'user'),
+                self.get_config_value('Connection', 'password'),
+                self.get_int_config_value('Connection', 'port', 22)
+            )
+        except ValueError as e:
+            self.log(f"主机清单配置错误: {str(e)}")
+            return []
+    
+    def create_ssh_client(self, target=None, quiet=False):
+        """从连接池获取目标主机（默认为当前目标主机）已认证的SSH连接，失败时记录原因并返回None"""
+        try:
+            return self.connect_ssh(target, quiet)
+        except TransportError:
+            return None
+    
+    def connect_ssh(self, target=None, quiet=False):
+        """从连接池获取已认证的SSH连接，quiet为True时不记录日志
+        
+        无法连接时按[Connection] reconnect_attempts重新连接，仍然失败或认证失败等重试也无法解决时
+        抛出ConnectFailedError。
+        """
+        host, port, user, password = (target or self.get_current_target())[1:]
+        log = (lambda message: None) if quiet else self.log
+        
+        # 空闲保持时间和keepalive可能在配置界面中被修改
+        self.ssh_pool.idle_timeout = self.get_int_config_value('Connection', 'pool_idle_timeout', 300)
+        self.ssh_pool.keepalive_interval = self.get_int_config_value('Connection', 'keepalive_interval', 15)
+        self.ssh_pool.keepalive_count = self.get_int_config_value('Connection', 'keepalive_count', 3)
+        
+        try:
+            ssh = load_paramiko()
+        except ImportError as e:
+            log(f"无法导入paramiko，请先安装: pip install paramiko ({str(e)})")
+            raise ConnectFailedError(f"无法导入paramiko: {str(e)}") from e
+        
+        attempts = max(0, self.get_int_config_value('Connection', 'reconnect_attempts', 4))
+        for attempt in range(attempts + 1):
+            try:
+                with timing_span('connect', f"{host}:{port}"):
+                    transport, reused = self.ssh_pool.acquire(host, port, user, password)
+                if reused:
+                    log(f"复用已有连接 {host}:{port}")
+                else:
+                    log(f"成功连接到 {host}:{port}")
+                return transport
+            except ssh.AuthenticationException as e:
+                log("连接失败: 认证失败，请检查用户名和密码")
+                raise ConnectFailedError(f"{host}:{port} 认证失败") from e
+            except ssh.SSHException as e:
+                error = f"SSH错误: {str(e)}"
+            except OSError as e:
+                error = f"连接失败: 无法连接到 {host}:{port} ({str(e)})"
+            except Exception as e:
+                log(f"连接错误: {str(e)}")
+                raise ConnectFailedError(f"连接错误: {str(e)}") from e
+            # 网络短暂中断时按指数退避重新连接
+            if attempt >= attempts or self.is_cancelled():
+                break
+            delay = self.get_reconnect_delay(attempt)
+            log(f"{error}，{delay:.1f} 秒后第 {attempt + 1}/{attempts} 次重新连接")
+            with timing_span('reconnect', f"{host}:{port}"):
+                if self.sleep(delay):
+                    break
+        log(error)
+        # 已按重新连接的配置重试过，不再由失败处理策略重试
+        raise ConnectFailedError(f"无法连接到 {host}:{port}")
+    
+    def get_reconnect_delay(self, attempt):
+        """第attempt+1次重新连接前的等待秒数：指数增长到最长间隔，再随机取其50%~100%，避免多台主机同时重连"""
+        interval = self.get_float_config_value('Connection', 'reconnect_interval', 1, minimum=0.0)
+        max_interval = self.get_float_config_value('Connection', 'reconnect_max_interval', 15, minimum=0.0)
+        delay = min(interval * 2 ** attempt, max_interval)
+        return delay * random.uniform(0.5, 1.0)
+    
+    def create_command_transport(self, name):
+        """按名称创建传输方式，名称无效时抛出ValueError"""
+        if name == 'paramiko':
+            return ParamikoTransport(self.connect_ssh, self.ssh_pool)
+        if name == 'openssh':
+            return OpenSSHTransport(
+                ssh_path=self.get_config_value('OpenSSH', 'ssh_path', 'ssh') or 'ssh',
+                control_master=self.get_config_value('OpenSSH', 'control_master', '1').strip() != '0',
+                control_persist=self.get_int_config_value('OpenSSH', 'control_persist', 300),
+                connect_timeout=self.get_int_config_value('OpenSSH', 'connect_timeout', 10),
+                extra_options=self.get_config_value('OpenSSH', 'extra_options', '')
+            )
+        if name == 'local':
+            return LocalTransport()
+        raise ValueError(f"未知的传输方式: {name}，可选 paramiko、openssh、local")
+    
+    def get_command_transport(self):
+        """返回[Connection] transport配置的传输方式，配置改变时关闭旧的并重新创建"""
+        name = self.get_config_value('Connection', 'transport', 'paramiko').strip() or 'paramiko'
+        key = (name,) + tuple(
+            self.get_config_value('OpenSSH', option, '')
+            for option in ('ssh_path', 'control_master', 'control_persist', 'connect_timeout', 'extra_options')
+        ) if name == 'openssh' else (name,)
+        with self.transport_lock:
+            if self.command_transport is None or self.command_transport_key != key:
+                transport = self.create_command_transport(name)
+                if self.command_transport is not None:
+                    self.command_transport.close()
+                self.command_transport, self.command_transport_key = transport, key
+            return self.command_transport
+    
+    def get_error_patterns(self, command):
+        """适用于该命令的错误规则 [(名称, 正则)]，配置无效时记录日志并返回空列表"""
+        if 'ErrorPatterns' not in self.config:
+            return []
+        try:
+            rules = parse_error_patterns(self.config['ErrorPatterns'].items())
+        except ValueError as e:
+            self.log(f"错误规则配置错误: {str(e)}，本次不检查输出")
+            return []
+        timing = current_timing.get()
+        return select_error_patterns(rules, timing.kind if timing is not None else None, command)
+    
+    def get_command_timeout(self, command):
+        """按[Timeouts]返回命令的超时秒数，0表示不限制，配置无效时记录日志并返回0"""
+        try:
+            default, rules = parse_command_timeouts(self.config['Timeouts'].items() if 'Timeouts' in self.config else [])
+        except ValueError as e:
+            self.log(f"超时配置错误: {str(e)}，本次不限制命令的执行时间")
+            return 0
+        for _, seconds, pattern in rules:
+            if pattern.search(command):
+                return seconds
+        return default
+    
+    def get_failure_policy(self):
+        """当前操作的失败处理策略，按 reset.<重置类型>、reset/load 的顺序查找，未配置时为abort"""
+        timing = current_timing.get()
+        kind = timing.kind if timing is not None else None
+        keys = []
+        if kind == 'reset' and timing.subject:
+            keys.append(f"reset.{timing.subject}")
+        if kind:
+            keys.append(kind)
+        for key in keys:
+            policy = self.get_config_value('FailurePolicy', key, '').strip().lower()
+            if not policy:
+                continue
+            if policy not in FAILURE_POLICIES:
+                self.log(f"警告：配置项 FailurePolicy.{key} 的值 '{policy}' 无效，按 abort 处理")
+                return 'abort'
+            return policy
+        return 'abort'
+    
+    def get_retry_settings(self):
+        """返回 (重试次数, 首次重试间隔, 间隔倍数, 最长间隔)"""
+        retries = max(0, self.get_int_config_value('FailurePolicy', 'retries', 2))
+        return retries, self.get_float_config_value('FailurePolicy', 'retry_interval', 2, minimum=0.0), \
+            self.get_float_config_value('FailurePolicy', 'backoff', 2, minimum=1.0), \
+            self.get_float_config_value('FailurePolicy', 'max_retry_interval', 30, minimum=0.0)
+    
+    def get_transient_pattern(self):
+        """暂时性失败的输出正则，未配置或无效时返回None"""
+        pattern = self.get_config_value('FailurePolicy', 'transient_pattern', DEFAULT_TRANSIENT_PATTERN).strip()
+        if not pattern:
+            return None
+        try:
+            return re.compile(pattern)
+        except re.error as e:
+            self.log(f"警告：FailurePolicy.transient_pattern 正则表达式无效 ({str(e)})，不识别暂时性失败")
+            return None
+    
+    def should_retry(self, step, attempt, transient, target):
+        """第attempt次重试前调用：策略为retry或失败是暂时性的且未超过重试次数时，等待退避间隔后返回True"""
+        timing = current_timing.get()
+        if self.is_cancelled() or (timing is not None and timing.fatal_error):
+            return False
+        if not transient and self.get_failure_policy() != 'retry':
+            return False
+        retries, interval, backoff, max_interval = self.get_retry_settings()
+        if attempt > retries:
+            if retries:
+                self.log(f"{target}已重试 {retries} 次仍然失败")
+            return False
+        delay = min(interval * backoff ** (attempt - 1), max_interval)
+        reason = "暂时性失败" if transient else "执行失败"
+        self.log(f"{target}{reason}，{delay:g} 秒后第 {attempt}/{retries} 次重试")
+        self.set_status(f"{delay:g} 秒后重试{target}...")
+        if timing is not None:
+            timing.record_step(step, retries=attempt)
+        with timing_span('retry', f"第{step}步第{attempt}次重试"):
+            return not self.sleep(delay)
+    
+    def should_reconnect(self, step, reconnects, outcome, target):
+        """执行期间连接中断时返回True，调用方重新连接后从该步骤继续执行，不计入失败重试次数
+        
+        reconnects为该次中断后的累计次数，超过[Connection] reconnect_attempts时按普通失败处理。
+        """
+        if not outcome.get('disconnected') or self.is_cancelled():
+            return False
+        if reconnects > max(0, self.get_int_config_value('Connection', 'reconnect_attempts', 4)):
+            return False
+        self.log(f"{target}执行期间连接中断，重新连接后从该步骤继续执行")
+        timing = current_timing.get()
+        if timing is not None:
+            timing.record_step(step, reconnects=reconnects)
+        if reconnects > 1:
+            # 重新连接后很快又中断，等待一段时间再继续
+            with timing_span('reconnect', f"第{step}步"):
+                return not self.sleep(self.get_reconnect_delay(reconnects - 2))
+        return True
+    
+    def execute_step(self, step, command, full_command, target, line_handler=None):
+        """执行一条confpro命令，连接中断时重新连接后重新执行，其他失败按失败处理策略重试，返回最终是否成功"""
+        attempt = 0
+        reconnects = 0
+        while True:
+            outcome = {}
+            with step_span(step, command):
+                success = self.execute_remote_command(full_command, line_handler=line_handler, outcome=outcome)
+            if success:
+                return True
+            if outcome.get('disconnected'):
+                reconnects += 1
+                if self.should_reconnect(step, reconnects, outcome, target):
+                    continue
+            attempt += 1
+            if not self.should_retry(step, attempt, outcome.get('transient', False), target):
+                return False
+    
+    def execute_remote_command(self, command, line_handler=None, timeout=None, interrupt=None, outcome=None):
+        """通过配置的传输方式执行远程命令，line_handler用于自定义处理每行标准输出
+        
+        输出匹配[ErrorPatterns]中的规则时立即关闭通道，命令视为失败。
+        timeout为None时按[Timeouts]确定超时，超时后由看门狗关闭通道；
+        interrupt为调用方创建的CommandInterrupt时，可在返回后检查中断原因。
+        outcome为字典时，连接错误或输出匹配暂时性失败时写入 outcome['transient'] = True，
+        执行期间连接中断时同时写入 outcome['disconnected'] = True。
+        """
+        if outcome is None:
+            outcome = {}
+        handle_line = line_handler or self.log
+        cancel = current_cancel.get()
+        if cancel is not None and cancel.cancelled:
+            return False
+        self.set_status(f"正在执行命令: {command}")
+        patterns = self.get_error_patterns(command)
+        transient_re = self.get_transient_pattern()
+        if timeout is None:
+            timeout = self.get_command_timeout(command)
+        if interrupt is None:
+            interrupt = CommandInterrupt()
+        matched = []
+        
+        def check_line(line):
+            if transient_re is not None and transient_re.search(line):
+                outcome['transient'] = True
+            for name, pattern in patterns:
+                if pattern.search(line):
+                    if interrupt.interrupt(f"输出匹配错误规则 {name}"):
+                        matched.append((name, line))
+                    return
+        
+        def on_stdout(line):
+            handle_line(line.strip())
+            if not interrupt.interrupted:
+                check_line(line)
+        
+        def on_stderr(line):
+            if line.strip():
+                self.log(f"命令错误输出: {line.strip()}")
+            if not interrupt.interrupted:
+                check_line(line)
+        
+        try:
+            transport = self.get_command_transport()
+            # 操作被取消或超时时关闭通道或结束进程
+            with cancel.guard(interrupt) if cancel is not None else contextlib.nullcontext(), \
+                    self.watchdog.watching(interrupt, timeout, f"命令超过 {timeout:g} 秒未完成"):
+                exit_status = transport.run(
+                    self.get_current_target(),
+                    command,
+                    on_stdout=on_stdout,
+                    on_stderr=on_stderr,
+                    interrupt=interrupt
+                )
+        except ValueError as e:
+            self.set_status(f"传输方式配置错误: {str(e)}")
+            return False
+        except ssh_errors() as e:
+            if interrupt.timed_out:
+                # 启动命令时超时，通道已被关闭
+                self.handle_command_timeout(command, interrupt.reason, current_step.get())
+            else:
+                self.set_status(f"命令执行错误: {str(e)}")
+                # 连接中断等传输错误通常是暂时的，认证失败等重试也无法解决
+                outcome['transient'] = not isinstance(e, ConnectFailedError)
+                timing = current_timing.get()
+                if isinstance(e, ConnectFailedError) and timing is not None:
+                    timing.fatal_error = str(e)
+                if isinstance(e, ConnectionLostError):
+                    outcome['disconnected'] = True
+            return False
+        
+        # 在命令步骤中执行时把返回码记入步骤记录
+        step, timing = current_step.get(), current_timing.get()
+        if interrupt.timed_out:
+            self.handle_command_timeout(command, interrupt.reason, step)
+            return False
+        if cancel is not None and cancel.cancelled and not matched:
+            self.set_status(f"命令已取消: {command}")
+            return False
+        if matched:
+            name, line = matched[0]
+            self.log(f"输出匹配错误规则 {name}，已提前结束命令: {line.strip()}")
+            self.set_status(f"命令执行失败 (匹配错误规则 {name}): {command}")
+            if step is not None and timing is not None:
+                timing.record_step(step, error_rule=name)
+            return False
+        if step is not None and timing is not None:
+            timing.record_step(step, exit_code=exit_status)
+        
+        if exit_status == 0:
+            self.set_status(f"命令执行成功: {command}")
+            return True
+        else:
+            self.set_status(f"命令执行失败 (返回码: {exit_status}): {command}")
+            return False
+    
+    def handle_command_timeout(self, command, reason, step=None):
+        """记录超时的命令，配置了[Timeouts] remote_kill时在远程主机上结束挂起的confpro"""
+        self.log(f"{reason}，已中断: {command}")
+        self.set_status(f"命令执行超时: {command}")
+        if step is not None:
+            self.record_step_timeout(step)
+        
+        kill_command = self.get_config_value('Timeouts', 'remote_kill', '').strip()
+        if not kill_command:
+            return
+        kill_command = kill_command.replace("{confpro_path}", self.get_config_value('Connection', 'confpro_path', ''))
+        try:
+            kill_timeout = float(self.get_config_value('Timeouts', 'remote_kill_timeout', '30'))
+        except ValueError:
+            kill_timeout = 30.0
+        try:
+            exit_status, output = self.capture_remote_command(kill_command, timeout=kill_timeout)
+        except ssh_errors() as e:
+            self.log(f"执行远程结束命令失败: {str(e)}")
+            return
+        self.log(f"已执行远程结束命令 {kill_command} (返回码: {exit_status})"
+                 + (f"\n{output}" if output.strip() else ""))
+    
+    def preload(self):
+        """在后台线程中提前导入paramiko，第一次操作不再等待导入"""
+        try:
+            load_paramiko()
+        except ImportError as e:
+            self.log(f"无法导入paramiko，请先安装: pip install paramiko ({str(e)})")
+    
+    def sweep_idle(self):
+        """关闭空闲超时的confpro会话和SSH连接"""
+        idle_timeout = self.get_int_config_value('Connection', 'pool_idle_timeout', 300)
+        now = time.monotonic()
+        with self.sessions_lock:
+            for key, session in list(self.confpro_sessions.items()):
+                if session.lock.locked():
+                    continue
+                if not session.is_alive() or now - session.last_used >= idle_timeout:
+                    del self.confpro_sessions[key]
+                    self.close_confpro_session(session)
+                    self.log(f"已关闭空闲的confpro会话 {key[0]}:{key[1]}")
+        
+        evicted = self.ssh_pool.evict_idle()
+        if evicted:
+            self.log(f"已关闭 {evicted} 个空闲SSH连接")
+    
+    def close(self):
+        """关闭所有confpro会话、SSH连接、传输方式和操作历史数据库"""
+        with self.sessions_lock:
+            for session in self.confpro_sessions.values():
+                self.close_confpro_session(session)
+            self.confpro_sessions.clear()
+        self.ssh_pool.close_all()
+        with self.transport_lock:
+            if self.command_transport is not None:
+                self.command_transport.close()
+                self.command_transport = None
+        with self.history_lock:
+            if self.history is not None:
+                self.history.close()
+                self.history = None
+        self.watchdog.close()
+    
+    def resolve_targets(self, names=None, all_hosts=False):
+        """按主机名从[Hosts]中选出目标主机，未指定时返回None表示使用Connection中的主机"""
+        if not names and not all_hosts:
+            return None
+        inventory = self.get_host_inventory()
+        if not inventory:
+            raise ValueError("[Hosts]中没有配置主机")
+        if all_hosts:
+            return inventory
+        by_name = {target.name: target for target in inventory}
+        unknown = [name for name in names if name not in by_name]
+        if unknown:
+            raise ValueError(f"[Hosts]中没有主机: {', '.join(unknown)}")
+        return [by_name[name] for name in dict.fromkeys(names)]
+    
+    def run_request(self, request, on_log=None, timings=None):
+        """执行命令行或常驻实例收到的请求，返回是否全部成功
+        
+        request为字典: command(reset/load), args(重置类型或BitFile路径), hosts(主机名列表),
+        all_hosts, mode, continue_on_error, force(加载时忽略板卡状态缓存),
+        request_id(可选，之后可通过cancel_operations(request_id=...)只取消该请求)。参数或配置错误时抛出ValueError。
+        timings为列表时追加该请求中各主机操作的耗时(OperationTiming.to_dict())。
+        """
+        command = request.get('command')
+        args = list(request.get('args') or [])
+        if command not in ('reset', 'load') or len(args) != 1:
+            raise ValueError(f"无效的请求: {command} {' '.join(map(str, args))}")
+        mode = request.get('mode')
+        if mode and mode not in ('per_command', 'batch', 'session'):
+            raise ValueError(f"无效的执行方式: {mode}")
+        targets = self.resolve_targets(request.get('hosts'), bool(request.get('all_hosts')))
+        
+        if command == 'reset':
+            if not self.get_config_value('ResetCommands', args[0]):
+                raise ValueError(f"未配置{args[0]}的重置命令")
+            name, operation = f"{args[0]}重置", self.perform_reset
+        else:
+            name, operation = "加载", functools.partial(self.perform_load, force=bool(request.get('force')))
+        
+        options = RequestOptions(mode, bool(request.get('continue_on_error')), on_log)
+        token = current_request.set(options)
+        try:
+            with self.cancellable(request.get('request_id')):
+                if targets is None:
+                    success = operation(*args)
+                else:
+                    success = self.perform_fanout(targets, name, operation, *args)
+        finally:
+            current_request.reset(token)
+            if timings is not None:
+                timings.extend(timing.to_dict() for timing in options.timings)
+        return success
+    
+    def perform_fanout(self, targets, operation_name, operation, *args):
+        """在多台主机上并行执行同一操作，结束后输出结果矩阵"""
+        max_concurrency = max(1, self.get_int_config_value('FanOut', 'max_concurrency', 32))
+        per_host_limit = max(1, self.get_int_config_value('FanOut', 'per_host_limit', 1))
+        self.log(f"===== 在 {len(targets)} 台主机上并行执行{operation_name} =====")
+        start = time.monotonic()
+        
+        def run_on_host(target):
+            context = OperationContext(target, log_prefix=f"[{target.name}] ", ask_on_error=False)
+            current_operation.set(context)
+            with self.get_host_semaphore(target, per_host_limit):
+                host_start = time.monotonic()
+                if self.is_cancelled():
+                    self.log("操作已取消，未在该主机上执行")
+                    return context, False, 0.0
+                try:
+                    success = bool(operation(*args))
+                except Exception as e:
+                    self.log(f"操作异常终止: {str(e)}")
+                    success = False
+            return context, success, time.monotonic() - host_start
+        
+        results = []
+        # 所有主机共用一个取消令牌，取消时各主机正在执行的命令同时中断
+        with self.cancellable(), ThreadPoolExecutor(max_workers=min(max_concurrency, len(targets)),
+                                                    thread_name_prefix="haps-host") as pool:
+            futures = [pool.submit(contextvars.copy_context().run, run_on_host, t) for t in targets]
+            for future in futures:
+                results.append(future.result())
+        
+        self.log_results_matrix(operation_name, results, time.monotonic() - start)
+        return all(success for _, success, _ in results)
+    
+    @contextlib.contextmanager
+    def cancellable(self, request_id=None):
+        """代码块中的操作可通过cancel_operations()取消，已在可取消的操作中时沿用外层的令牌"""
+        cancel = current_cancel.get()
+        if cancel is not None:
+            yield cancel
+            return
+        cancel = CancelToken(request_id)
+        token = current_cancel.set(cancel)
+        with self.cancel_tokens_lock:
+            self.cancel_tokens.add(cancel)
+        try:
+            yield cancel
+        finally:
+            with self.cancel_tokens_lock:
+                self.cancel_tokens.discard(cancel)
+            current_cancel.reset(token)
+    
+    def cancel_operations(self, reason="操作已取消", request_id=None):
+        """取消所有正在执行的操作，指定request_id时只取消该请求中的操作，返回被取消的操作数"""
+        with self.cancel_tokens_lock:
+            tokens = [cancel for cancel in self.cancel_tokens
+                      if request_id is None or cancel.request_id == request_id]
+        return sum(1 for cancel in tokens if cancel.cancel(reason))
+    
+    def is_cancelled(self):
+        cancel = current_cancel.get()
+        return cancel is not None and cancel.cancelled
+    
+    def sleep(self, seconds):
+        """等待seconds秒，当前操作被取消时立即返回True"""
+        cancel = current_cancel.get()
+        if cancel is None:
+            time.sleep(seconds)
+            return False
+        return cancel.wait(seconds)
+    
+    @contextlib.contextmanager
+    def timed_operation(self, operation, kind=None, subject=None):
+        """记录代码块中各阶段的耗时，结束后在日志中输出汇总并写入操作历史"""
+        timing = OperationTiming(operation, self.get_current_target().name, kind, subject,
+                                 self.get_execution_mode())
+        with self.cancellable() as cancel:
+            token = current_timing.set(timing)
+            with self.active_timings_lock:
+                self.active_timings.append(timing)
+            try:
+                yield timing
+            finally:
+                current_timing.reset(token)
+                with self.active_timings_lock:
+                    self.active_timings.remove(timing)
+                if timing.end is None:
+                    # 提前返回或出现异常时视为失败
+                    timing.finish(False)
+                if cancel.cancelled and not timing.success:
+                    # 记录从请求取消（或本操作开始，如果更晚）到操作停止的耗时
+                    timing.cancelled = True
+                    cancelled_at = max(cancel.cancelled_at, timing.start)
+                    timing.add('cancel', cancelled_at, timing.end)
+                    self.log(f"{timing.operation}已取消，从取消到停止用时 {(timing.end - cancelled_at) * 1000:.1f} 毫秒")
+                self.timing_history.append(timing)
+                request = current_request.get()
+                if request is not None:
+                    request.timings.append(timing)
+                if timing.spans:
+                    self.log(timing.format_summary())
+                # 取消的操作耗时不完整，不写入操作历史
+                if timing.kind is not None and not timing.cancelled:
+                    self.record_history(timing)
+    
+    def get_active_timings(self):
+        """正在执行的操作的计时对象"""
+        with self.active_timings_lock:
+            return list(self.active_timings)
+    
+    def get_history(self):
+        """返回操作历史数据库，未启用或打开失败时返回None"""
+        if self.get_config_value('History', 'enabled', '1').strip() != '1':
+            return None
+        with self.history_lock:
+            if self.history is None and not self.history_failed:
+                path = self.get_config_value('History', 'path', '').strip() or os.path.join(
+                    os.path.dirname(os.path.abspath(self.config_file)), 'haps_history.db')
+                try:
+                    # 只在使用时导入，不增加启动时间
+                    from haps_history import OperationHistory
+                    self.history = OperationHistory(
+                        path, self.get_int_config_value('History', 'retention_days', 180))
+                except Exception as e:
+                    self.history_failed = True
+                    self.log(f"无法打开操作历史数据库 {path}: {str(e)}")
+            return self.history
+    
+    def record_history(self, timing):
+        """把结束的操作写入操作历史，失败时只记录日志"""
+        history = self.get_history()
+        if history is None:
+            return
+        try:
+            history.record(timing.to_dict())
+        except Exception as e:
+            self.log(f"写入操作历史失败: {str(e)}")
+    
+    def estimate_duration(self, timing):
+        """根据操作历史预计当前操作的耗时并记入timing，有历史记录时在日志中输出"""
+        history = self.get_history()
+        if history is None:
+            return None
+        try:
+            timing.estimate = history.estimate(timing.kind, timing.subject, timing.host)
+        except Exception as e:
+            self.log(f"读取操作历史失败: {str(e)}")
+            return None
+        if timing.estimate is not None:
+            seconds, samples = timing.estimate
+            self.log(f"根据最近 {samples} 次记录，{timing.operation}预计耗时 {seconds:.1f} 秒")
+        return timing.estimate
+    
+    def export_timings(self, path, chrome_trace=False):
+        """把最近操作的分阶段耗时写入JSON文件，chrome_trace为True时写为Chrome Trace格式，返回导出的操作数"""
+        timings = [timing.to_dict() for timing in list(self.timing_history)]
+        if chrome_trace:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(timings_to_chrome_trace(timings), f, ensure_ascii=False)
+        else:
+            write_timings_json(path, timings)
+        return len(timings)
+    
+    def get_board_cache(self):
+        """返回板卡状态缓存，未启用时返回None"""
+        if self.get_config_value('BoardCache', 'enabled', '1').strip() != '1':
+            return None
+        path = self.get_config_value('BoardCache', 'path', '').strip() or os.path.join(
+            os.path.dirname(os.path.abspath(self.config_file)), 'haps_board_state.json')
+        if self.board_cache is None or self.board_cache.path != path:
+            from haps_board_state import BoardStateCache
+            self.board_cache = BoardStateCache(path)
+        return self.board_cache
+    
+    def get_hash_index(self):
+        """返回文件哈希索引，多个操作共用同一个对象"""
+        path = self.get_config_value('BoardCache', 'hash_index', '').strip() or os.path.join(
+            os.path.dirname(os.path.abspath(self.config_file)), 'haps_hash_index.json')
+        with self.hash_index_lock:
+            if self.hash_index is None or self.hash_index.path != path:
+                from haps_board_state import FileHashIndex
+                self.hash_index = FileHashIndex(
+                    path, self.get_int_config_value('BoardCache', 'hash_workers', 4))
+            return self.hash_index
+    
+    def warm_hash_index(self, bitfile_path):
+        """预先计算工程文件的哈希并写入索引，之后加载时检查是否改变只需要stat，返回耗时(秒)"""
+        if self.get_board_cache() is None or not os.path.isfile(bitfile_path):
+            return None
+        from haps_board_state import referenced_files
+        start = time.perf_counter()
+        try:
+            self.get_hash_index().hash_files([bitfile_path] + referenced_files(bitfile_path))
+        except OSError:
+            # 加载时会再次计算并记录原因
+            return None
+        return time.perf_counter() - start
+    
+    def get_board_key(self):
+        """当前目标主机在板卡状态缓存中的键"""
+        target = self.get_current_target()
+        return f"{target.host}:{target.port}"
+    
+    def invalidate_board_state(self):
+        """板卡状态即将改变（重置或加载），清除当前主机的缓存记录"""
+        cache = self.get_board_cache()
+        if cache is None:
+            return
+        try:
+            cache.invalidate(self.get_board_key())
+        except OSError as e:
+            self.log(f"更新板卡状态缓存失败: {str(e)}")
+    
+    def get_host_semaphore(self, target, limit):
+        """获取限制单台主机同时运行操作数的信号量"""
+        key = (target.host, target.port)
+        with self.host_semaphores_lock:
+            semaphore = self.host_semaphores.get(key)
+            if semaphore is None or semaphore[1] != limit:
+                semaphore = (threading.BoundedSemaphore(limit), limit)
+                self.host_semaphores[key] = semaphore
+            return semaphore[0]
+    
+    def log_results_matrix(self, operation_name, results, elapsed):
+        """以表格形式输出每台主机每一步的执行结果"""
+        step_count = max((context.step_count for context, _, _ in results), default=0)
+        name_width = max([len(context.target.name) for context, _, _ in results] + [4]) + 2
+        header = pad_display("主机", name_width) + "".join(pad_display(f"步骤{i}", 8) for i in range(1, step_count + 1))
+        lines = [f"\n===== {operation_name}多主机执行结果 (总耗时 {elapsed:.1f} 秒) =====", header + "结果  耗时"]
+        for context, success, duration in results:
+            cells = []
+            for step in range(1, step_count + 1):
+                result = context.step_results.get(step)
+                if step in context.timed_out_steps:
+                    cells.append(pad_display("超时", 8))
+                    continue
+                cells.append(pad_display("-" if result is None else "成功" if result else "失败", 8))
+            lines.append(pad_display(context.target.name, name_width) + "".join(cells)
+                         + pad_display("成功" if success else "失败", 6) + f"{duration:.1f}s")
+        succeeded = sum(1 for _, success, _ in results if success)
+        lines.append(f"成功 {succeeded}/{len(results)} 台主机")
+        self.log("\n".join(lines))
+    
+    def perform_reset(self, reset_type):
+        """执行重置操作，返回是否全部成功"""
+        self.log(f"===== 开始{reset_type}重置操作 =====")
+        
+        # 获取配置的命令和参数
+        reset_commands = self.get_config_value('ResetCommands', reset_type, "")
+        confpro_path = self.get_config_value('Connection', 'confpro_path')
+        command_delay = self.get_int_config_value('Timing', 'command_delay', 2)
+        
+        if not reset_commands:
+            self.set_status(f"错误: 未配置{reset_type}的重置命令")
+            self.log(f"===== {reset_type}重置操作失败 =====")
+            return False
+        
+        # 解析命令计划
+        try:
+            plan = parse_command_plan(
+                reset_commands, self.get_config_value('CommandOrder', f'reset.{reset_type}', '')
+            )
+        except ValueError as e:
+            self.set_status(f"错误: {reset_type}重置命令配置无效: {str(e)}")
+            self.log(f"===== {reset_type}重置操作失败 =====")
+            return False
+        
+        if not len(plan):
+            self.set_status(f"错误: 未找到有效的{reset_type}重置命令")
+            self.log(f"===== {reset_type}重置操作失败 =====")
+            return False
+        
+        # 执行命令计划
+        with self.timed_operation(f"{reset_type}重置", 'reset', reset_type) as timing:
+            self.estimate_duration(timing)
+            # 重置后板卡上的工程状态未知，之后的加载不能跳过
+            self.invalidate_board_state()
+            all_success = self.run_command_plan(plan, confpro_path, command_delay, "命令")
+            timing.finish(all_success)
+        
+        # 完成
+        if all_success:
+            self.set_status(f"===== {reset_type}重置操作全部成功完成 =====")
+        elif timing.cancelled:
+            self.set_status(f"===== {reset_type}重置操作已取消 =====")
+        else:
+            self.set_status(f"===== {reset_type}重置操作部分失败 =====")
+        
+        self.set_status("操作完成")
+        return all_success
+    
+    def perform_load(self, bitfile_path, on_bitfile_path=None, force=False):
+        """执行加载操作（支持多条命令），返回是否全部成功
+        
+        指定的文件不存在而改用默认路径时，通过on_bitfile_path(路径)通知调用方。
+        板卡上已是内容相同的工程且期间未重置时跳过加载，force为True时总是重新加载。
+        """
+        self.log("===== 开始加载BitFile操作 =====")
+        
+        bitfile_info_path = self.get_config_value('Connection', 'bitfile_info_path')
+        confpro_path = self.get_config_value('Connection', 'confpro_path')
+        load_commands = self.get_config_value('LoadCommands', 'default', '')
+        command_delay = self.get_int_config_value('Timing', 'command_delay', 2)
+        
+        with self.timed_operation("加载", 'load', bitfile_path) as timing:
+            # 检查文件是否存在
+            with timing_span('file.check', bitfile_path):
+                exists = os.path.exists(bitfile_path)
+            if not exists:
+                self.log(f"指定的文件不存在: {bitfile_path}")
+                self.log("尝试使用默认路径...")
+                default_path_index = self.get_int_config_value('BitFilePaths', 'default_index', 3)
+                bitfile_path = self.get_config_value('BitFilePaths', f'path{default_path_index}', '')
+                if on_bitfile_path is not None:
+                    on_bitfile_path(bitfile_path)
+                
+                with timing_span('file.check', bitfile_path):
+                    exists = os.path.exists(bitfile_path)
+                if not exists:
+                    self.log("默认路径文件也不存在")
+                    self.log("===== 加载操作失败 =====")
+                    return False
+            
+            # 保存路径到info文件
+            try:
+                with timing_span('file.write', bitfile_info_path):
+                    # 确保目录存在
+                    Path(bitfile_info_path).parent.mkdir(parents=True, exist_ok=True)
+                    
+                    with open(bitfile_info_path, "w") as f:
+                        f.write(bitfile_path)
+                self.log(f"BitFile路径已保存到 {bitfile_info_path}")
+            except Exception as e:
+                self.log(f"保存BitFile路径失败: {str(e)}")
+            
+            # 检查加载命令配置
+            if not load_commands:
+                self.log("错误: 未配置加载命令")
+                self.log("===== 加载操作失败 =====")
+                return False
+                
+            # 解析命令计划
+            try:
+                plan = parse_command_plan(
+                    load_commands, self.get_config_value('CommandOrder', 'load.default', '')
+                )
+            except ValueError as e:
+                self.log(f"错误: 加载命令配置无效: {str(e)}")
+                self.log("===== 加载操作失败 =====")
+                return False
+            
+            if not len(plan):
+                self.log("错误: 未找到有效的加载命令")
+                self.log("===== 加载操作失败 =====")
+                return False
+            
+            # 替换命令中的占位符为实际文件路径
+            plan = plan.map_commands(lambda cmd: cmd.replace("{bitfile_path}", bitfile_path))
+            
+            # 指定的文件不存在时实际加载的是默认路径
+            timing.subject = bitfile_path
+            
+            # 板卡上已是相同内容的工程时跳过加载
+            content_hash = self.get_project_hash(bitfile_path, plan)
+            board_cache = self.get_board_cache() if content_hash else None
+            if board_cache is not None and not force and board_cache.matches(self.get_board_key(), content_hash):
+                self.log(f"板卡上已加载内容相同的工程 {bitfile_path}，且之后未执行过重置，跳过加载"
+                         "（需要重新加载时勾选强制重新加载或使用 --force）")
+                # 单独记录，不计入加载耗时的统计和预计
+                timing.operation, timing.kind = "加载(内容未变，已跳过)", 'load_skipped'
+                timing.finish(True)
+                self.set_status("===== 工程内容未改变，已跳过加载 =====")
+                self.set_status("操作完成")
+                return True
+            self.invalidate_board_state()
+            self.estimate_duration(timing)
+            
+            # 执行命令计划
+            all_success = self.run_command_plan(plan, confpro_path, command_delay, "加载命令")
+            timing.finish(all_success)
+            if all_success and board_cache is not None:
+                try:
+                    board_cache.set(self.get_board_key(), content_hash, bitfile_path)
+                except OSError as e:
+                    self.log(f"更新板卡状态缓存失败: {str(e)}")
+        
+        # 完成
+        if all_success:
+            self.set_status("===== 加载操作全部成功完成 =====")
+        elif timing.cancelled:
+            self.set_status("===== 加载操作已取消 =====")
+        else:
+            self.set_status("===== 加载操作部分失败 =====")
+            
+        self.set_status("操作完成")
+        return all_success
+    
+    def get_project_hash(self, bitfile_path, plan):
+        """计算工程和加载命令的内容哈希，未启用板卡状态缓存或读取失败时返回None"""
+        if self.get_board_cache() is None:
+            return None
+        from haps_board_state import hash_project
+        try:
+            with timing_span('file.hash', bitfile_path):
+                return hash_project(bitfile_path, "\n".join(plan.ordered_commands()), self.get_hash_index())
+        except OSError as e:
+            self.log(f"计算工程内容哈希失败，不使用板卡状态缓存: {str(e)}")
+            return None
+    
+    def run_command_plan(self, plan, confpro_path, command_delay, step_label):
+        """执行命令计划，存在可同时执行的步骤时并行执行，返回是否全部成功"""
+        mode = self.get_execution_mode()
+        if plan.is_sequential():
+            return self.run_command_sequence(plan.commands, confpro_path, command_delay, step_label)
+        if mode != 'per_command':
+            self.log(f"执行方式{mode}不支持并行步骤，按依赖顺序串行执行")
+            return self.run_command_sequence(plan.ordered_commands(), confpro_path, command_delay, step_label)
+        return self.run_parallel_plan(plan, confpro_path, command_delay, step_label)
+    
+    def run_parallel_plan(self, plan, confpro_path, command_delay, step_label):
+        """按依赖关系调度步骤，互不依赖的步骤通过同一SSH连接上的多个通道同时执行
+        
+        某一步的全部前置步骤完成后，先等待设备就绪（未配置就绪检测时固定等待command_delay秒）
+        再开始执行该步。
+        """
+        total = len(plan)
+        self.begin_steps(total)
+        max_parallel = max(1, self.get_int_config_value('Execution', 'max_parallel_steps', 4))
+        pending = set(range(total))
+        finished_at = {}
+        running = {}
+        all_success = True
+        stop = False
+        
+        # 配置了就绪检测时，由各步骤在工作线程中自行轮询，调度时不再固定延迟
+        probe = self.create_readiness_probe(confpro_path)
+        if probe is not None:
+            command_delay = 0
+        
+        def run_step(index):
+            full_command = f'"{confpro_path}" {plan.commands[index]}'
+            if probe is not None and plan.deps[index]:
+                with timing_span('delay', "就绪检测"):
+                    self.wait_until_ready(probe, f"第 {index + 1} 条{step_label}")
+            return self.execute_step(
+                index + 1, plan.commands[index], full_command, f"第 {index + 1} 条{step_label}",
+                line_handler=lambda line: self.log(f"[第 {index + 1} 条] {line}")
+            )
+        
+        with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="haps-step") as pool:
+            while running or (pending and not stop):
+                if self.is_cancelled() and not stop:
+                    # 正在执行的步骤由取消令牌中断，不再开始新的步骤
+                    stop = True
+                    all_success = False
+                now = time.monotonic()
+                next_start = None
+                if not stop:
+                    for index in sorted(pending):
+                        if not plan.deps[index] <= finished_at.keys():
+                            continue
+                        start_at = max((finished_at[d] + command_delay for d in plan.deps[index]), default=now)
+                        if start_at > now:
+                            next_start = start_at if next_start is None else min(next_start, start_at)
+                            continue
+                        if len(running) >= max_parallel:
+                            break
+                        pending.discard(index)
+                        self.log(f"\n===== 开始执行第 {index + 1}/{total} 条{step_label} =====")
+                        # 复制上下文，使并行步骤的日志和结果归属当前操作
+                        running[pool.submit(contextvars.copy_context().run, run_step, index)] = index
+                
+                if not running:
+                    if next_start is not None:
+                        self.set_status(f"等待 {next_start - now:.1f} 秒后执行下一条命令...")
+                        with timing_span('delay', "等待下一步骤"):
+                            self.sleep(max(0.0, next_start - now))
+                    continue
+                
+                timeout = None if next_start is None else max(0.0, next_start - now)
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    finished_at[index] = time.monotonic()
+                    try:
+                        success = future.result()
+                    except Exception as e:
+                        self.log(f"第 {index + 1} 条{step_label}执行异常: {str(e)}")
+                        success = False
+                    self.record_step_result(index + 1, success)
+                    if not success:
+                        all_success = False
+                        # 询问是否继续执行后续命令，不继续时等待已开始的步骤结束
+                        if not stop and not self.ask_continue_on_error():
+                            stop = True
+        
+        if stop and pending:
+            self.log(f"已跳过 {len(pending)} 条未执行的{step_label}")
+        return all_success
+    
+    def run_command_sequence(self, commands, confpro_path, command_delay, step_label):
+        """按配置的执行方式运行confpro命令序列，返回是否全部成功"""
+        mode = self.get_execution_mode()
+        if mode == 'session':
+            transport = self.get_config_value('Connection', 'transport', 'paramiko').strip() or 'paramiko'
+            if transport == 'paramiko':
+                return self.run_session_sequence(commands, confpro_path, command_delay, step_label)
+            # 交互会话需要在SSH连接上保持通道，只有paramiko方式支持
+            self.log(f"传输方式 {transport} 不支持session执行方式，改为逐条执行")
+            mode = 'per_command'
+        
+        if mode == 'batch':
+            return self.run_batch_sequence(commands, confpro_path, command_delay, step_label)
+        
+        # 构建完整命令
+        full_commands = [f'"{confpro_path}" {cmd}' for cmd in commands]
+        
+        # 逐条执行命令
+        all_success = True
+        self.begin_steps(len(full_commands))
+        for i, full_command in enumerate(full_commands, 1):
+            if self.is_cancelled():
+                self.log(f"操作已取消，跳过剩余的 {len(full_commands) - i + 1} 条{step_label}")
+                all_success = False
+                break
+            self.log(f"\n===== 执行第 {i}/{len(full_commands)} 条{step_label} =====")
+            
+            # 执行命令，失败时按失败处理策略重试
+            success = self.execute_step(i, commands[i - 1], full_command, f"第 {i} 条{step_label}")
+            self.record_step_result(i, success)
+            if not success:
+                all_success = False
+                # 询问是否继续执行后续命令
+                if not self.ask_continue_on_error():
+                    break
+            
+            # 如果不是最后一条命令，等待设备就绪
+            if i < len(full_commands):
+                self.wait_between_steps(confpro_path, command_delay)
+        
+        return all_success
+    
+    def wait_between_steps(self, confpro_path, command_delay):
+        """两条命令之间等待：配置了就绪检测时轮询，否则固定等待command_delay秒"""
+        probe = self.create_readiness_probe(confpro_path)
+        if probe is not None:
+            with timing_span('delay', "就绪检测"):
+                self.wait_until_ready(probe, "下一条命令")
+        elif command_delay > 0:
+            self.set_status(f"等待 {command_delay} 秒后执行下一条命令...")
+            with timing_span('delay', f"固定等待{command_delay}秒"):
+                self.sleep(command_delay)
+    
+    def create_readiness_probe(self, confpro_path):
+        """根据[Readiness]配置创建就绪检测，未配置检测命令时返回None"""
+        command = self.get_config_value('Readiness', 'command', '').strip()
+        if not command:
+            return None
+        
+        try:
+            return ReadinessProbe(
+                self.capture_remote_command,
+                command.replace("{confpro_path}", confpro_path),
+                pattern=self.get_config_value('Readiness', 'pattern', ''),
+                timeout=self.get_float_config_value('Readiness', 'timeout', 60),
+                initial_interval=self.get_float_config_value('Readiness', 'initial_interval', 0.5),
+                max_interval=self.get_float_config_value('Readiness', 'max_interval', 5),
+                backoff=self.get_float_config_value('Readiness', 'backoff', 2)
+            )
+        except re.error as e:
+            self.log(f"就绪检测配置错误: 正则表达式无效 ({str(e)})，改用固定等待时间")
+            return None
+    
+    def wait_until_ready(self, probe, target):
+        """轮询直到设备就绪或超时，并记录实际等待时间"""
+        self.set_status(f"等待设备就绪后执行{target}...")
+        ready, elapsed, attempts = probe.wait(current_cancel.get())
+        if self.is_cancelled():
+            return False
+        if ready:
+            self.log(f"设备已就绪，等待 {elapsed:.1f} 秒（检测 {attempts} 次）")
+        else:
+            self.log(f"警告：等待设备就绪超时，已等待 {elapsed:.1f} 秒（检测 {attempts} 次），继续执行{target}")
+        return ready
+    
+    def capture_remote_command(self, command, timeout=0):
+        """静默执行远程命令，返回 (返回码, 标准输出和错误输出)，timeout大于0时超时后中断"""
+        try:
+            transport = self.get_command_transport()
+        except ValueError as e:
+            raise TransportError(str(e))
+        lines = []
+        interrupt = CommandInterrupt()
+        cancel = current_cancel.get()
+        with cancel.guard(interrupt) if cancel is not None else contextlib.nullcontext(), \
+                self.watchdog.watching(interrupt, timeout, f"命令超过 {timeout:g} 秒未完成"):
+            exit_status = transport.run(
+                self.get_current_target(), command, lines.append, lines.append, quiet=True, interrupt=interrupt
+            )
+        return exit_status, "\n".join(lines)
+    
+    def run_batch_sequence(self, commands, confpro_path, command_delay, step_label):
+        """把命令序列编译为一次远程执行，根据输出标记还原每条命令的结果"""
+        shell = self.get_config_value('Execution', 'remote_shell', 'cmd')
+        full_commands = [f'"{confpro_path}" {cmd}' for cmd in commands]
+        all_success = True
+        self.begin_steps(len(full_commands))
+        # 已完成的步骤数，失败后选择继续时从下一步重新编译剩余命令
+        offset = 0
+        # 根据输出标记记录每一步的开始时间，结束时记为step阶段
+        step_started = {}
+        timing = current_timing.get()
+        # 每一步的超时，收到该步的开始标记时开始监视，结束标记时取消
+        timeouts = [self.get_command_timeout(command) for command in full_commands]
+        watched = {}
+        # 步骤序号 -> 已重试次数
+        attempts = {}
+        reconnects = 0
+        
+        while offset < len(full_commands):
+            remaining = full_commands[offset:]
+            parser = BatchOutputParser(len(remaining))
+            interrupt = CommandInterrupt()
+            outcome = {}
+            script = compile_batch_script(remaining, command_delay, shell)
+            self.log(f"\n===== 批处理执行第 {offset + 1}-{len(full_commands)} 条{step_label} =====")
+            
+            def handle_line(line, parser=parser, offset=offset, interrupt=interrupt):
+                marker = parser.feed(line)
+                if marker is None:
+                    self.log(line)
+                    return
+                kind, step, exit_code = marker
+                index = offset + step
+                if kind == 'BEGIN':
+                    step_started[index] = time.perf_counter()
+                    seconds = timeouts[index - 1]
+                    if seconds > 0:
+                        watched[index] = self.watchdog.watch(
+                            interrupt, seconds, f"第 {index} 条{step_label}超过 {seconds:g} 秒未完成")
+                    self.set_status(f"正在执行第 {index}/{len(full_commands)} 条{step_label}: {full_commands[index - 1]}")
+                    return
+                if index in watched:
+                    self.watchdog.unwatch(watched.pop(index))
+                if timing is not None and index in step_started:
+                    start, end = step_started.pop(index), time.perf_counter()
+                    timing.add('step', start, end, f"第{index}步 {commands[index - 1]}")
+                    timing.record_step(index, command=commands[index - 1], duration=round(end - start, 6))
+                if exit_code == 0:
+                    self.record_step_result(index, True, exit_code)
+                    self.log(f"第 {index} 条{step_label}执行成功")
+                else:
+                    self.record_step_result(index, False, exit_code)
+                    self.log(f"第 {index} 条{step_label}执行失败 (返回码: {exit_code})")
+            
+            # 整个批处理不设超时，由各步骤的开始/结束标记分别监视
+            self.execute_remote_command(
+                script, line_handler=handle_line, timeout=0, interrupt=interrupt, outcome=outcome)
+            for entry in watched.values():
+                self.watchdog.unwatch(entry)
+            watched.clear()
+            
+            failed_step = parser.first_failure()
+            if failed_step is None:
+                break
+            
+            failed_index = offset + failed_step
+            if failed_step not in parser.results:
+                self.record_step_result(failed_index, False)
+                if interrupt.timed_out:
+                    self.record_step_timeout(failed_index)
+                self.log(f"第 {failed_index} 条{step_label}未返回结果，批处理执行中断")
+            # 连接中断或重试时从失败的步骤重新编译剩余命令
+            if outcome.get('disconnected'):
+                reconnects += 1
+                if self.should_reconnect(failed_index, reconnects, outcome, f"第 {failed_index} 条{step_label}"):
+                    offset = failed_index - 1
+                    continue
+            attempts[failed_index] = attempts.get(failed_index, 0) + 1
+            if self.should_retry(failed_index, attempts[failed_index], outcome.get('transient', False),
+                                 f"第 {failed_index} 条{step_label}"):
+                offset = failed_index - 1
+                continue
+            
+            all_success = False
+            offset = failed_index
+            if offset >= len(full_commands) or not self.ask_continue_on_error():
+                break
+        
+        return all_success
+    
+    def run_session_sequence(self, commands, confpro_path, command_delay, step_label):
+        """通过常驻的confpro会话逐条执行命令"""
+        session = self.get_confpro_session(confpro_path)
+        if session is None:
+            return False
+        
+        command_timeout = self.get_int_config_value('Session', 'command_timeout', 3600)
+        all_success = True
+        self.begin_steps(len(commands))
+        for i, cmd in enumerate(commands, 1):
+            if self.is_cancelled():
+                self.log(f"操作已取消，跳过剩余的 {len(commands) - i + 1} 条{step_label}")
+                all_success = False
+                break
+            self.log(f"\n===== 执行第 {i}/{len(commands)} 条{step_label} (会话) =====")
+            
+            attempt = 0
+            reconnects = 0
+            while True:
+                outcome = {}
+                success = self.run_session_step(session, i, cmd, command_timeout, outcome)
+                if success:
+                    break
+                # 会话已退出或命令超时时丢弃会话，后续命令使用新会话
+                if not session.is_alive():
+                    self.drop_confpro_session(session)
+                if outcome.get('disconnected'):
+                    reconnects += 1
+                    resume = self.should_reconnect(i, reconnects, outcome, f"第 {i} 条{step_label}")
+                else:
+                    resume = False
+                if not resume:
+                    attempt += 1
+                    if not self.should_retry(i, attempt, outcome.get('transient', False), f"第 {i} 条{step_label}"):
+                        break
+                if not session.is_alive():
+                    session = self.get_confpro_session(confpro_path)
+                    if session is None:
+                        self.record_step_result(i, False)
+                        return False
+            
+            self.record_step_result(i, success)
+            if success:
+                self.set_status(f"命令执行成功: {cmd}")
+            else:
+                self.set_status(f"命令执行失败: {cmd}")
+                all_success = False
+                if not self.ask_continue_on_error():
+                    break
+                if i < len(commands) and not session.is_alive():
+                    session = self.get_confpro_session(confpro_path)
+                    if session is None:
+                        all_success = False
+                        break
+            
+            # 如果不是最后一条命令，等待设备就绪
+            if i < len(commands):
+                self.wait_between_steps(confpro_path, command_delay)
+        
+        return all_success
+    
+    def run_session_step(self, session, step, cmd, command_timeout, outcome):
+        """在会话中执行一步，连接错误或输出匹配暂时性失败时写入 outcome['transient']"""
+        self.set_status(f"正在执行命令: {cmd}")
+        transient_re = self.get_transient_pattern()
+        
+        def on_line(line):
+            self.log(line)
+            if transient_re is not None and transient_re.search(line):
+                outcome['transient'] = True
+        
+        cancel = current_cancel.get()
+        interrupt = CommandInterrupt()
+        # 与逐条执行和batch方式一样按完整命令匹配[Timeouts]规则
+        timeout = self.get_command_timeout(f'"{session.confpro_path}" {cmd}')
+        with session.lock, step_span(step, cmd), \
+                cancel.guard(interrupt) if cancel is not None else contextlib.nullcontext(), \
+                self.watchdog.watching(interrupt, timeout, f"命令超过 {timeout:g} 秒未完成"):
+            # 取消或超时时关闭会话的通道，会话随后被丢弃
+            interrupt.attach(session.channel.close)
+            try:
+                with timing_span('runtime', cmd):
+                    success = session.run(cmd, on_line, command_timeout)
+            except ssh_errors() as e:
+                self.log(f"confpro会话错误: {str(e)}")
+                session.close()
+                outcome['transient'] = True
+                success = False
+        if interrupt.timed_out:
+            self.handle_command_timeout(cmd, interrupt.reason, step)
+        elif not success and not interrupt.interrupted and not session.transport.is_active():
+            # 会话所在的SSH连接已中断，在新连接上启动会话后重新执行该步骤
+            self.log("confpro会话的SSH连接已中断")
+            outcome['transient'] = outcome['disconnected'] = True
+        return success
+    
+    def get_confpro_session(self, confpro_path):
+        """获取已启动的confpro会话，不存在或已退出时启动新会话"""
+        host, port, user = self.get_current_target()[1:4]
+        key = (host, port, user, confpro_path)
+        
+        with self.sessions_lock:
+            session = self.confpro_sessions.get(key)
+            if session is not None and session.is_alive():
+                self.log(f"复用已启动的confpro会话 {host}:{port}")
+                return session
+            if session is not None:
+                del self.confpro_sessions[key]
+                self.close_confpro_session(session)
+        
+        transport = self.create_ssh_client()
+        if not transport:
+            return None
+        
+        try:
+            session = ConfproSession(
+                transport,
+                confpro_path,
+                start_args=self.get_config_value('Session', 'start_args', ''),
+                prompt_pattern=self.get_config_value('Session', 'prompt_pattern', r'confpro>\s*$'),
+                done_command=self.get_config_value('Session', 'done_command', ''),
+                error_pattern=self.get_config_value('Session', 'error_pattern', r'(?i)\berror\b'),
+                use_pty=self.get_config_value('Session', 'use_pty', '0').strip() == '1'
+            )
+        except re.error as e:
+            self.log(f"confpro会话配置错误: 正则表达式无效 ({str(e)})")
+            self.ssh_pool.release(transport)
+            return None
+        
+        self.log("正在启动confpro会话...")
+        try:
+            with timing_span('session.start', confpro_path):
+                session.start(self.log, self.get_int_config_value('Session', 'startup_timeout', 120))
+        except ssh_errors() as e:
+            self.log(f"启动confpro会话失败: {str(e)}")
+            self.close_confpro_session(session)
+            return None
+        self.log("confpro会话已就绪")
+        
+        with self.sessions_lock:
+            self.confpro_sessions[key] = session
+        return session
+    
+    def drop_confpro_session(self, session):
+        """从会话缓存中移除并关闭会话"""
+        with self.sessions_lock:
+            for key, cached in list(self.confpro_sessions.items()):
+                if cached is session:
+                    del self.confpro_sessions[key]
+        self.close_confpro_session(session)
+    
+    def close_confpro_session(self, session):
+        """关闭会话并把其占用的SSH连接归还连接池，通道已被关闭（超时、取消等）时同样归还"""
+        session.close()
+        transport = session.detach_transport()
+        if transport is not None:
+            self.ssh_pool.release(transport)
+    
+    def begin_steps(self, count):
+        """记录当前操作的步骤总数，用于多主机结果汇总"""
+        context = current_operation.get()
+        if context is not None:
+            context.step_count = count
+    
+    def record_step_result(self, step, success, exit_code=None):
+        """记录当前操作中某一步的执行结果"""
+        context = current_operation.get()
+        if context is not None:
+            context.step_results[step] = success
+        timing = current_timing.get()
+        if timing is not None:
+            timing.record_step(step, success=success, exit_code=exit_code)
+    
+    def record_step_timeout(self, step):
+        """记录当前操作中某一步因超时被中断"""
+        context = current_operation.get()
+        if context is not None:
+            context.timed_out_steps.add(step)
+        timing = current_timing.get()
+        if timing is not None:
+            timing.record_step(step, timed_out=True)
+    
+    def ask_continue_on_error(self):
+        """命令执行失败（重试后仍失败）时按[FailurePolicy]决定是否继续执行后续命令，策略为ask时才询问"""
+        if self.is_cancelled():
+            return False
+        timing = current_timing.get()
+        if timing is not None and timing.fatal_error:
+            self.log(f"{timing.fatal_error}，停止后续命令")
+            return False
+        context = current_operation.get()
+        request = current_request.get()
+        if request is not None and request.continue_on_error:
+            return True
+        policy = self.get_failure_policy()
+        if policy == 'continue':
+            self.log("命令执行失败，按失败处理策略继续执行后续命令")
+            return True
+        if policy != 'ask':
+            self.log("命令执行失败，按失败处理策略停止后续命令")
+            return False
+        if context is not None and not context.ask_on_error:
+            self.log("多主机并行执行中命令失败，停止该主机的后续命令")
+            return False
+        if request is not None:
+            # 命令行和转发的请求不弹出询问，未指定继续时停止
+            return False
+        if self.on_ask_continue is None:
+            return False
+        return bool(self.on_ask_continue())
@@ -0,0 +1,147 @@
+"""操作历史：每次重置/加载及其每条命令的耗时和结果保存在本地SQLite数据库中
+
+由执行引擎在操作结束后写入，用于预计下一次操作的耗时，以及按命令和主机统计耗时分布。
+只依赖标准库，连接在多个线程间共用，所有访问加锁。
+"""
+import json
+import math
+import time
+import sqlite3
+import statistics
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    operation TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    subject TEXT,
+    host TEXT,
+    mode TEXT,
+    duration REAL NOT NULL,
+    success INTEGER,
+    phases TEXT
+);
+CREATE INDEX IF NOT EXISTS operations_lookup ON operations (kind, host, subject, started_at);
+CREATE TABLE IF NOT EXISTS steps (
+    operation_id INTEGER NOT NULL REFERENCES operations (id) ON DELETE CASCADE,
+    step INTEGER NOT NULL,
+    command TEXT,
+    success INTEGER,
+    exit_code INTEGER,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS steps_operation ON steps (operation_id);
+"""
+
+
+def percentile(values, percent):
+    """最近秩法百分位数"""
+    ordered = sorted(values)
+    # 先乘后除，避免 90 / 100 * 10 这类浮点误差使ceil多进一位
+    index = max(0, min(len(ordered) - 1, math.ceil(percent * len(ordered) / 100) - 1))
+    return ordered[index]
+
+
+class OperationHistory:
+    """操作历史数据库，打开失败时抛出sqlite3.Error"""
+
+    def __init__(self, path, retention_days=180):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            # 每次操作结束都要写入，WAL模式下提交不需要等待整个数据库文件同步到磁盘
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.executescript(SCHEMA)
+            if retention_days > 0:
+                # 打开时清理过期记录，数据库不会无限增长
+                self._conn.execute("DELETE FROM operations WHERE started_at < ?",
+                                   (time.time() - retention_days * 86400,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(self, operation):
+        """写入一次操作，operation为OperationTiming.to_dict()的结果，返回记录的id"""
+        phases = {phase: item['total'] for phase, item in operation.get('summary', {}).items()}
+        success = operation.get('success')
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO operations (started_at, operation, kind, subject, host, mode, duration, success, phases)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (operation['start_time'], operation['operation'], operation.get('kind') or '',
+                 operation.get('subject'), operation.get('host'), operation.get('mode'),
+                 operation['duration'], None if success is None else int(success),
+                 json.dumps(phases, ensure_ascii=False))
+            )
+            operation_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO steps (operation_id, step, command, success, exit_code, duration) VALUES (?, ?, ?, ?, ?, ?)",
+                [(operation_id, step['step'], step.get('command'),
+                  None if step.get('success') is None else int(step['success']),
+                  step.get('exit_code'), step.get('duration'))
+                 for step in operation.get('steps', [])]
+            )
+        return operation_id
+
+    def estimate(self, kind, subject, host, window=20):
+        """根据最近window次成功的同类操作预计耗时，返回 (耗时中位数, 样本数)，没有记录时返回None
+
+        依次使用同一主机上相同对象(重置类型或BitFile)、同一主机上同类操作、其他主机上相同对象的记录。
+        """
+        candidates = (
+            ("kind = ? AND host = ? AND subject = ?", (kind, host, subject)),
+            ("kind = ? AND host = ?", (kind, host)),
+            ("kind = ? AND subject = ?", (kind, subject)),
+        )
+        with self._lock:
+            for condition, params in candidates:
+                rows = self._conn.execute(
+                    f"SELECT duration FROM operations WHERE success = 1 AND {condition}"
+                    " ORDER BY started_at DESC LIMIT ?", params + (window,)
+                ).fetchall()
+                if rows:
+                    return statistics.median(row[0] for row in rows), len(rows)
+        return None
+
+    def operation_stats(self, days=30):
+        """按 (操作, 主机) 统计最近days天的耗时"""
+        return self._stats(
+            "SELECT operation, host, duration, success FROM operations WHERE started_at >= ?",
+            (time.time() - days * 86400,)
+        )
+
+    def command_stats(self, days=30):
+        """按 (命令, 主机) 统计最近days天每条命令的耗时"""
+        return self._stats(
+            "SELECT s.command, o.host, s.duration, s.success FROM steps s"
+            " JOIN operations o ON o.id = s.operation_id"
+            " WHERE o.started_at >= ? AND s.duration IS NOT NULL",
+            (time.time() - days * 86400,)
+        )
+
+    def _stats(self, query, params):
+        """按查询结果的前两列分组，返回 [{'name', 'host', 'count', 'failures', 'p50', 'p90', 'max'}]"""
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        groups = {}
+        for name, host, duration, success in rows:
+            groups.setdefault((name or '', host or ''), []).append((duration, success))
+        result = []
+        for (name, host), items in sorted(groups.items()):
+            durations = [duration for duration, _ in items]
+            result.append({
+                'name': name,
+                'host': host,
+                'count': len(items),
+                'failures': sum(1 for _, success in items if success == 0),
+                'p50': percentile(durations, 50),
+                'p90': percentile(durations, 90),
+                'max': max(durations),
+            })
+        return result
@@ -0,0 +1,172 @@
+"""常驻实例：已运行的HAPS控制工具监听本机端口，后续启动的程序把请求转发给它
+
+转发方只依赖标准库，不导入paramiko和图形界面，发送请求后即可退出；
+常驻实例复用已加载的解释器和连接池中的SSH连接执行请求。
+
+监听地址和访问令牌写入临时目录下的端点文件，按配置文件路径区分，
+使用不同配置文件的实例互不转发。协议为每行一个JSON对象：
+请求 {"token", "command", ...}，常驻实例可先回传若干 {"log": 日志}，
+最后回传 {"success": 是否成功} 或 {"error": 原因}。
+"""
+import os
+import json
+import hmac
+import itertools
+import socket
+import hashlib
+import secrets
+import tempfile
+import threading
+import getpass
+
+
+def endpoint_file_for(config_file):
+    """配置文件对应的端点文件路径"""
+    config_path = os.path.normcase(os.path.abspath(config_file))
+    digest = hashlib.sha1(config_path.encode('utf-8')).hexdigest()[:12]
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = 'user'
+    return os.path.join(tempfile.gettempdir(), f"haps_control_{user}_{digest}.json")
+
+
+def read_endpoint(endpoint_file):
+    """读取端点文件，返回 (port, token)，不存在或内容无效时返回None"""
+    try:
+        with open(endpoint_file, encoding='utf-8') as f:
+            endpoint = json.load(f)
+        return int(endpoint['port']), str(endpoint['token'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+class ResidentServer:
+    """常驻实例的请求监听端，每个连接在单独的线程中交给handler处理
+
+    handler(request, send) 在连接线程中执行，send(message) 向请求方回传一条消息，
+    handler返回的字典作为最后一条消息回传。
+    """
+
+    def __init__(self, config_file, handler):
+        self.endpoint_file = endpoint_file_for(config_file)
+        self.handler = handler
+        self.token = secrets.token_hex(16)
+        self._socket = None
+        self._closed = False
+
+    def start(self):
+        """开始监听并写入端点文件，失败时抛出OSError"""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen(8)
+        port = self._socket.getsockname()[1]
+
+        # 先写临时文件再替换，转发方不会读到不完整的内容
+        temp_file = f"{self.endpoint_file}.{os.getpid()}.tmp"
+        fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'port': port, 'token': self.token, 'pid': os.getpid()}, f)
+        os.replace(temp_file, self.endpoint_file)
+
+        threading.Thread(target=self._accept_loop, name="haps-resident", daemon=True).start()
+        return port
+
+    def close(self):
+        """停止监听，端点文件仍属于本实例时删除"""
+        self._closed = True
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        endpoint = read_endpoint(self.endpoint_file)
+        if endpoint is not None and hmac.compare_digest(endpoint[1], self.token):
+            try:
+                os.remove(self.endpoint_file)
+            except OSError:
+                pass
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), name="haps-resident-conn", daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            reader = conn.makefile('r', encoding='utf-8')
+            send_lock = threading.Lock()
+
+            def send(message):
+                data = (json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8')
+                with send_lock:
+                    try:
+                        conn.sendall(data)
+                    except OSError:
+                        # 请求方已断开，继续执行但不再回传
+                        pass
+
+            try:
+                conn.settimeout(10)
+                request = json.loads(reader.readline())
+                conn.settimeout(None)
+            except (OSError, ValueError):
+                return
+            if not isinstance(request, dict) or not hmac.compare_digest(str(request.get('token', '')), self.token):
+                send({'error': "令牌无效"})
+                return
+            # 立即确认，请求方据此判断端口确实属于常驻实例
+            send({'ack': True})
+
+            try:
+                result = self.handler(request, send)
+            except Exception as e:
+                result = {'error': str(e)}
+            send(result)
+
+
+def forward_request(config_file, request, on_log=None, connect_timeout=2.0, ack_timeout=5.0):
+    """把请求转发给使用同一配置文件的常驻实例
+
+    没有常驻实例时返回None，否则返回常驻实例的最后一条消息；
+    on_log(message) 接收常驻实例回传的日志。
+    端口被其他程序占用（端点文件残留）时，ack_timeout秒内收不到确认也返回None。
+    """
+    endpoint = read_endpoint(endpoint_file_for(config_file))
+    if endpoint is None:
+        return None
+    port, token = endpoint
+    try:
+        conn = socket.create_connection(('127.0.0.1', port), timeout=connect_timeout)
+    except OSError:
+        # 端点文件残留，常驻实例已退出
+        return None
+
+    with conn:
+        reader = conn.makefile('r', encoding='utf-8')
+        try:
+            conn.sendall((json.dumps(dict(request, token=token), ensure_ascii=False) + "\n").encode('utf-8'))
+            # 收到第一条消息前保持超时，之后操作可能长时间没有输出
+            conn.settimeout(ack_timeout)
+            first = reader.readline()
+        except OSError:
+            return None
+        if not first:
+            return None
+        conn.settimeout(None)
+        for line in itertools.chain([first], reader):
+            try:
+                message = json.loads(line)
+            except (ValueError, TypeError):
+                continue
+            if not isinstance(message, dict) or message.get('ack'):
+                continue
+            if 'log' in message:
+                if on_log is not None:
+                    on_log(message['log'])
+                continue
+            return message
+    return {'error': "常驻实例在返回结果前断开了连接"}
@@ -0,0 +1,134 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from haps_engine import HapsEngine, compile_batch_script  # noqa: E402
+
+
+class CompileBatchScriptTest(unittest.TestCase):
+    def test_cmd_script(self):
+        script = compile_batch_script(['"confpro" a', '"confpro" b'], 2, 'cmd')
+        self.assertEqual(
+            script,
+            'cmd /s /v:on /c "'
+            'echo @@HAPS_STEP BEGIN 1& "confpro" a& set HAPS_RC=!errorlevel!& '
+            'echo @@HAPS_STEP END 1 !HAPS_RC!& (if !HAPS_RC! neq 0 exit /b !HAPS_RC!)& '
+            'ping -n 3 127.0.0.1 >nul& '
+            'echo @@HAPS_STEP BEGIN 2& "confpro" b& set HAPS_RC=!errorlevel!& '
+            'echo @@HAPS_STEP END 2 !HAPS_RC!& (if !HAPS_RC! neq 0 exit /b !HAPS_RC!)"'
+        )
+
+    def test_sh_script(self):
+        script = compile_batch_script(['confpro a', 'confpro b'], 0, 'sh')
+        self.assertEqual(
+            script,
+            'echo "@@HAPS_STEP BEGIN 1"; confpro a; rc=$?; echo "@@HAPS_STEP END 1 $rc"; [ $rc -eq 0 ] || exit $rc; '
+            'echo "@@HAPS_STEP BEGIN 2"; confpro b; rc=$?; echo "@@HAPS_STEP END 2 $rc"; [ $rc -eq 0 ] || exit $rc'
+        )
+
+
+
+class ConfigValueTest(unittest.TestCase):
+    def setUp(self):
+        from bench_engine import write_config
+        self.workdir = tempfile.TemporaryDirectory(prefix='haps_test_')
+        config_file = os.path.join(self.workdir.name, 'haps_config.ini')
+        write_config(config_file, 22, 1, 'per_command', os.path.join(self.workdir.name, 'project.conf'))
+        self.logs = []
+        self.engine = HapsEngine(config_file, on_log=self.logs.append)
+        self.engine.config['FailurePolicy'] = {'retry_interval': '0.5', 'backoff': '0.1', 'max_retry_interval': 'x'}
+
+    def tearDown(self):
+        self.engine.close()
+        self.workdir.cleanup()
+
+    def test_float_config_value(self):
+        self.assertEqual(self.engine.get_float_config_value('FailurePolicy', 'retry_interval', 2), 0.5)
+        self.assertEqual(self.engine.get_float_config_value('FailurePolicy', 'backoff', 2, minimum=1.0), 1.0)
+        self.assertEqual(self.engine.get_float_config_value('FailurePolicy', 'missing', 3), 3)
+        self.assertEqual(self.engine.get_float_config_value('FailurePolicy', 'max_retry_interval', 30), 30)
+        self.assertTrue(any('FailurePolicy.max_retry_interval' in message for message in self.logs))
+
+    def test_retry_settings(self):
+        self.assertEqual(self.engine.get_retry_settings(), (2, 0.5, 1.0, 30))
+
+
+class SessionReleaseTest(unittest.TestCase):
+    """会话的通道被超时或取消关闭后，丢弃会话时仍要把SSH连接归还连接池"""
+
+    def setUp(self):
+        from bench_engine import write_config
+        from mock_confpro_server import MockConfpro, MockConfproServer
+        self.server = MockConfproServer(MockConfpro(latency=1.0, lines=1))
+        port = self.server.start()
+        self.workdir = tempfile.TemporaryDirectory(prefix='haps_test_')
+        config_file = os.path.join(self.workdir.name, 'haps_config.ini')
+        write_config(config_file, port, 2, 'session', os.path.join(self.workdir.name, 'project.conf'))
+        self.engine = HapsEngine(config_file, on_log=lambda message: None)
+        self.engine.config['History'] = {'enabled': '0'}
+        self.engine.config['Session'] = {'done_command': 'puts "{marker}"'}
+        self.engine.config['Connection']['pool_idle_timeout'] = '0'
+
+    def tearDown(self):
+        self.engine.close()
+        self.server.close()
+        self.workdir.cleanup()
+
+    def assert_released(self):
+        entries = list(self.engine.ssh_pool._entries.values())
+        self.assertEqual([entry['in_use'] for entry in entries], [0] * len(entries))
+
+    def test_timeout(self):
+        self.engine.config['Timeouts'] = {'default': '0.2'}
+        for _ in range(2):
+            self.assertFalse(self.engine.perform_reset('bench'))
+        self.assert_released()
+
+    def test_timeout_rule_matches_full_command(self):
+        # 规则与其他执行方式一样按 "confpro路径" 命令 匹配
+        self.engine.config['Timeouts'] = {'default': '0', 'confpro': '0.2 /synopsys/bin/confpro" emu'}
+        self.assertFalse(self.engine.perform_reset('bench'))
+        self.assert_released()
+
+    def test_cancel(self):
+        threading.Timer(0.5, self.engine.cancel_operations).start()
+        self.assertFalse(self.engine.perform_reset('bench'))
+        self.assert_released()
+
+
+class ChannelLimitTest(unittest.TestCase):
+    """服务端限制通道数时，被拒绝的步骤重试即可，不应断开其他步骤正在共用的连接"""
+
+    def setUp(self):
+        from bench_engine import write_config
+        from mock_confpro_server import MockConfpro, MockConfproServer
+        self.confpro = MockConfpro(latency=0.5, lines=1)
+        self.server = MockConfproServer(self.confpro, max_sessions=2)
+        port = self.server.start()
+        self.workdir = tempfile.TemporaryDirectory(prefix='haps_test_')
+        config_file = os.path.join(self.workdir.name, 'haps_config.ini')
+        write_config(config_file, port, 3, 'per_command', os.path.join(self.workdir.name, 'project.conf'))
+        self.engine = HapsEngine(config_file, on_log=lambda message: None)
+        self.engine.config['History'] = {'enabled': '0'}
+        self.engine.config['ResetCommands']['bench'] = 'emu:8 a|emu:8 b|emu:8 c'
+        self.engine.config['Execution']['max_parallel_steps'] = '3'
+        self.engine.config['FailurePolicy'] = {'retry_interval': '0.5'}
+
+    def tearDown(self):
+        self.engine.close()
+        self.server.close()
+        self.workdir.cleanup()
+
+    def test_parallel_steps(self):
+        self.assertTrue(self.engine.perform_reset('bench'))
+        self.assertEqual(self.confpro.snapshot()[0], 3)
+        self.assertEqual(self.server.connections, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from haps_history import percentile  # noqa: E402
+
+
+class PercentileTest(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = list(range(1, 11))
+        self.assertEqual(percentile(values, 90), 9)
+        self.assertEqual(percentile(values, 50), 5)
+        self.assertEqual(percentile(values, 100), 10)
+        self.assertEqual(percentile(values, 0), 1)
+
+    def test_two_samples(self):
+        self.assertEqual(percentile([3.0, 1.0], 50), 1.0)
+        self.assertEqual(percentile([3.0, 1.0], 90), 3.0)
+
+    def test_single_sample(self):
+        self.assertEqual(percentile([7], 99), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()